@@ -0,0 +1,228 @@
+# Opt-in response cache for call_ai. Prompts that don't depend on the player (such as the
+# greeting) are byte-identical across sessions, so their responses can be reused. Entries are
+# keyed on the generation settings and a prompt hash and held in an in-memory LRU backed by an
+# on-disk store with a TTL and a size cap.
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def _env_int(name, default):
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _env_float(name, default):
+    try:
+        return float(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def cache_enabled():
+    return os.getenv("AI_CACHE_ENABLED", "0").strip().lower() in ("1", "true", "yes", "on")
+
+
+class ResponseCache:
+    """Two-level (memory LRU + disk) store of LLM response text."""
+
+    def __init__(self, directory=".ai_cache", ttl_seconds=86400.0, max_memory_entries=256,
+                 max_disk_bytes=50 * 1024 * 1024, sweep_every=500):
+        self._directory = directory
+        self._ttl = float(ttl_seconds)
+        self._max_memory_entries = max(1, int(max_memory_entries))
+        self._max_disk_bytes = max(0, int(max_disk_bytes))
+        self._memory = OrderedDict()  # key -> (created_at, text)
+        self._lock = threading.Lock()
+        # Size of the disk store as of the last sweep plus what has been written since. Writes
+        # only walk the directory when that passes max_disk_bytes, or every sweep_every writes
+        # to clear out expired files; the first write sweeps to learn the starting size.
+        self._disk_bytes = None
+        self._sweep_every = max(1, int(sweep_every))
+        self._writes_since_sweep = 0
+        self._counters = {
+            "hits": 0,
+            "misses": 0,
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "expired": 0,
+            "evictions": 0,
+            "writes": 0,
+        }
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            directory=os.getenv("AI_CACHE_DIR", ".ai_cache"),
+            ttl_seconds=_env_float("AI_CACHE_TTL_SECONDS", 86400.0),
+            max_memory_entries=_env_int("AI_CACHE_MAX_ENTRIES", 256),
+            max_disk_bytes=_env_int("AI_CACHE_MAX_DISK_MB", 50) * 1024 * 1024,
+        )
+
+    @staticmethod
+    def make_key(model, max_tokens, prompt, temperature=None, stop=None):
+        """
+        Content address for a request: hash of the model, token limit, temperature, stop
+        sequences and prompt text, so changing a site's profile never serves old answers.
+        """
+        prompt_hash = hashlib.sha256((prompt or "").encode("utf-8")).hexdigest()
+        raw = json.dumps([str(model), int(max_tokens), temperature, list(stop or ()), prompt_hash])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _expired(self, created_at, now=None):
+        if self._ttl <= 0:
+            return False
+        return ((now or time.time()) - created_at) > self._ttl
+
+    def _disk_path(self, key):
+        return os.path.join(self._directory, key[:2], key + ".json")
+
+    def get(self, key):
+        """Return the cached text for key, or None on a miss."""
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if self._expired(entry[0]):
+                    self._memory.pop(key, None)
+                    self._counters["expired"] += 1
+                else:
+                    self._memory.move_to_end(key)
+                    self._counters["hits"] += 1
+                    self._counters["memory_hits"] += 1
+                    return entry[1]
+
+        entry = self._read_disk(key)
+        with self._lock:
+            if entry is None:
+                self._counters["misses"] += 1
+                return None
+            self._remember(key, entry)
+            self._counters["hits"] += 1
+            self._counters["disk_hits"] += 1
+            return entry[1]
+
+    def put(self, key, text):
+        if text is None:
+            return
+        entry = (time.time(), text)
+        with self._lock:
+            self._remember(key, entry)
+            self._counters["writes"] += 1
+        self._write_disk(key, entry)
+
+    def _remember(self, key, entry):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self._max_memory_entries:
+            self._memory.popitem(last=False)
+            self._counters["evictions"] += 1
+
+    def _read_disk(self, key):
+        if not self._directory:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as fh:
+                doc = json.load(fh)
+        except (OSError, ValueError):
+            return None
+        created_at = float(doc.get("created_at", 0))
+        if self._expired(created_at):
+            with self._lock:
+                self._counters["expired"] += 1
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        return created_at, doc.get("text")
+
+    def _write_disk(self, key, entry):
+        if not self._directory or self._max_disk_bytes <= 0:
+            return
+        path = self._disk_path(key)
+        data = json.dumps({"created_at": entry[0], "text": entry[1]}).encode("utf-8")
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            try:
+                replaced = os.path.getsize(path)
+            except OSError:
+                replaced = 0
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "wb") as fh:
+                fh.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print("Warning: failed to write AI cache entry:", e)
+            return
+        with self._lock:
+            self._writes_since_sweep += 1
+            if self._disk_bytes is not None:
+                self._disk_bytes += len(data) - replaced
+            sweep = (self._disk_bytes is None or self._disk_bytes > self._max_disk_bytes
+                     or self._writes_since_sweep >= self._sweep_every)
+            if sweep:
+                self._writes_since_sweep = 0
+        if sweep:
+            self._evict_disk()
+
+    def _evict_disk(self):
+        """Drop expired files, then the oldest files until the store fits max_disk_bytes."""
+        files = []
+        total = 0
+        now = time.time()
+        for root, _dirs, names in os.walk(self._directory):
+            for name in names:
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                if self._ttl > 0 and (now - st.st_mtime) > self._ttl:
+                    self._remove_file(path)
+                    continue
+                files.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+        files.sort()
+        while files and total > self._max_disk_bytes:
+            _mtime, size, path = files.pop(0)
+            self._remove_file(path)
+            total -= size
+        with self._lock:
+            self._disk_bytes = total
+
+    def _remove_file(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            return
+        with self._lock:
+            self._counters["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._disk_bytes = None
+        if self._directory and os.path.isdir(self._directory):
+            for root, _dirs, names in os.walk(self._directory):
+                for name in names:
+                    if name.endswith(".json"):
+                        self._remove_file(os.path.join(root, name))
+
+    def stats(self):
+        with self._lock:
+            out = dict(self._counters)
+            out["memory_entries"] = len(self._memory)
+        lookups = out["hits"] + out["misses"]
+        out["hit_rate"] = (out["hits"] / lookups) if lookups else 0.0
+        return out
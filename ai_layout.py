@@ -1,6 +1,7 @@
 import json
 from typing import Any, Dict
 from open_ai_api import call_ai
+from prompt_templates import PromptTemplate, Section
 
 SCHEMA_EXAMPLE = {
   "room_type": "alley",  # one of: alley|corridor|chamber|tavern|library|lab|street|temple
@@ -36,22 +37,24 @@ SYSTEM_PROMPT = (
 )
 
 
+LAYOUT_TEMPLATE = PromptTemplate("map_layout", [
+    SYSTEM_PROMPT,
+    "\nSCHEMA=" + json.dumps(SCHEMA_EXAMPLE),
+    Section("\nTHEME={theme}\nEXITS={exits}"),
+    Section("\nTEXT={text}", cut="text", min_chars=200),
+    "\nJSON:",
+])
+
+
 def _build_prompt(text: str, theme: str, exits: Dict[str, bool]) -> str:
-    return (
-        SYSTEM_PROMPT
-        + "\nSCHEMA=" + json.dumps(SCHEMA_EXAMPLE)
-        + "\nTHEME=" + theme
-        + "\nEXITS=" + json.dumps(exits)
-        + "\nTEXT=" + text.strip()
-        + "\nJSON:"
-    )
+    return LAYOUT_TEMPLATE.render(theme=theme, exits=json.dumps(exits), text=text.strip()).text
 
 
 def get_map_layout(text: str, theme: str, exits: Dict[str, bool]) -> Dict[str, Any]:
     """Return a JSON-like dict describing the layout. Falls back to a simple default if parsing fails."""
     prompt = _build_prompt(text or "", theme or "Unknown", exits or {})
     try:
-        raw = call_ai(prompt)
+        raw = call_ai(prompt, site="map_layout")
         # Try to extract JSON
         raw = raw.strip()
         # If wrapped in code fences, remove them
@@ -1,8 +1,19 @@
 # Main flask application. Handles sessions, routing, and OpenAI communication
-from flask import Flask, request, jsonify, session, render_template, redirect, url_for, flash
+from flask import Flask, Response, request, jsonify, session, render_template, redirect, url_for, flash
 from hello import getOutput, InitializeStartUp
+from open_ai_api import stream_to
+from deadlines import command_deadline
+from call_scheduler import call_context
 from user_db import register_user, authenticate_user, get_user_by_username
 from all_global_vars import all_global_vars
+from prefetch import room_prefetcher
+from metrics import metrics_registry
+from map_cache import is_render_key
+from map_generator import render_map_png
+import notifications
+import json
+import queue
+import threading
 import traceback
 
 # This file loads up Flask to serve web pages at the root / directory.
@@ -34,6 +45,25 @@ def _build_stats(player_char):
     }
 
 
+def _build_command_result(user_id, response_text):
+    """The structured result of one command: the response HTML plus the player's state."""
+    player_char = all_global_vars.get_player_character(user_id)
+    items_here = player_char.get_room_array().list_items(user_id)
+    cur_room = player_char.get_room_array().get_current_room(user_id)
+    room_name = getattr(cur_room, "_room_identity", None) or "Unknown Room"
+    return {
+        "response": response_text,
+        "inventory": player_char.get_inventory(),
+        "items_here": items_here,
+        "stats": _build_stats(player_char),
+        "room_name": room_name,
+    }
+
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
 @application.route('/login', methods=["GET", "POST"])
 def login():
     """Login page - handles both GET (display form) and POST (process login)"""
@@ -90,11 +120,88 @@ def register():
 @application.route('/logout')
 def logout():
     """Logout user and clear session"""
+    user_id = session.get("userId")
+    if user_id:
+        room_prefetcher.cancel_user(user_id)
+        notifications.clear(user_id)
     session.clear()
     flash("You have been logged out", "info")
     return redirect(url_for("login"))
 
 
+@application.route('/stream', methods=["POST"])
+def stream():
+    """
+    Run a command like a POST to / but answer with Server-Sent Events: "token" events carry
+    narration text as the model generates it, then one "result" event carries the same
+    structured result as the JSON endpoint (or an "error" event).
+    """
+    if "userId" not in session:
+        return jsonify({"error": "Not authenticated"}), 401
+
+    user_id = session["userId"]
+    data = request.get_json(force=True)
+    userInput = data.get("command", "").strip()
+    events = queue.Queue()
+
+    def run_command():
+        try:
+            if not all_global_vars.has_userId(user_id):
+                InitializeStartUp(user_id)
+            with stream_to(lambda text: events.put(("token", {"text": text}))), command_deadline(), \
+                    call_context("interactive", user_id):
+                response_text = getOutput(userId=user_id, userInput=userInput)
+            events.put(("result", _build_command_result(user_id, response_text)))
+        except Exception as e:
+            traceback.print_exc()
+            events.put(("error", {"response": f"Server error: {str(e)}"}))
+        events.put(None)
+
+    threading.Thread(target=run_command, daemon=True).start()
+
+    def generate():
+        while True:
+            item = events.get()
+            if item is None:
+                return
+            yield _sse(*item)
+
+    return Response(generate(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@application.route('/updates')
+def updates():
+    """Text finished after its command was answered, as {"updates": [{"id", "html"}]}."""
+    if "userId" not in session:
+        return jsonify({"error": "Not authenticated"}), 401
+    return jsonify({"updates": notifications.drain(session["userId"])})
+
+
+@application.route('/map/<key>.png')
+def room_map(key):
+    """
+    A rendered room map by its content key (see map_cache.py). A key always names the same
+    image, so the ETag is the key itself and browsers may cache the response forever. An
+    evicted render is drawn again from its recorded inputs.
+    """
+    png = render_map_png(key) if is_render_key(key) else None
+    if png is None:
+        return Response("Map not found", status=404, mimetype="text/plain")
+    response = Response(png, mimetype="image/png")
+    response.set_etag(key)
+    response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    return response.make_conditional(request)
+
+
+@application.route('/metrics')
+def metrics():
+    """In-process metrics (LLM latency, tokens and errors per call site) for Prometheus or ?format=json."""
+    if request.args.get("format") == "json":
+        return jsonify(metrics_registry.snapshot())
+    return Response(metrics_registry.render_prometheus(), mimetype="text/plain; version=0.0.4")
+
+
 @application.route('/', methods=["GET", "POST"])
 def home():
     # Check authentication for both GET and POST
@@ -111,19 +218,11 @@ def home():
                 InitializeStartUp(user_id)
             data = request.get_json(force=True)
             userInput = data.get("command", "").strip()
-            response_text = getOutput(userId=session["userId"], userInput=userInput)
-            player_char = all_global_vars.get_player_character(session["userId"])
-            items_here = (all_global_vars.get_player_character(session["userId"]).
-                          get_room_array().list_items(session["userId"]))
-            cur_room = player_char.get_room_array().get_current_room(session["userId"])
-            room_name = getattr(cur_room, "_room_identity", None) or "Unknown Room"
-            return jsonify({
-                "response": response_text,
-                "inventory": player_char.get_inventory(),
-                "items_here": items_here,
-                "stats": _build_stats(player_char),
-                "room_name": room_name,
-            })
+            # LLM steps that overrun the budget answer with fallback text, filled in via /updates.
+            # Their provider calls take turns with other players' commands (call_scheduler.py).
+            with command_deadline(), call_context("interactive", user_id):
+                response_text = getOutput(userId=session["userId"], userInput=userInput)
+            return jsonify(_build_command_result(session["userId"], response_text))
         except Exception as e:
             traceback.print_exc()
             return jsonify({"response": f"Server error: {str(e)}"}), 500
@@ -139,7 +238,8 @@ def home():
                 flash("Session expired. Please log in again.", "error")
                 return redirect(url_for("login"))
 
-        first_response = getOutput(userId=session["userId"], userInput="None")
+        with call_context("interactive", user_id):
+            first_response = getOutput(userId=session["userId"], userInput="None")
         player_char = all_global_vars.get_player_character(user_id)
         first_inventory = player_char.get_inventory()
         first_items = player_char.get_room_array().list_items(session["userId"])
@@ -0,0 +1,61 @@
+# Benchmark for the room map renderer: the per-tile floor loop the renderer used to run against
+# the NumPy floor, then a render that draws the base layer and one that reuses it (what picking up
+# or dropping an item costs). No database or API key needed.
+#
+#   python bench_map_render.py [repeats]
+import random
+import sys
+import timeit
+
+from PIL import Image, ImageDraw
+
+import map_generator
+
+WIDTH, HEIGHT, MARGIN, TILE = 800, 600, 60, 20
+FLOOR_BASE, FLOOR_ACCENT = '#484846', '#3a3a38'
+
+
+def loop_floor():
+    img = Image.new('RGB', (WIDTH, HEIGHT), color='#2a2520')
+    draw = ImageDraw.Draw(img)
+    for y in range(MARGIN, HEIGHT - MARGIN, TILE):
+        for x in range(MARGIN, WIDTH - MARGIN, TILE):
+            shade = random.randint(-12, 12)
+            r = min(255, max(0, int(FLOOR_BASE[1:3], 16) + shade))
+            g = min(255, max(0, int(FLOOR_BASE[3:5], 16) + shade))
+            b = min(255, max(0, int(FLOOR_BASE[5:7], 16) + shade))
+            draw.rectangle([x, y, x + TILE - 1, y + TILE - 1],
+                           fill=f'#{r:02x}{g:02x}{b:02x}', outline=FLOOR_ACCENT, width=1)
+    return img
+
+
+def numpy_floor():
+    img = Image.new('RGB', (WIDTH, HEIGHT), color='#2a2520')
+    map_generator._draw_floor(img, FLOOR_BASE, FLOOR_ACCENT, MARGIN, TILE, map_generator._floor_rng("0_0"))
+    return img
+
+
+def render():
+    exits = {'north': True, 'south': False, 'east': True, 'west': False}
+    return map_generator._draw_room_png('medieval', 'library', 'standard', exits, ['Rare', 'Common'],
+                                        "0_0", "dusty shelves")
+
+
+def full_render():
+    map_generator.base_layers._memory.clear()
+    return render()
+
+
+def timed(fn, repeats):
+    """Best of five batches, in ms per call; the minimum is the least noisy estimate."""
+    return min(timeit.repeat(fn, number=repeats, repeat=5)) / repeats * 1000
+
+
+if __name__ == "__main__":
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    loop_ms = timed(loop_floor, repeats)
+    numpy_ms = timed(numpy_floor, repeats)
+    print(f"floor, per-tile loop: {loop_ms:7.2f} ms")
+    print(f"floor, numpy:         {numpy_ms:7.2f} ms  ({loop_ms / numpy_ms:.1f}x)")
+    print(f"full render + encode: {timed(full_render, repeats):7.2f} ms")
+    print(f"markers over cached base + encode: {timed(render, repeats):7.2f} ms")
@@ -0,0 +1,319 @@
+# Admission control for provider calls made by open_ai_api.call_ai: a global cap on requests
+# in flight, single-flight coalescing of identical prompts already being answered, and
+# jittered exponential backoff (within a deadline) on rate-limit, overload and connection
+# errors. Queue depth, queue wait, retries and coalesced calls are reported to /metrics.
+#
+# Calls carry a CallContext (set with call_context()): a priority class and the user they are
+# for. A free slot always goes to a waiting interactive call first; background classes share
+# what is left by weight, and inside each class users take turns (start-time fair queuing), so
+# one busy player or a burst of prefetches can't crowd out everyone else's commands.
+import contextvars
+import itertools
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from dotenv import load_dotenv
+
+from metrics import metrics_registry
+
+load_dotenv()
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504, 529}
+RETRYABLE_ERRORS = {"APIConnectionError", "APITimeoutError", "RateLimitError", "InternalServerError",
+                    "OverloadedError", "StubBackendError"}
+
+PRIORITY_CLASSES = ("interactive", "prefetch", "enrichment", "batch")
+# Relative share of the background slots when several background classes are waiting.
+BACKGROUND_WEIGHTS = {"prefetch": 4, "enrichment": 2, "batch": 1}
+
+metrics_registry.describe("llm_queue_depth", "Calls waiting for a provider concurrency slot, by priority")
+metrics_registry.describe("llm_in_flight", "Provider calls currently running")
+metrics_registry.describe("llm_queue_wait_seconds", "Time spent waiting for a concurrency slot, by priority")
+metrics_registry.describe("llm_retries_total", "Provider call retries by call site and error")
+metrics_registry.describe("llm_coalesced_total", "Calls answered by an identical in-flight call")
+
+
+def _env_float(name, default):
+    try:
+        return float(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def is_retryable(error):
+    """Rate limits, overloads, 5xx and connection problems are worth retrying; bad requests aren't."""
+    status = getattr(error, "status_code", None)
+    if status is not None:
+        return status in RETRYABLE_STATUS
+    return any(cls.__name__ in RETRYABLE_ERRORS for cls in type(error).__mro__)
+
+
+def _retry_after(error):
+    """Seconds from a Retry-After header on the error's response, if any."""
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class CallContext:
+    """Who a provider call is made for: its priority class and the user id (None if shared)."""
+
+    def __init__(self, priority="interactive", user=None):
+        if priority not in PRIORITY_CLASSES:
+            raise ValueError(f"Unknown priority class '{priority}'")
+        self.priority = priority
+        self.user = user
+
+
+_DEFAULT_CONTEXT = CallContext()
+_context = contextvars.ContextVar("llm_call_context", default=_DEFAULT_CONTEXT)
+
+
+def current_call_context():
+    return _context.get()
+
+
+@contextmanager
+def call_context(priority=None, user=None):
+    """
+    Tag the provider calls made inside the block (and in tasks submitted with the copied
+    context) with a priority class and user. Unset fields are inherited from the outer block.
+    """
+    outer = _context.get()
+    with using_call_context(CallContext(priority or outer.priority, outer.user if user is None else user)) as ctx:
+        yield ctx
+
+
+@contextmanager
+def using_call_context(context):
+    """Make an existing CallContext current, e.g. one created when a background job was queued."""
+    token = _context.set(context)
+    try:
+        yield context
+    finally:
+        _context.reset(token)
+
+
+class _Waiter:
+    def __init__(self, context, seq):
+        self.context = context
+        self.seq = seq
+        self.background = False
+
+
+class _Flight:
+    def __init__(self, context):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        # The leader's context, raised when a more urgent caller joins, and its queued waiter.
+        self.context = context
+        self.waiter = None
+
+
+class CallScheduler:
+    def __init__(self, max_concurrency=8, base_delay=0.5, max_delay=8.0, deadline=30.0, sleep=time.sleep,
+                 reserved_interactive=1):
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self._sleep = sleep
+        # Slots background work may not take, so an arriving interactive call never waits
+        # behind a full house of prefetches.
+        self.reserved_interactive = min(max(0, int(reserved_interactive)), self.max_concurrency - 1)
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._queue = []  # _Waiter, in arrival order
+        self._seq = itertools.count()
+        self._running = 0
+        self._running_background = 0
+        self._class_tags = {}  # background class -> finish tag of its last admitted call
+        self._class_clock = 0.0
+        self._user_tags = {}  # (class, user) -> finish tag of the user's last admitted call
+        self._user_clock = {}  # class -> start tag of its last admitted call
+        self._flights = {}  # key -> _Flight
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            max_concurrency=int(_env_float("LLM_MAX_CONCURRENCY", 8)),
+            base_delay=_env_float("LLM_RETRY_BASE_SECONDS", 0.5),
+            max_delay=_env_float("LLM_RETRY_MAX_SECONDS", 8.0),
+            deadline=_env_float("LLM_CALL_DEADLINE_SECONDS", 30.0),
+            reserved_interactive=int(_env_float("LLM_RESERVED_INTERACTIVE_SLOTS", 1)),
+        )
+
+    def run(self, fn, site="unlabelled", key=None, can_retry=None):
+        """
+        Run fn() under the concurrency cap with retries and return (result, coalesced). Calls
+        sharing a non-None key while one is in flight wait for that call and get its result (or
+        its error) instead of repeating it; for those, coalesced is True. A follower more urgent
+        than the leader lifts the shared call to its own class.
+        can_retry() may veto a retry, e.g. once streamed text has reached the player.
+        Slots are handed out by the priority and user of the current call_context().
+        """
+        context = current_call_context()
+        if key is None:
+            return self._with_retries(fn, site, can_retry, context), False
+
+        with self._cond:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight(context)
+            elif PRIORITY_CLASSES.index(context.priority) < PRIORITY_CLASSES.index(flight.context.priority):
+                self._promote_flight(flight, context.priority)
+        if not leader:
+            metrics_registry.inc("llm_coalesced_total", {"site": site})
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result, True
+
+        try:
+            flight.result = self._with_retries(fn, site, can_retry, context, flight)
+            return flight.result, False
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.done.set()
+
+    def _with_retries(self, fn, site, can_retry, context, flight=None):
+        give_up_at = time.monotonic() + self.deadline
+        attempt = 0
+        while True:
+            try:
+                return self._run_slot(fn, context, flight)
+            except Exception as e:
+                if not is_retryable(e) or (can_retry is not None and not can_retry()):
+                    raise
+                delay = _retry_after(e)
+                if delay is None:
+                    # Full jitter: anywhere up to the exponential step, so retries spread out.
+                    delay = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+                if time.monotonic() + delay >= give_up_at:
+                    raise
+                metrics_registry.inc("llm_retries_total", {"site": site, "error": type(e).__name__})
+                print(f"LLM call for {site} failed ({type(e).__name__}), retrying in {delay:.2f}s")
+                self._sleep(delay)
+                attempt += 1
+
+    def _run_slot(self, fn, context=_DEFAULT_CONTEXT, flight=None):
+        queued_at = time.monotonic()
+        with self._cond:
+            if flight is not None:
+                # A follower may have raised the class since the last attempt.
+                context = flight.context
+            waiter = _Waiter(context, next(self._seq))
+            self._queue.append(waiter)
+            if flight is not None:
+                flight.waiter = waiter
+            self._publish()
+            while self._next_waiter() is not waiter:
+                self._cond.wait()
+            self._admit(waiter)
+            if flight is not None:
+                flight.waiter = None
+            # Another slot may still be free for whoever is next in line.
+            self._cond.notify_all()
+        metrics_registry.observe("llm_queue_wait_seconds", time.monotonic() - queued_at,
+                                 {"priority": waiter.context.priority})
+        try:
+            return fn()
+        finally:
+            with self._cond:
+                self._running -= 1
+                if waiter.background:
+                    self._running_background -= 1
+                self._publish()
+                self._cond.notify_all()
+
+    def _next_waiter(self):
+        """The waiter the next free slot belongs to, or None if it must wait."""
+        if self._running >= self.max_concurrency or not self._queue:
+            return None
+        interactive = [w for w in self._queue if w.context.priority == "interactive"]
+        if interactive:
+            return self._fairest("interactive", interactive)
+        if self._running_background >= self.max_concurrency - self.reserved_interactive:
+            return None
+        waiting = {w.context.priority for w in self._queue}
+        cls = min(waiting, key=lambda c: (self._class_start(c), PRIORITY_CLASSES.index(c)))
+        return self._fairest(cls, [w for w in self._queue if w.context.priority == cls])
+
+    # Start-time fair queuing: a flow's next call starts at the later of its last finish tag and
+    # the clock (the start tag of the last admitted call), so idle flows don't bank credit.
+    def _class_start(self, cls):
+        return max(self._class_tags.get(cls, 0.0), self._class_clock)
+
+    def _user_start(self, cls, user):
+        return max(self._user_tags.get((cls, user), 0.0), self._user_clock.get(cls, 0.0))
+
+    def _fairest(self, cls, waiters):
+        # Lowest start tag wins; a user's own calls keep their arrival order.
+        return min(waiters, key=lambda w: (self._user_start(cls, w.context.user), w.seq))
+
+    def _admit(self, waiter):
+        cls, user = waiter.context.priority, waiter.context.user
+        start = self._user_start(cls, user)
+        self._user_tags[(cls, user)] = start + 1.0
+        self._user_clock[cls] = start
+        if cls != "interactive":
+            class_start = self._class_start(cls)
+            self._class_tags[cls] = class_start + 1.0 / BACKGROUND_WEIGHTS[cls]
+            self._class_clock = class_start
+            waiter.background = True
+            self._running_background += 1
+        if len(self._user_tags) > 1024:
+            # Users whose tag is behind their class clock have no credit left to remember.
+            self._user_tags = {k: t for k, t in self._user_tags.items()
+                               if t > self._user_clock.get(k[0], 0.0)}
+        self._queue.remove(waiter)
+        self._running += 1
+        self._publish()
+
+    def _publish(self):
+        for cls, count in self._waiting_by_priority().items():
+            metrics_registry.set_gauge("llm_queue_depth", count, {"priority": cls})
+        metrics_registry.set_gauge("llm_in_flight", self._running)
+
+    def _waiting_by_priority(self):
+        counts = dict.fromkeys(PRIORITY_CLASSES, 0)
+        for w in self._queue:
+            counts[w.context.priority] += 1
+        return counts
+
+    def promote(self, context, priority="interactive"):
+        """Raise the class of calls made under context, including any already queued."""
+        with self._cond:
+            if PRIORITY_CLASSES.index(priority) < PRIORITY_CLASSES.index(context.priority):
+                context.priority = priority
+                self._publish()
+                self._cond.notify_all()
+
+    def _promote_flight(self, flight, priority):
+        """
+        Give a coalesced call the class of its most urgent caller. Only the flight is raised:
+        the leader's own context, and its other calls, keep their class.
+        """
+        flight.context = CallContext(priority, flight.context.user)
+        if flight.waiter is not None:
+            flight.waiter.context = flight.context
+            self._publish()
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._lock:
+            return {"waiting": len(self._queue), "running": self._running,
+                    "waiting_by_priority": self._waiting_by_priority(),
+                    "running_background": self._running_background,
+                    "in_flight_keys": len(self._flights), "max_concurrency": self.max_concurrency}
@@ -0,0 +1,133 @@
+# Circuit breaker for the LLM provider. After LLM_BREAKER_FAILURES consecutive failed calls
+# (timeouts, connection errors, overloads, 5xx) the circuit opens: call_ai raises
+# CircuitOpenError at once instead of queueing behind a dead provider, and callers answer
+# with cached or stock content. A background probe sends a tiny request every
+# LLM_BREAKER_PROBE_SECONDS and closes the circuit when one succeeds.
+import os
+import threading
+import time
+
+from dotenv import load_dotenv
+
+from call_scheduler import is_retryable
+from metrics import metrics_registry
+
+load_dotenv()
+
+metrics_registry.describe("llm_circuit_open", "1 while the LLM circuit breaker is open")
+metrics_registry.describe("llm_circuit_trips_total", "Times the LLM circuit breaker opened")
+metrics_registry.describe("llm_circuit_rejected_total", "Calls refused by the open circuit, by call site")
+metrics_registry.describe("llm_circuit_probes_total", "Recovery probes sent while the circuit was open, by outcome")
+
+
+class CircuitOpenError(Exception):
+    """The provider is considered down; use fallback content instead."""
+
+
+def _env_float(name, default):
+    try:
+        return float(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def counts_as_failure(error):
+    """Provider trouble trips the breaker; a bad request is our problem, not an outage."""
+    return is_retryable(error) or isinstance(error, TimeoutError)
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold=5, probe_interval=15.0, probe=None):
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.probe_interval = probe_interval
+        self._probe = probe
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._open = False
+        self._opened_at = None
+        self._probe_thread = None
+        self._stop = threading.Event()
+        metrics_registry.set_gauge("llm_circuit_open", 0)
+
+    @classmethod
+    def from_env(cls, probe=None):
+        return cls(
+            failure_threshold=int(_env_float("LLM_BREAKER_FAILURES", 5)),
+            probe_interval=_env_float("LLM_BREAKER_PROBE_SECONDS", 15.0),
+            probe=probe,
+        )
+
+    @property
+    def is_open(self):
+        return self._open
+
+    def before_call(self, site="unlabelled"):
+        """Raise CircuitOpenError if the circuit is open."""
+        if self._open:
+            metrics_registry.inc("llm_circuit_rejected_total", {"site": site})
+            raise CircuitOpenError(f"LLM circuit open, not calling the provider for {site}")
+
+    def call(self, fn, site="unlabelled"):
+        """Run one provider attempt, counting its outcome towards the breaker."""
+        self.before_call(site)
+        try:
+            result = fn()
+        except Exception as e:
+            if counts_as_failure(e):
+                self.record_failure()
+            raise
+        self.record_success()
+        return result
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._open or self._failures < self.failure_threshold:
+                return
+            self._open = True
+            self._opened_at = time.monotonic()
+        metrics_registry.set_gauge("llm_circuit_open", 1)
+        metrics_registry.inc("llm_circuit_trips_total")
+        print(f"LLM circuit opened after {self.failure_threshold} consecutive failures; serving fallback content")
+        self._start_probe()
+
+    def close(self):
+        with self._lock:
+            was_open = self._open
+            self._open = False
+            self._failures = 0
+        metrics_registry.set_gauge("llm_circuit_open", 0)
+        if was_open:
+            print(f"LLM circuit closed after {time.monotonic() - self._opened_at:.1f}s")
+
+    def _start_probe(self):
+        if self._probe is None:
+            return
+        with self._lock:
+            if self._probe_thread is not None and self._probe_thread.is_alive():
+                return
+            self._probe_thread = threading.Thread(target=self._probe_loop, name="llm-circuit-probe", daemon=True)
+            self._probe_thread.start()
+
+    def _probe_loop(self):
+        while self._open and not self._stop.wait(self.probe_interval):
+            try:
+                self._probe()
+            except Exception as e:
+                metrics_registry.inc("llm_circuit_probes_total", {"outcome": "error"})
+                print("LLM circuit probe failed:", type(e).__name__)
+                continue
+            metrics_registry.inc("llm_circuit_probes_total", {"outcome": "ok"})
+            self.close()
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        with self._lock:
+            return {"open": self._open, "consecutive_failures": self._failures,
+                    "failure_threshold": self.failure_threshold}
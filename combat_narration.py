@@ -0,0 +1,276 @@
+# Instant combat narration. combat.resolve_combat_turn has already decided the outcome, so the
+# turn is described from theme-specific phrase templates keyed on the result (hit or miss,
+# damage band, defeat, flight) instead of waiting on the model. With COMBAT_NARRATION_ENRICH
+# set, an LLM paragraph is written in the background and pushed to the client through
+# notifications, replacing the template text once it arrives.
+import os
+import random
+import threading
+import uuid
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+
+import notifications
+from call_scheduler import call_context
+from open_ai_api import call_ai
+
+load_dotenv()
+
+# Phrases per theme. {player}, {npc} and {damage} are filled from the turn's result.
+PHRASES = {
+    "medieval": {
+        "attack_hit": {
+            "light": ["{player}'s blade nicks {npc} for {damage} damage.",
+                      "{player} lands a glancing cut on {npc} ({damage} damage)."],
+            "solid": ["{player}'s sword bites deep into {npc} for {damage} damage.",
+                      "Steel rings as {player} strikes {npc} squarely for {damage} damage."],
+            "crushing": ["{player} hews into {npc} with a ruinous blow for {damage} damage.",
+                         "A mighty stroke from {player} sends {npc} reeling ({damage} damage)."],
+        },
+        "heavy_hit": {
+            "light": ["{player} heaves a great swing that only grazes {npc} ({damage} damage).",
+                      "{player}'s heavy blow clips {npc} for {damage} damage."],
+            "solid": ["{player} brings the weapon down hard on {npc} for {damage} damage.",
+                      "{player}'s two-handed swing crashes into {npc} for {damage} damage."],
+            "crushing": ["{player}'s thunderous blow splinters {npc}'s guard for {damage} damage.",
+                         "{player} cleaves into {npc} with all their weight, dealing {damage} damage."],
+        },
+        "miss": ["{npc} sidesteps {player}'s swing.",
+                 "{player}'s strike whistles past {npc} harmlessly.",
+                 "{npc} parries {player}'s blow aside."],
+        "defend": ["{player} raises their shield and braces.",
+                   "{player} sets their feet and guards against {npc}."],
+        "flee_ok": ["{player} breaks away and slips out of {npc}'s reach.",
+                    "{player} disengages, leaving {npc} cursing behind them."],
+        "flee_fail": ["{player} turns to run, but {npc} cuts off the retreat.",
+                      "{npc} blocks {player}'s escape."],
+        "npc_hit": {
+            "light": ["{npc} scrapes {player} for {damage} damage.",
+                      "{npc}'s counter catches {player} lightly ({damage} damage)."],
+            "solid": ["{npc} strikes back hard, dealing {damage} damage to {player}.",
+                      "{npc}'s blow lands true on {player} for {damage} damage."],
+            "crushing": ["{npc} batters {player} with a savage blow for {damage} damage.",
+                         "{npc}'s counterstrike smashes {player} for {damage} damage."],
+        },
+        "npc_miss": ["{npc}'s counterattack glances off harmlessly.",
+                     "{npc} swings back but finds only air."],
+        "npc_defeated": ["{npc} crumples to the flagstones and moves no more.",
+                         "With a final groan, {npc} falls."],
+        "player_defeated": ["{player}'s strength gives out and the world goes dark.",
+                            "{player} sinks to the ground, beaten."],
+    },
+    "steampunk": {
+        "attack_hit": {
+            "light": ["{player}'s cane-blade nicks {npc} for {damage} damage.",
+                      "{player} lands a quick jab on {npc} ({damage} damage)."],
+            "solid": ["{player}'s brass knuckles crunch into {npc} for {damage} damage.",
+                      "{player} strikes {npc} with a hiss of steam for {damage} damage."],
+            "crushing": ["{player}'s piston-driven punch staggers {npc} for {damage} damage.",
+                         "Gears whine as {player} slams {npc} for {damage} damage."],
+        },
+        "heavy_hit": {
+            "light": ["{player} winds up a heavy blow that barely clips {npc} ({damage} damage).",
+                      "{player}'s wrench glances off {npc} for {damage} damage."],
+            "solid": ["{player} swings the great wrench into {npc} for {damage} damage.",
+                      "A pressurised blow from {player} hammers {npc} for {damage} damage."],
+            "crushing": ["{player} vents a full boiler into one ruinous strike on {npc} ({damage} damage).",
+                         "{player}'s clockwork gauntlet flattens {npc} for {damage} damage."],
+        },
+        "miss": ["{npc} ducks under {player}'s swing in a cloud of soot.",
+                 "{player}'s blow clangs against a pipe instead of {npc}.",
+                 "{npc} twists aside from {player}'s strike."],
+        "defend": ["{player} raises a riveted buckler and braces.",
+                   "{player} crouches behind a steel plate, watching {npc}."],
+        "flee_ok": ["{player} vanishes into a gout of steam, leaving {npc} behind.",
+                    "{player} scrambles up a ladder and out of {npc}'s reach."],
+        "flee_fail": ["{player} makes for the exit, but {npc} slams the valve-door shut.",
+                      "{npc} hauls {player} back by the coat-tails."],
+        "npc_hit": {
+            "light": ["{npc} clips {player} for {damage} damage.",
+                      "{npc}'s retort grazes {player} ({damage} damage)."],
+            "solid": ["{npc} cracks {player} with a length of pipe for {damage} damage.",
+                      "{npc}'s counter lands hard on {player} for {damage} damage."],
+            "crushing": ["{npc}'s steam-fist pounds {player} for {damage} damage.",
+                         "{npc} hurls {player} into the machinery for {damage} damage."],
+        },
+        "npc_miss": ["{npc}'s counterblow rings off the boilerplate.",
+                     "{npc} lunges back but only catches steam."],
+        "npc_defeated": ["{npc} sputters, hisses and collapses in a heap of cogs.",
+                         "{npc} sinks to the grating, spent."],
+        "player_defeated": ["{player}'s gauges drop to zero and they collapse.",
+                            "{player} falls amid the clatter of gears."],
+    },
+    "cyberpunk": {
+        "attack_hit": {
+            "light": ["{player}'s shock-baton sparks against {npc} for {damage} damage.",
+                      "{player} lands a quick strike on {npc} ({damage} damage)."],
+            "solid": ["{player}'s monoblade slices {npc} for {damage} damage.",
+                      "{player} tags {npc} clean for {damage} damage."],
+            "crushing": ["{player}'s augmented strike fries {npc}'s circuits for {damage} damage.",
+                         "{player} unloads on {npc} at point-blank range for {damage} damage."],
+        },
+        "heavy_hit": {
+            "light": ["{player} overcharges a blow that barely connects with {npc} ({damage} damage).",
+                      "{player}'s heavy strike skims {npc} for {damage} damage."],
+            "solid": ["{player} drives a hydraulic fist into {npc} for {damage} damage.",
+                      "{player}'s charged blade carves into {npc} for {damage} damage."],
+            "crushing": ["{player} redlines their implants and smashes {npc} for {damage} damage.",
+                         "{player}'s full-power strike sends {npc} through a neon sign ({damage} damage)."],
+        },
+        "miss": ["{npc}'s reflex boosters carry it clear of {player}'s attack.",
+                 "{player}'s strike hits nothing but rain and neon.",
+                 "{npc} slips {player}'s attack with inhuman speed."],
+        "defend": ["{player} raises a deflector field and braces.",
+                   "{player} drops into a guarded stance, targeting software tracking {npc}."],
+        "flee_ok": ["{player} ghosts into the crowd, leaving {npc} scanning empty street.",
+                    "{player} pops a smoke charge and disappears from {npc}'s sensors."],
+        "flee_fail": ["{player} bolts, but {npc}'s tracker locks on and cuts them off.",
+                      "{npc} seals the exit before {player} can reach it."],
+        "npc_hit": {
+            "light": ["{npc}'s return fire grazes {player} for {damage} damage.",
+                      "{npc} clips {player} with a quick strike ({damage} damage)."],
+            "solid": ["{npc} hits back hard, dealing {damage} damage to {player}.",
+                      "{npc}'s blade finds a gap in {player}'s armour for {damage} damage."],
+            "crushing": ["{npc} unloads a burst into {player} for {damage} damage.",
+                         "{npc}'s cyber-arm slams {player} into a wall for {damage} damage."],
+        },
+        "npc_miss": ["{npc}'s counterattack sparks off {player}'s armour.",
+                     "{npc} fires back but the shots go wide."],
+        "npc_defeated": ["{npc} glitches, shudders and goes dark.",
+                         "{npc} drops, optics flickering out."],
+        "player_defeated": ["{player}'s vitals flatline on the HUD.",
+                            "{player} collapses, systems failing."],
+    },
+}
+
+_executor = None
+_lock = threading.Lock()
+
+
+def enrich_enabled():
+    return os.getenv("COMBAT_NARRATION_ENRICH", "0").lower() in ("1", "true", "yes")
+
+
+def theme_key(theme):
+    t = (theme or "").lower()
+    if "cyber" in t or "sci" in t:
+        return "cyberpunk"
+    if "steam" in t:
+        return "steampunk"
+    return "medieval"
+
+
+def damage_band(damage, max_health):
+    """"light", "solid" or "crushing" depending on the share of the target's max HP taken."""
+    share = damage / max(1, max_health)
+    if share < 0.12:
+        return "light"
+    if share < 0.25:
+        return "solid"
+    return "crushing"
+
+
+def _seed(result, player_name, npc_name):
+    # Same turn, same text: stable across processes, unlike hash().
+    key = f"{player_name}|{npc_name}|{result['action']}|{result['player_health']}|{result['npc_health']}"
+    return zlib.crc32(key.encode("utf-8"))
+
+
+def narrate(result, player_name, npc_name, theme=None, rng=None):
+    """One or two sentences describing a combat turn, built from the result dict only."""
+    phrases = PHRASES[theme_key(theme)]
+    rng = rng or random.Random(_seed(result, player_name, npc_name))
+
+    def pick(options, damage=0):
+        return rng.choice(options).format(player=player_name, npc=npc_name, damage=damage)
+
+    action = result["action"]
+    parts = []
+    if action == "flee":
+        parts.append(pick(phrases["flee_ok" if result["fled"] else "flee_fail"]))
+    elif action == "defend":
+        parts.append(pick(phrases["defend"]))
+    elif result["player_hit"]:
+        damage = result["player_damage"]
+        band = damage_band(damage, result["npc_max_health"])
+        parts.append(pick(phrases[action + "_hit"][band], damage))
+    else:
+        parts.append(pick(phrases["miss"]))
+
+    if result["fled"]:
+        return " ".join(parts)
+    if result["npc_defeated"]:
+        parts.append(pick(phrases["npc_defeated"]))
+        return " ".join(parts)
+
+    npc_damage = result["npc_damage"]
+    if npc_damage > 0:
+        band = damage_band(npc_damage, result["player_max_health"])
+        parts.append(pick(phrases["npc_hit"][band], npc_damage))
+    else:
+        parts.append(pick(phrases["npc_miss"]))
+    if result["player_defeated"]:
+        parts.append(pick(phrases["player_defeated"]))
+    return " ".join(parts)
+
+
+ENRICHMENT_INSTRUCTIONS = (
+    "Write one short paragraph narrating a text-adventure combat turn. "
+    "Do not decide new mechanics; only narrate the facts you are given."
+)
+
+
+def enrichment_system(player_name, npc_name, npc_description):
+    """Instructions plus the combatants: the same for every turn of a fight, so it is cached."""
+    return (ENRICHMENT_INSTRUCTIONS,
+            f"The player is {player_name}. The NPC is {npc_name}. The NPC description is {npc_description}.")
+
+
+def enrichment_prompt(result, action_text):
+    """The facts of this turn; the combatants are in enrichment_system."""
+    return (
+        f"The player chose {action_text}. "
+        + f"Player dealt {result['player_damage']} damage. "
+        + f"NPC dealt {result['npc_damage']} damage. "
+        + f"Player HP is {result['player_health']}/{result['player_max_health']}. "
+        + f"NPC HP is {result['npc_health']}/{result['npc_max_health']}. "
+        + f"NPC defeated: {result['npc_defeated']}. Player defeated: {result['player_defeated']}. "
+        + f"Player fled: {result['fled']}."
+    )
+
+
+def _get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="combat-narration")
+        return _executor
+
+
+def _enrich(userId, update_id, prompt, system=None):
+    try:
+        with call_context("enrichment", userId):
+            text = call_ai(prompt, site="combat_narration", system=system)
+    except Exception as e:
+        # The template text already shown stays in place.
+        print("Warning: combat narration enrichment failed:", e)
+        return None
+    notifications.push(userId, update_id, text)
+    return text
+
+
+def narrate_turn(userId, result, player_name, npc_name, theme=None, npc_description="", action_text=""):
+    """
+    Template narration for the turn. When enrichment is on, the text is wrapped in a
+    placeholder and an LLM rewrite is scheduled to replace it via notifications.
+    """
+    text = narrate(result, player_name, npc_name, theme)
+    if not enrich_enabled():
+        return text
+    update_id = "narration-" + uuid.uuid4().hex[:12]
+    prompt = enrichment_prompt(result, action_text)
+    system = enrichment_system(player_name, npc_name, npc_description)
+    _get_executor().submit(_enrich, userId, update_id, prompt, system)
+    return notifications.placeholder(update_id, text)
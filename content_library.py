@@ -0,0 +1,179 @@
+# Shared library of generated room content. Room identities come from a fixed pool per theme
+# (see hello.doConfirmPlayerStats), so instead of every new player paying for a fresh "Forgotten
+# Crypt", up to CONTENT_LIBRARY_VARIANTS personalisation-free versions are kept per
+# (theme, identity) in Mongo: a room description that names no one, an NPC persona with its
+# stats, and an item set. A new room samples one and only asks the model for a sentence or two
+# that brings in the NPC; once a key has all its variants, rooms for it cost one small call.
+import copy
+import json
+import os
+import random
+import threading
+from datetime import datetime
+
+from dotenv import load_dotenv
+from pymongo import MongoClient
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+from combat_narration import theme_key
+from item import ITEM_SCHEMA_EXAMPLE
+from metrics import metrics_registry
+from open_ai_api import call_ai
+from prompt_templates import PromptTemplate, Section
+from room_bundle import _parse_json_object, _validate_bundle
+
+load_dotenv()
+client = MongoClient(os.getenv('URI'))
+db = client["dungeons_droids"]
+library_collection = db["content_library"]
+
+metrics_registry.describe("content_library_requests_total",
+                          "Room content requests by outcome (sampled, generated, error)")
+
+LIBRARY_SCHEMA_EXAMPLE = {
+    "npc_name": "Brother Aldric",
+    "npc_description": "A stooped monk in a moth-eaten habit who watches newcomers warily.",
+    "room_description": "Moss creeps over cracked flagstones beneath a vaulted ceiling...",
+    "items": ITEM_SCHEMA_EXAMPLE,
+}
+
+LIBRARY_TEMPLATE = PromptTemplate("content_library", [
+    "You are a content generator for a text-adventure RPG. The content is shared between many "
+    "players, so it must not address or name any player.\n"
+    "Given a THEME, ROOM TYPE and an NPC's TOUGHNESS and FRIENDLINESS, generate the NPC who "
+    "occupies the room, the room itself, and the items found in it.\n"
+    "Produce a compact JSON object following the exact SCHEMA.\n"
+    "Rules:\n"
+    "- Return ONLY minified JSON (no markdown, no comments)\n"
+    "- npc_name: just the name, no other words\n"
+    "- npc_description: about a paragraph of plain text describing the NPC, like in a novel\n"
+    "- room_description: a MUD room description in the second person that does NOT mention the "
+    "NPC or any other character; don't list exits or items\n"
+    "- items: between 1 and 3 items, each with name, type, rarity (Common|Uncommon|Rare|Epic|Legendary), "
+    "value and desc\n"
+    "- Include a 'damage' value (1-20) ONLY for items whose type is 'weapon'\n"
+    "- Include an 'armor' value (1-10) ONLY for items whose type is 'armor'\n"
+    "- Skew more towards creating Common and Uncommon rarities\n"
+    "- TOUGHNESS and FRIENDLINESS are out of 100; 0 friendliness is very hostile, 100 very friendly\n",
+    Section("SCHEMA={schema}\nTHEME={theme}\nROOM TYPE={identity}\nTOUGHNESS={toughness}\n"
+            "FRIENDLINESS={friendlyness}\nJSON:"),
+])
+
+# The personal part: a sentence or two placing this player's NPC in the shared room.
+TOUCH_UP_TEMPLATE = PromptTemplate("room_touch_up", [
+    Section("Room: {room}\n", cut="room", min_chars=200),
+    Section("Write one or two sentences to follow this room description, introducing the NPC "
+            "{npc_name} ({npc_description}) as {player} enters. Plain text only, no quotes.",
+            cut="npc_description", min_chars=100),
+])
+
+
+def library_enabled():
+    return os.getenv("CONTENT_LIBRARY_ENABLED", "0").strip().lower() in ("1", "true", "yes", "on")
+
+
+def _env_int(name, default):
+    try:
+        return max(1, int(os.getenv(name, default)))
+    except (TypeError, ValueError):
+        return default
+
+
+def base_identity(room_identity):
+    """ "Mossy Hall Annex 2" shares the library entries of "Mossy Hall". """
+    identity = (room_identity or "general").strip()
+    head, sep, tail = identity.rpartition(" Annex ")
+    return head if sep and tail.isdigit() else identity
+
+
+class ContentLibrary:
+    """Personalisation-free room content per (theme, identity, variant), shared by all players."""
+
+    def __init__(self, collection, variants=None, rng=None):
+        self._collection = collection
+        self.variants = variants or _env_int("CONTENT_LIBRARY_VARIANTS", 5)
+        self._rng = rng or random.Random()
+        self._indexed = False
+        self._lock = threading.Lock()
+
+    def _ensure_index(self):
+        if self._indexed:
+            return
+        with self._lock:
+            if not self._indexed:
+                self._collection.create_index([("theme", 1), ("identity", 1), ("variant", 1)], unique=True)
+                self._indexed = True
+
+    def entry(self, theme, room_identity):
+        """A library entry for the room: a new variant while the key has fewer than `variants`, else a stored one."""
+        self._ensure_index()
+        key = {"theme": theme_key(theme), "identity": base_identity(room_identity)}
+        stored = list(self._collection.find(key))
+        if len(stored) >= self.variants:
+            entry = self._rng.choice(stored)
+            self._collection.update_one({"_id": entry["_id"]}, {"$inc": {"uses": 1}})
+            metrics_registry.inc("content_library_requests_total", {"outcome": "sampled"})
+            return entry
+
+        entry = self._generate(theme, key["identity"])
+        if entry is None:
+            metrics_registry.inc("content_library_requests_total", {"outcome": "error"})
+            return self._rng.choice(stored) if stored else None
+        entry.update(key, variant=len(stored), uses=1, created_at=datetime.utcnow())
+        try:
+            self._collection.insert_one(entry)
+        except DuplicateKeyError:
+            # Another worker stored this variant first; ours is still fine to use once.
+            pass
+        metrics_registry.inc("content_library_requests_total", {"outcome": "generated"})
+        return entry
+
+    def _generate(self, theme, identity):
+        toughness = self._rng.randint(1, 100)
+        friendlyness = self._rng.randint(1, 100)
+        prompt = LIBRARY_TEMPLATE.render(schema=json.dumps(LIBRARY_SCHEMA_EXAMPLE), theme=theme,
+                                         identity=identity, toughness=toughness, friendlyness=friendlyness)
+        try:
+            content = _validate_bundle(_parse_json_object(call_ai(prompt.text, site="content_library")))
+        except Exception as e:
+            print("Content library generation failed:", e)
+            return None
+        if not all(content.get(k) for k in ("npc_name", "npc_description", "room_description", "items")):
+            return None
+        content.update(npc_toughness=toughness, npc_friendlyness=friendlyness)
+        return content
+
+    def room_bundle(self, theme, player_name, room_identity):
+        """
+        A room bundle (see room_bundle.py) built from the library, with the NPC brought into the
+        shared description by a short personalised call. {} if the library can't supply one.
+        """
+        try:
+            entry = self.entry(theme, room_identity)
+        except PyMongoError as e:
+            print("Content library unavailable, generating the room directly:", e)
+            return {}
+        if not entry:
+            return {}
+        return {
+            "npc_name": entry["npc_name"],
+            "npc_description": entry["npc_description"],
+            "npc_toughness": entry.get("npc_toughness"),
+            "npc_friendlyness": entry.get("npc_friendlyness"),
+            "room_description": entry["room_description"] + " " + self._touch_up(entry, player_name),
+            # Each room gets its own copies; items are mutated once picked up.
+            "items": copy.deepcopy(entry["items"]),
+        }
+
+    def _touch_up(self, entry, player_name):
+        prompt = TOUCH_UP_TEMPLATE.render(room=entry["room_description"], npc_name=entry["npc_name"],
+                                          npc_description=entry["npc_description"],
+                                          player=player_name or "the player")
+        try:
+            return call_ai(prompt.text, site="room_touch_up")
+        except Exception as e:
+            print("Room touch-up failed, using a plain NPC line:", e)
+            return f"{entry['npc_name']} is here."
+
+
+content_library = ContentLibrary(library_collection)
@@ -0,0 +1,166 @@
+# Latency budget for player commands. application.py opens a command_deadline() around each
+# command; LLM-backed steps then go through call_by_deadline(), which waits only for what is
+# left of the budget. When the model is late the step gets its fallback text at once (stock
+# description, template narration) and the real text is delivered afterwards: the caller's
+# callback patches the game state that holds the fallback, and the text is queued in
+# notifications so the client swaps it into the placeholder on its next /updates poll. While the
+# LLM circuit is open the fallback is simply the answer.
+import contextvars
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from contextlib import contextmanager
+
+from dotenv import load_dotenv
+
+import notifications
+from circuit_breaker import CircuitOpenError
+from metrics import metrics_registry
+from open_ai_api import current_stream_sink, stream_to
+
+load_dotenv()
+
+metrics_registry.describe("command_deadline_misses_total",
+                          "LLM steps that missed the command deadline and answered with fallback text")
+metrics_registry.describe("late_fills_total", "Late LLM text delivered after a deadline miss, by outcome")
+
+_local = threading.local()
+
+
+def command_budget():
+    """Seconds a command may spend waiting on LLM steps; 0 (or less) turns deadlines off."""
+    try:
+        return float(os.getenv("COMMAND_DEADLINE_SECONDS", 8))
+    except (TypeError, ValueError):
+        return 8.0
+
+
+@contextmanager
+def command_deadline(seconds=None):
+    """Give LLM steps run on this thread until `seconds` from now (default COMMAND_DEADLINE_SECONDS)."""
+    seconds = command_budget() if seconds is None else seconds
+    previous = getattr(_local, "deadline", None)
+    _local.deadline = time.monotonic() + seconds if seconds and seconds > 0 else None
+    try:
+        yield
+    finally:
+        _local.deadline = previous
+
+
+def current_deadline():
+    """The monotonic deadline of the command running on this thread, or None."""
+    return getattr(_local, "deadline", None)
+
+
+def _start(fn):
+    """
+    Run fn() on its own daemon thread and return its Future. A step that misses its deadline
+    keeps running until the provider answers; with a shared pool, a handful of those would
+    leave new commands' steps queued behind them until their budget ran out. Provider
+    concurrency is bounded by the call scheduler, not here.
+    """
+    future = Future()
+
+    def target():
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(fn())
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=target, name="deadline-step", daemon=True).start()
+    return future
+
+
+class LateText:
+    """An LLM answer that missed the command deadline and is still on its way."""
+
+    def __init__(self, userId, update_id, future, site):
+        self.userId = userId
+        self.update_id = update_id
+        self._future = future
+        self._site = site
+
+    def placeholder(self, html):
+        """html wrapped so the client replaces it with the late text."""
+        return notifications.placeholder(self.update_id, html)
+
+    def when_ready(self, on_late=None):
+        """
+        Deliver the text once it arrives: on_late(text) first patches the game state holding
+        the fallback, then the client is sent it. Call this after the fallback has been stored.
+        """
+        self._future.add_done_callback(lambda f: self._deliver(f, on_late))
+
+    def _deliver(self, future, on_late):
+        try:
+            text = future.result()
+        except Exception as e:
+            # The fallback text stays where it is.
+            metrics_registry.inc("late_fills_total", {"site": self._site, "outcome": "error"})
+            print(f"Late LLM text for {self._site} failed:", e)
+            return
+        if on_late is not None:
+            try:
+                on_late(text)
+            except Exception as e:
+                print(f"Failed to apply late LLM text for {self._site}:", e)
+        notifications.push(self.userId, self.update_id, text)
+        metrics_registry.inc("late_fills_total", {"site": self._site, "outcome": "ok"})
+
+
+def call_by_deadline(userId, fn, fallback, site="unlabelled", deadline=None):
+    """
+    Run fn() (an LLM call) bounded by the command deadline. Returns (text, late): fn's result
+    and None when it finished in time, otherwise `fallback` and a LateText. The caller shows
+    late.placeholder(fallback) and then calls late.when_ready().
+    Pass `deadline` (from current_deadline()) when calling from a worker thread.
+    """
+    try:
+        return _call_by_deadline(userId, fn, fallback, site, deadline)
+    except CircuitOpenError:
+        return fallback, None
+
+
+def _call_by_deadline(userId, fn, fallback, site, deadline):
+    deadline = deadline if deadline is not None else current_deadline()
+    if deadline is None:
+        return fn(), None
+
+    sink = current_stream_sink()
+    abandoned = threading.Event()
+
+    def relay(chunk):
+        # Once the fallback has been sent, the rest of the stream has nowhere to go.
+        if not abandoned.is_set():
+            sink(chunk)
+
+    def run():
+        if sink is None:
+            return fn()
+        with stream_to(relay):
+            return fn()
+
+    # The copied context keeps the command's call_context() priority for the worker.
+    context = contextvars.copy_context()
+    future = _start(lambda: context.run(run))
+    try:
+        return future.result(timeout=max(0.0, deadline - time.monotonic())), None
+    except FutureTimeout:
+        abandoned.set()
+
+    metrics_registry.inc("command_deadline_misses_total", {"site": site})
+    print(f"LLM step {site} missed the command deadline; answering with fallback text")
+    return fallback, LateText(userId, "late-" + uuid.uuid4().hex[:12], future, site)
+
+
+def narrate_by_deadline(userId, fn, fallback, site="unlabelled"):
+    """Narration that shows `fallback` if fn() misses the deadline, for text nothing else stores."""
+    text, late = call_by_deadline(userId, fn, fallback, site=site)
+    if late is None:
+        return text
+    late.when_ready()
+    return late.placeholder(text)
@@ -0,0 +1,56 @@
+# Pre-written content for when the LLM circuit is open (see circuit_breaker.py): NPC personas
+# per theme and the opening greeting. Room descriptions fall back to room._stock_description
+# and narration to the templates its callers already carry.
+import random
+
+from combat_narration import theme_key
+
+STOCK_GREETING = ("Welcome, adventurer, to Dungeons and Droids, a text game where the world is written "
+                  "around you as you explore it.")
+
+# (name, description) pairs, written to fit any toughness or friendliness.
+STOCK_PERSONAS = {
+    "medieval": [
+        ("Aldric the Grey", "A weathered man in a patched cloak, leaning on a staff that has seen more roads "
+                            "than he cares to count. His eyes follow you with quiet suspicion."),
+        ("Maren Ashford", "A broad-shouldered woman in dented mail, a notched sword at her hip. She carries "
+                          "herself like someone who has held this ground before."),
+        ("Brother Wendel", "A hooded monk with ink-stained fingers and a worn prayer book, muttering as he "
+                           "counts the stones in the wall."),
+        ("Gorrick", "A hulking figure in furs and iron, smelling of smoke and old ale, who sizes you up "
+                    "without a word."),
+    ],
+    "steampunk": [
+        ("Cornelius Vane", "A lanky inventor in a soot-streaked waistcoat, brass goggles pushed up on his "
+                           "forehead and a wrench in each pocket."),
+        ("Ada Thistlecog", "A sharp-eyed engineer with grease to the elbows and a mechanical arm that ticks "
+                           "softly as she flexes it."),
+        ("Sergeant Brassworth", "A stiff-backed guard in a riveted coat, his pressure rifle hissing faintly "
+                                "at his side."),
+        ("Old Pim", "A stooped tinker surrounded by half-built clockwork birds, who peers at you over "
+                    "cracked spectacles."),
+    ],
+    "cyberpunk": [
+        ("Kira Vex", "A runner in a rain-slick jacket, chrome glinting at her temples and a data spike "
+                     "twirling between her fingers."),
+        ("Deckard-9", "A corporate enforcer with mirrored optics and a voice flattened by a cheap "
+                      "vocal implant."),
+        ("Juno", "A street fixer wrapped in neon-lined synthleather, always one eye on the exits and one "
+                 "on your credit chip."),
+        ("Tanaka", "A scarred ripperdoc in a stained apron, his cybernetic hands humming with restless "
+                   "precision."),
+    ],
+}
+
+
+def stock_persona(theme, rng=None):
+    """A (name, description) pair for the theme."""
+    return (rng or random).choice(STOCK_PERSONAS[theme_key(theme)])
+
+
+def persona_description(theme, name):
+    """The stock description for name, or a generic one if the name didn't come from STOCK_PERSONAS."""
+    for persona_name, description in STOCK_PERSONAS[theme_key(theme)]:
+        if persona_name == name:
+            return description
+    return f"{name} stands before you, watching your every move and giving little away."
@@ -6,6 +6,9 @@
 from dotenv import load_dotenv
 from all_global_vars import all_global_vars
 from open_ai_api import call_ai
+from circuit_breaker import CircuitOpenError
+from fallback_content import STOCK_GREETING
+from prompt_templates import PromptTemplate
 from main_loop import do_main_loop
 from bson.objectid import ObjectId
 import user_db
@@ -13,6 +16,13 @@ from humanoid import PlayerCharacter, Npc
 import os
 import random
 from room import room_holder, Room
+from prefetch import room_prefetcher
+from job_queue import job_queue
+
+GREETING_TEMPLATE = PromptTemplate("greeting", [
+    "Greet the player as our new Text Game With AI Called Dungeons and Droids. "
+    "Don't give any instructions to the user."
+])
 
 
 def InitializeStartUp(userId):
@@ -45,7 +55,7 @@ def InitializeStartUp(userId):
 
         # Reinitialize player_character object for function use
         returning_character = PlayerCharacter.rehydrate_char(character_id)
-        returning_character.get_room_array().set_npc_factory(lambda uid: Npc(uid))
+        returning_character.get_room_array().set_npc_factory(lambda uid: Npc(uid, generate=False))
 
         # Reinitialize global container and load it with the rehydrated character
         all_global_vars.create_player(userId)
@@ -65,10 +75,10 @@ def doSectionStarting(userId):
 
     client_response = ""
 
-    client_response += call_ai(
-        "Greet the player as our new Text Game With AI Called Dungeons and Droids. "
-        "Don't give any instructions to the user."
-    )
+    try:
+        client_response += call_ai(GREETING_TEMPLATE.render().text, cacheable=True, site="greeting")
+    except CircuitOpenError:
+        client_response += STOCK_GREETING
     client_response += "<BR>"
 
     client_response += ("Choose your world:<BR>"
@@ -345,7 +355,7 @@ def doConfirmPlayerStats(userInput, userId):
         # User confirmed
         # Generate rooms and start main game loop
         rooms = all_global_vars.get_player_character(userId).get_room_array()
-        rooms.set_npc_factory(lambda uid: Npc(uid))
+        rooms.set_npc_factory(lambda uid: Npc(uid, generate=False))
 
         # Build a randomized connected dungeon each run.
         # Size and density depend on the selected world theme.
@@ -409,7 +419,7 @@ def doConfirmPlayerStats(userInput, userId):
             character.update_world_map(room_id, x, y)
 
         cur_room = rooms.get_room(userId, start_x, start_y)
-        cur_room.generate_description(userId, npc=Npc(userId))
+        cur_room.generate_description(userId, npc=Npc(userId, generate=False))
 
         # Update player state for session
         all_global_vars.get_player_character(userId).set_section(section="MainGameLoop")
@@ -445,6 +455,10 @@ def getInput():
 
 
 def restart_game(userId):
+    # Stop prefetching first: a running prefetch still stores its room and NPC, so wait for it,
+    # then let queued saves for the old character land before it is deleted.
+    room_prefetcher.cancel_user(userId, wait_timeout=30)
+    job_queue.flush(userId, timeout=10)
     user_doc = user_db.get_user_by_id(userId)
     old_char_id = user_doc.get("_player_character_id")
     PlayerCharacter.delete_character(old_char_id)
@@ -489,6 +503,7 @@ def getOutput(userInput, userId):
         if cur_section == "MainGameLoop":
             return do_main_loop(userInput, userId)
         if cur_section == "Restart":
+            room_prefetcher.cancel_user(userId)
             all_global_vars._userIdList.pop(userId)
             return doSectionStarting(userId)
 
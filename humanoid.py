@@ -5,6 +5,14 @@ from pymongo import MongoClient
 from dotenv import load_dotenv
 from datetime import datetime
 from room import room_holder
+import npc_memory
+import npc_rules
+import combat_narration
+from job_queue import job_queue
+from deadlines import call_by_deadline, narrate_by_deadline
+from circuit_breaker import CircuitOpenError
+import fallback_content
+from prompt_templates import PromptTemplate, Section
 from quests import (
     QUEST_DEFEAT_ENEMIES,
     QUEST_OBTAIN_ITEM,
@@ -27,6 +35,84 @@ EQUIP_SLOTS = {
     "armor": "armor"
 }
 
+# Same for every NPC conversation, so it leads the cacheable system prefix (see call_ai).
+TALK_INSTRUCTIONS = (
+    "You are voicing an NPC in a text adventure. Respond in-character and reflect the relationship so far. "
+    "If the player has attacked, wounded, defended against, or fled from this NPC, "
+    "the NPC should remember that and react with appropriate fear, anger, caution, respect, "
+    "or grudging restraint based on their personality. "
+    "Say just the response text you'd say in a conversation as that npc, nothing else."
+)
+
+NPC_NAME_TEMPLATE = PromptTemplate("npc_name", [Section(
+    "Pick a name for A NPC with the theme {theme} that has a toughness of {toughness} out of 100,"
+    " with 100/100 being very tough and has a friendliness score where 100 is very friendly and 0"
+    " is very hostile of {friendlyness} Just include the name by itself, don't put any other words"
+    " in the response"
+)])
+
+NPC_DESCRIPTION_TEMPLATE = PromptTemplate("npc_description", [Section(
+    "Describe the NPC with the name {name} and the theme {theme} that has a toughness of {toughness}"
+    " out of 100, with 100/100 being very tough and has a friendliness score where 100 is very"
+    " friendly and 0 is very hostile of {friendlyness} Just write about a paragraph of plain text to"
+    " describe the npc, like in a novel"
+)])
+
+# Over budget, the oldest history goes first, then the persona is shortened; the player's
+# own line is cut last.
+TALK_TEMPLATE = PromptTemplate(
+    "npc_talk",
+    system=[
+        TALK_INSTRUCTIONS,
+        Section("The NPC is named {name}. Description: {description}", cut="description", priority=1,
+                min_chars=300),
+    ],
+    sections=[
+        Section("Conversation and event history: {history} ", cut="history", keep="tail", min_chars=200),
+        Section("And the current thing the player is saying is: {line}", cut="line", priority=2, min_chars=200),
+    ],
+)
+
+ALLOW_PASS_TEMPLATE = PromptTemplate("allow_pass", [
+    Section("Based on the conversation: {history} ", cut="history", keep="tail", min_chars=200),
+    Section("And the player wants to go past the npc with friendlynes {friendlyness} out of 100"),
+    " Do you allow the player to pass? Don't let them pass unless they've had a good"
+    " conversation with you, or if you've said they could pass it's okay. Don't be too"
+    " difficult to get past, be simple. Answer with one word, yes or no",
+])
+
+# Bribe narrations: only the NPC description can run long.
+_BRIBE_NPC = Section("{npc} (described as: {description})", cut="description", min_chars=150)
+BRIBE_GOLD_ACCEPTED_TEMPLATE = PromptTemplate("bribe_narration", [
+    Section("Write one short paragraph describing {player} slipping {gold} gold to "), _BRIBE_NPC,
+    Section(" and {npc} accepting the bribe with a sly grin, agreeing to look the other way."
+            " Keep it in a fantasy/adventure tone matching the scene."),
+])
+BRIBE_GOLD_REFUSED_TEMPLATE = PromptTemplate("bribe_narration", [
+    Section("Write one short paragraph describing {player} trying to bribe "), _BRIBE_NPC,
+    Section(" with {gold} gold, and {npc} refusing — maybe insulted, maybe just unmoved."
+            " Keep it in a fantasy/adventure tone."
+            " The NPC's toughness is {toughness}/100 and friendliness is {friendlyness}/100."),
+])
+BRIBE_ITEM_ACCEPTED_TEMPLATE = PromptTemplate("bribe_narration", [
+    Section("Write one short paragraph describing {player} offering a {item} ({rarity} quality) to "),
+    _BRIBE_NPC,
+    Section(", and {npc} accepting it with interest, agreeing to let the player pass."
+            " Keep it in a fantasy/adventure tone."),
+])
+BRIBE_ITEM_REFUSED_TEMPLATE = PromptTemplate("bribe_narration", [
+    Section("Write one short paragraph describing {player} offering a {item} ({rarity} quality) to "),
+    _BRIBE_NPC,
+    Section(", and {npc} refusing — unimpressed or insulted by the offering."
+            " The NPC's toughness is {toughness}/100. Keep it in a fantasy/adventure tone."),
+])
+
+
+def _delete_npc_doc(npc_id):
+    mongo_id = ObjectId(npc_id) if not isinstance(npc_id, ObjectId) else npc_id
+    npc_collection.delete_one({"_id": mongo_id})
+
+
 class Humanoid:
     """
     Parent humanoid class. Default class to generate Player Characters as well as NPCs. Stores shared functions
@@ -561,39 +647,79 @@ class PlayerCharacter(Humanoid):
 
 
 class Npc(Humanoid):
-    def __init__(self, userId):
+    def __init__(self, userId, generate=True, bundle=None):
+        """
+        Roll a new NPC for the user's theme. With generate=False the name and description are
+        left empty so the caller (Room.generate_description) can generate them alongside the
+        room's own LLM calls. A room bundle (see room_bundle.get_room_bundle) supplies them
+        without extra calls; anything the bundle lacks is generated as usual.
+        """
         super().__init__()
         self._room_x = None
         self._room_y = None
         self._toughness = random.randint(1, 100)
         self._friendlyness = random.randint(1, 100)
-        theme = all_global_vars.get_player_character(userId).get_theme()
-        self._name = call_ai(
-            "Pick a name for A NPC with the theme " 
-            + str(theme)
-            + " that has a toughness of "
-            + str(self._toughness)
-            + " out of 100, with 100/100 being very tough"
-            + " and has a friendliness score where 100 is very friendly and 0 is very hostile of "
-            + str(self._friendlyness)
-            + " Just include the name by itself, don't put any other words in the response"
-        )
-
-        self._description = call_ai(
-            "Describe the NPC with the name " + self._name + "and the theme " 
-            + str(theme)
-            + " that has a toughness of " + str(self._toughness)
-            + " out of 100, with 100/100 being very tough"
-            + " and has a friendliness score where 100 is very friendly and 0 is very"
-            + " hostile of " + str(self._friendlyness)
-            + " Just write about a paragraph of plain text to describe the npc, like in a novel"
-        )
-
+        self._theme = all_global_vars.get_player_character(userId).get_theme()
+        self._name = None
+        self._description = None
         self._past_conversation = []
+        self._conversation_summary = ""
+        self._summary_pending = []
+        self._pass_granted = False
+        self._pass_record = None
+        self._quest_to_offer = None
+
+        if bundle:
+            self.apply_bundle(bundle)
+
+        if generate:
+            if not self._name:
+                self.generate_name()
+            if not self._description:
+                self.generate_description()
+
+    def apply_bundle(self, bundle):
+        """Fill in whichever of name/description this NPC lacks from a room bundle."""
+        if not bundle:
+            return
+        if not self._name and bundle.get("npc_name"):
+            # Library personas were written for their stats, so those come along with the name.
+            self._toughness = bundle.get("npc_toughness") or self._toughness
+            self._friendlyness = bundle.get("npc_friendlyness") or self._friendlyness
+            self._set_generated_name(bundle["npc_name"])
+        if not self._description and bundle.get("npc_description"):
+            self._description = bundle["npc_description"]
+
+    def generate_name(self, userId=None, deadline=None):
+        """
+        Name the NPC. If the provider is down or the call misses the command deadline, a stock
+        persona stands in (generate_description picks up its description); a late name is
+        dropped, since the room text may already mention the stand-in.
+        """
+        prompt = NPC_NAME_TEMPLATE.render(theme=self._theme, toughness=self._toughness,
+                                          friendlyness=self._friendlyness)
+        stock_name, _description = fallback_content.stock_persona(self._theme)
+        name, _late = call_by_deadline(userId, lambda: call_ai(prompt.text, site="npc_name"), stock_name,
+                                       site="npc_name", deadline=deadline)
+        self._set_generated_name(name)
+        return self._name
+
+    def _set_generated_name(self, name):
+        self._name = name
         # Each NPC starts with exactly one quest they can offer.
-        q_theme = theme or "fantasy"
+        q_theme = self._theme or "fantasy"
         self._quest_to_offer = create_random_quest(q_theme, self._name)
 
+    def generate_description(self, userId=None, deadline=None):
+        """Describe the NPC, falling back to the stock persona text like generate_name."""
+        prompt = NPC_DESCRIPTION_TEMPLATE.render(name=self._name, theme=self._theme, toughness=self._toughness,
+                                                 friendlyness=self._friendlyness)
+        self._description, _late = call_by_deadline(
+            userId, lambda: call_ai(prompt.text, site="npc_description"),
+            fallback_content.persona_description(self._theme, self._name),
+            site="npc_description", deadline=deadline)
+        return self._description
+
     def set_room(self, x_pos, y_pos):
         self._room_x = x_pos
         self._room_y = y_pos
@@ -696,22 +822,19 @@ class Npc(Humanoid):
         }
 
     def talk(self, userId, talk_string):
-        call_string = "For the NPC named " + self._name + " with the description " + self._description
-        call_string += (
-            " Respond in-character and reflect the relationship so far. "
-            "If the player has attacked, wounded, defended against, or fled from this NPC, "
-            "the NPC should remember that and react with appropriate fear, anger, caution, respect, "
-            "or grudging restraint based on their personality. "
-        )
-        call_string += "Conversation and event history: "
-        for line in (self._past_conversation or []):
-            call_string += line + " "
-        call_string += "And the current thing they're saying is: " + talk_string
-        call_string += "Say just the response text you'd say in a conversation as that npc, nothing else"
-        response = call_ai(call_string)
-        self._past_conversation.append(talk_string)
-        self._past_conversation.append(response)
-        self.update_npc(self._id, {"conversations": self._past_conversation})
+        # Instructions and persona form the cached prefix; only history and the new line vary.
+        prompt = TALK_TEMPLATE.render(name=self._name, description=self._description,
+                                      history=npc_memory.history_for_prompt(self), line=talk_string)
+        # Said while a late reply is on its way; swapped out of the NPC's memory when it arrives.
+        fallback = "Hmm. Give me a moment to think on that."
+        response, late = call_by_deadline(
+            userId, lambda: call_ai(prompt.text, stream=True, site="npc_talk", system=prompt.system),
+            fallback, site="npc_talk")
+        npc_memory.remember(self, talk_string, response)
+        self._queue_memory_write(userId)
+        if late is not None:
+            late.when_ready(lambda text: self._fill_reply(userId, fallback, text))
+            response = late.placeholder(response)
 
         from xp import award_xp
         award_xp(userId, 25)
@@ -730,12 +853,9 @@ class Npc(Humanoid):
             if not already_have:
                 try:
                     pc.add_quest(quest)
-                    # Persist the updated quest log immediately.
-                    from user_db import get_user_by_id
-                    user_doc = get_user_by_id(userId)
-                    char_id = user_doc.get("_player_character_id") if user_doc else None
-                    if char_id:
-                        pc.update_player_character(char_id)
+                    # Persist the updated quest log.
+                    from xp import save_character
+                    job_queue.enqueue(userId, save_character, userId, pc, key="character")
                 except Exception as e:
                     print("Warning: failed to add quest to player log:", e)
                 else:
@@ -760,31 +880,43 @@ class Npc(Humanoid):
             history = list(self._past_conversation or [])
         except Exception:
             history = []
-        history_text = " ".join(str(x) for x in history).lower()
-        if (
-            "agreeing to let them pass" in history_text
-            or "steps aside. you may pass" in history_text
-            or "was allowed" in history_text
-        ):
+        if getattr(self, "_pass_granted", False) or any(npc_memory.grants_pass(x) for x in history):
             return True
 
-        call_string = "Based on the conversation: "
-        for line in self._past_conversation:
-            call_string += line + " "
-        call_string += f"And the player wants to go past the npc with friendlynes {self._friendlyness} out of 100"
-        call_string += (" Do you allow the player to pass? Don't let them pass unless they've had a good" +
-                        " conversation with you, or if you've said they could pass it's okay. Don't be too" +
-                        " difficult to get past, be simple. Answer with one word, yes or no")
+        # Repeated attempts with nothing new said get the same answer without re-deciding.
+        memo = getattr(self, "_pass_memo", None)
+        if memo is not None and memo[0] == npc_memory.conversation_length(self):
+            print("Pass decision memoised: " + str(memo[1]))
+            return memo[1]
+
+        score = npc_rules.pass_score(self._friendlyness, getattr(self, "_toughness", 0),
+                                     self._interaction_modifiers(userId), npc_memory.pass_record(self))
+        allowed = npc_rules.decide_pass(score)
+        print(f"Pass score {score}, rule decision: {allowed}")
+        if allowed is None:
+            allowed = self._ask_allow_pass()
+
+        if allowed:
+            npc_memory.remember(
+                self, "Note: The player tried to go past the npc to exit the room here and was allowed")
+        else:
+            npc_memory.remember(
+                self, "Note: The player tried to go past the npc to exit the room here and was blocked")
+        self._pass_memo = (npc_memory.conversation_length(self), allowed)
+        return allowed
+
+    def _ask_allow_pass(self):
+        """Let the model decide a pass attempt whose score fell in the ambiguous band."""
+        prompt = ALLOW_PASS_TEMPLATE.render(history=npc_memory.history_for_prompt(self),
+                                            friendlyness=self._friendlyness)
         print("Calling AI")
-        response = call_ai(call_string)
+        try:
+            response = call_ai(prompt.text, site="allow_pass")
+        except CircuitOpenError:
+            # Provider is down: friendly NPCs wave the player through.
+            return self._friendlyness >= 50
         print("Got response: " + str(response))
-        if response.strip().lower().startswith("no"):
-            self._past_conversation.append(
-                "Note: The player tried to go past the npc to exit the room here and was blocked")
-            return False
-        self._past_conversation.append(
-            "Note: The player tried to go past the npc to exit the room here and was allowed")
-        return True
+        return not response.strip().lower().startswith("no")
 
     def bribe(self, userId, gold_amount):
         player_char = all_global_vars.get_player_character(userId)
@@ -806,28 +938,42 @@ class Npc(Humanoid):
         print(f"Bribe: offered={gold_amount}, toughness={self._toughness}, cha={cha}, chance={chance}%, roll={roll}, success={success}")
 
         if success:
-            self._past_conversation.append(
+            npc_memory.remember(
+                self,
                 f"Note: The player bribed the NPC with {gold_amount} gold and the NPC accepted, agreeing to let them pass."
             )
-            self.update_npc(self._id, {"conversations": self._past_conversation})
-            narrative = call_ai(
-                f"Write one short paragraph describing {player_char._name} slipping {gold_amount} gold to {self._name} "
-                f"(described as: {self._description}) and {self._name} accepting the bribe with a sly grin, "
-                f"agreeing to look the other way. Keep it in a fantasy/adventure tone matching the scene."
+            self._queue_memory_write(userId)
+            narrative = narrate_by_deadline(
+                userId,
+                lambda: call_ai(
+                    BRIBE_GOLD_ACCEPTED_TEMPLATE.render(player=player_char._name, gold=gold_amount, npc=self._name,
+                                                        description=self._description).text,
+                    stream=True,
+                    site="bribe_narration",
+                ),
+                f"{player_char._name} slips {gold_amount} gold to {self._name}, who pockets it with a sly grin.",
+                site="bribe_narration",
             )
             from xp import award_xp
             award_xp(userId, 150)
             return narrative + f"<BR>{self._name} pockets the gold and steps aside. You may pass."
         else:
-            self._past_conversation.append(
+            npc_memory.remember(
+                self,
                 f"Note: The player attempted to bribe the NPC with {gold_amount} gold but the NPC refused."
             )
-            self.update_npc(self._id, {"conversations": self._past_conversation})
-            narrative = call_ai(
-                f"Write one short paragraph describing {player_char._name} trying to bribe {self._name} "
-                f"(described as: {self._description}) with {gold_amount} gold, and {self._name} refusing — "
-                f"maybe insulted, maybe just unmoved. Keep it in a fantasy/adventure tone. "
-                f"The NPC's toughness is {self._toughness}/100 and friendliness is {self._friendlyness}/100."
+            self._queue_memory_write(userId)
+            narrative = narrate_by_deadline(
+                userId,
+                lambda: call_ai(
+                    BRIBE_GOLD_REFUSED_TEMPLATE.render(player=player_char._name, gold=gold_amount, npc=self._name,
+                                                       description=self._description, toughness=self._toughness,
+                                                       friendlyness=self._friendlyness).text,
+                    stream=True,
+                    site="bribe_narration",
+                ),
+                f"{self._name} weighs the {gold_amount} gold, then shakes their head.",
+                site="bribe_narration",
             )
             return narrative + f"<BR>{self._name} keeps your {gold_amount} gold and blocks your path. (You had a {chance}% chance.)"
 
@@ -855,29 +1001,44 @@ class Npc(Humanoid):
         print(f"Item bribe: item={item_display}, value={item_value}, toughness={self._toughness}, cha={cha}, chance={chance}%, roll={roll}, success={success}")
 
         if success:
-            self._past_conversation.append(
-                f"Note: The player bribed the NPC with a {item_display} ({item_rarity}) and the NPC accepted, agreeing to let them pass."
+            npc_memory.remember(
+                self,
+                f"Note: The player bribed the NPC with a {item_display} ({item_rarity}, worth {item_value} gold) and the NPC accepted, agreeing to let them pass."
             )
-            self.update_npc(self._id, {"conversations": self._past_conversation})
-            narrative = call_ai(
-                f"Write one short paragraph describing {player_char._name} offering a {item_display} "
-                f"({item_rarity} quality) to {self._name} (described as: {self._description}), "
-                f"and {self._name} accepting it with interest, agreeing to let the player pass. "
-                f"Keep it in a fantasy/adventure tone."
+            self._queue_memory_write(userId)
+            narrative = narrate_by_deadline(
+                userId,
+                lambda: call_ai(
+                    BRIBE_ITEM_ACCEPTED_TEMPLATE.render(player=player_char._name, item=item_display,
+                                                        rarity=item_rarity, npc=self._name,
+                                                        description=self._description).text,
+                    stream=True,
+                    site="bribe_narration",
+                ),
+                f"{player_char._name} offers the {item_display} to {self._name}, who accepts it with interest.",
+                site="bribe_narration",
             )
             from xp import award_xp
             award_xp(userId, 150)
             return narrative + f"<BR>{self._name} takes the {item_display} and steps aside. You may pass."
         else:
-            self._past_conversation.append(
-                f"Note: The player tried to bribe the NPC with a {item_display} but the NPC refused and kept it."
+            npc_memory.remember(
+                self,
+                f"Note: The player tried to bribe the NPC with a {item_display} (worth {item_value} gold) but the NPC refused and kept it."
             )
-            self.update_npc(self._id, {"conversations": self._past_conversation})
-            narrative = call_ai(
-                f"Write one short paragraph describing {player_char._name} offering a {item_display} "
-                f"({item_rarity} quality) to {self._name} (described as: {self._description}), "
-                f"and {self._name} refusing — unimpressed or insulted by the offering. "
-                f"The NPC's toughness is {self._toughness}/100. Keep it in a fantasy/adventure tone."
+            self._queue_memory_write(userId)
+            narrative = narrate_by_deadline(
+                userId,
+                lambda: call_ai(
+                    BRIBE_ITEM_REFUSED_TEMPLATE.render(player=player_char._name, item=item_display,
+                                                       rarity=item_rarity, npc=self._name,
+                                                       description=self._description,
+                                                       toughness=self._toughness).text,
+                    stream=True,
+                    site="bribe_narration",
+                ),
+                f"{self._name} takes the {item_display} but makes no move to step aside.",
+                site="bribe_narration",
             )
             return narrative + f"<BR>{self._name} keeps your {item_display} and blocks your path. (You had a {chance}% chance.)"
 
@@ -912,7 +1073,7 @@ class Npc(Humanoid):
             combat_note += f"{self._name} was defeated. "
         if result["player_defeated"]:
             combat_note += "The player was defeated. "
-        self._past_conversation.append(combat_note)
+        npc_memory.remember(self, combat_note)
 
         if result["npc_defeated"]:
             old_npc_id = getattr(cur_room, "_npc_id", None)
@@ -921,37 +1082,26 @@ class Npc(Humanoid):
             cur_room._npc_id = None
 
             if getattr(cur_room, "_id", None) is not None:
-                cur_room.update_room(cur_room._id, {"_npc_id": None})
+                job_queue.enqueue(userId, cur_room.update_room, cur_room._id, {"_npc_id": None})
 
             if old_npc_id is not None:
-                try:
-                    mongo_id = ObjectId(old_npc_id) if not isinstance(old_npc_id, ObjectId) else old_npc_id
-                    npc_collection.delete_one({"_id": mongo_id})
-                except Exception as e:
-                    print("Warning: failed to delete npc doc:", e)
+                job_queue.enqueue(userId, _delete_npc_doc, old_npc_id)
 
             try:
                 player_char.record_enemy_kill(1)
             except AttributeError:
                 pass
         elif getattr(self, "_id", None) is not None:
-            self.update_npc(self._id, {
-                "health": self._health,
-                "conversations": self._past_conversation,
-            })
-
-        fight_response = call_ai(
-            "Write one short paragraph narrating this text-adventure combat turn. "
-            + f"The player is {player_char._name}. The NPC is {self._name}. "
-            + f"The NPC description is {self._description}. "
-            + f"The player chose {action_text}. "
-            + f"Player dealt {result['player_damage']} damage. "
-            + f"NPC dealt {result['npc_damage']} damage. "
-            + f"Player HP is {result['player_health']}/{result['player_max_health']}. "
-            + f"NPC HP is {result['npc_health']}/{result['npc_max_health']}. "
-            + f"NPC defeated: {result['npc_defeated']}. Player defeated: {result['player_defeated']}. "
-            + f"Player fled: {result['fled']}. "
-            + "Do not decide new mechanics; only narrate these facts."
+            self._queue_memory_write(userId, health=self._health)
+
+        fight_response = combat_narration.narrate_turn(
+            userId,
+            result,
+            player_char._name,
+            self._name,
+            theme=player_char.get_theme(),
+            npc_description=self._description,
+            action_text=action_text,
         )
 
         status = (
@@ -994,7 +1144,8 @@ class Npc(Humanoid):
             "y_pos": self._room_y,
             "toughness": self._toughness,
             "friendlyness": self._friendlyness,
-            "conversations": self._past_conversation,
+            "theme": getattr(self, "_theme", None),
+            **npc_memory.memory_fields(self),
             "created_at": datetime.now(),
         }
 
@@ -1032,12 +1183,23 @@ class Npc(Humanoid):
         npc._room_y = character_doc.get("y_pos")
         npc._toughness = character_doc.get("toughness")
         npc._friendlyness = character_doc.get("friendlyness")
-        npc._past_conversation = character_doc.get("conversations") or []
+        npc._theme = character_doc.get("theme")
+        npc_memory.load_memory(npc, character_doc)
         # Quests are generated when the NPC is first created; rehydrated NPCs simply
         # have no pending quest to offer unless new logic adds it later.
         npc._quest_to_offer = None
         return npc
 
+    def _fill_reply(self, userId, fallback, text):
+        """Swap a late talk reply in for the fallback line remembered in its place."""
+        npc_memory.replace_line(self, fallback, text)
+        self._queue_memory_write(userId)
+
+    def _queue_memory_write(self, userId, **fields):
+        """Persist the NPC's memory (plus any extra fields) in the background, after the user's earlier writes."""
+        job_queue.enqueue(userId, self.update_npc, self._id, {**fields, **npc_memory.memory_fields(self)},
+                          name="update_npc")
+
     def update_npc(self, npc_id, updates):
         """
         Updates an NPC doc by npc_id with the given updates (dict of field: value).
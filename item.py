@@ -3,6 +3,7 @@ import random
 from all_global_vars import all_global_vars
 from typing import Any, Dict
 from open_ai_api import call_ai
+from prompt_templates import PromptTemplate, Section
 
 
 # Canonical item types used across the game (see `humanoid.Humanoid.equip`).
@@ -43,19 +44,26 @@ ITEM_PROMPT = (
 )
 
 
+# The room description is the only part that can run long; it is cut to the "items" budget.
+ITEM_TEMPLATE = PromptTemplate("items", [
+    ITEM_PROMPT,
+    "\nSCHEMA=" + json.dumps(ITEM_SCHEMA_EXAMPLE),
+    Section("\nTHEME={theme}\nROOM TYPE={room_identity}"),
+    Section("\nROOM DESCRIPTION={room_description}", cut="room_description", min_chars=200),
+    "\nJSON:",
+])
+
+
 # AI Item Generation
 def _build_item_prompt(theme, room_description, room_identity):
     """
     Prompt setup, similar to room generation prompt, for AI to generate items for a given room.
     """
-    return (
-        ITEM_PROMPT
-        + "\nSCHEMA=" + json.dumps(ITEM_SCHEMA_EXAMPLE)
-        + "\nTHEME=" + theme
-        + "\nROOM TYPE=" + (room_identity or "general")
-        + "\nROOM DESCRIPTION=" + (room_description or "a dimly lit room")
-        + "\nJSON:"
-    )
+    return ITEM_TEMPLATE.render(
+        theme=theme,
+        room_identity=room_identity or "general",
+        room_description=room_description or "a dimly lit room",
+    ).text
 
 
 def _validate_ai_items(item):
@@ -124,13 +132,14 @@ def _validate_ai_items(item):
     return valid_item
 
 
-def get_ai_items(theme: str, room_description: str, room_identity: str, random_seed):
+def get_ai_items(theme: str, room_description: str, room_identity: str, rng):
     """
-    Prompt GenAI to create 1-3 items to be placed into the given room.
+    Prompt GenAI to create 1-3 items to be placed into the given room. rng (a random.Random, or
+    a seed for one) drives the fallback items.
     """
     prompt = _build_item_prompt(theme or "Unknown", room_description or "Unknown", room_identity or "Unknown")
     try:
-        raw = call_ai(prompt)
+        raw = call_ai(prompt, site="items")
         # Try to extract JSON
         raw = raw.strip()
         # If wrapped in code fences, remove them
@@ -158,14 +167,17 @@ def get_ai_items(theme: str, room_description: str, room_identity: str, random_s
     except Exception:
         print("Error pulling AI items, resorting to default item generation")
         # Fallback default layout
-        def_items = default_items(theme, random_seed)
+        def_items = default_items(theme, rng)
         return def_items
 
-def default_items(theme, seed_value):
+def default_items(theme, rng):
     """
     Default fallback option for generating items in case the GenAI fails to properly create items.
+    rng is a random.Random or a seed for one; the global random module is left alone, since
+    rooms are generated on prefetch threads too.
     """
-    random.seed(seed_value)
+    if not isinstance(rng, random.Random):
+        rng = random.Random(rng)
 
     if "cyber" in theme:
         base_items = [
@@ -216,7 +228,7 @@ def default_items(theme, seed_value):
     ]
 
     def pick_rarity():
-        r = random.random()
+        r = rng.random()
         acc = 0.0
         for name, prob in rarity_table:
             acc += prob
@@ -232,10 +244,10 @@ def default_items(theme, seed_value):
             "Epic": (150, 400),
             "Legendary": (500, 1200),
         }.get(rarity, (1, 8))
-        return random.randint(*base)
+        return rng.randint(*base)
 
-    item_count = random.randint(2, 4)
-    chosen = random.sample(base_items, item_count)
+    item_count = rng.randint(2, 4)
+    chosen = rng.sample(base_items, item_count)
     items = []
     for name, item_type, desc in chosen:
         rarity = pick_rarity()
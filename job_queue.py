@@ -0,0 +1,156 @@
+# Background queue for database writes the player doesn't need to wait for (character saves,
+# room persistence, NPC updates, deleting defeated NPCs). Jobs for one user run in the order
+# they were queued, one at a time; different users are handled in parallel by a small worker
+# pool. Failed jobs are retried with backoff. flush() waits for a user's pending writes (before
+# anything that reads them back), and the queue is drained when the process exits.
+import atexit
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+
+from metrics import metrics_registry
+
+load_dotenv()
+
+metrics_registry.describe("jobs_enqueued_total", "Background jobs queued, by job name")
+metrics_registry.describe("jobs_coalesced_total", "Queued jobs replaced by a newer job with the same key")
+metrics_registry.describe("jobs_retries_total", "Background job retries, by job name")
+metrics_registry.describe("jobs_failed_total", "Background jobs dropped after their last attempt")
+metrics_registry.describe("job_queue_depth", "Background jobs waiting or running")
+metrics_registry.describe("job_seconds", "Background job run time, by job name")
+
+
+def background_jobs_enabled():
+    return os.getenv("JOB_QUEUE_ENABLED", "true").strip().lower() in ("1", "true", "yes", "on")
+
+
+def _env_int(name, default):
+    try:
+        return max(1, int(os.getenv(name, default)))
+    except (TypeError, ValueError):
+        return default
+
+
+class _Job:
+    def __init__(self, name, fn, args, kwargs, key):
+        self.name = name
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.key = key
+
+
+class JobQueue:
+    """Per-user FIFO job lanes served by a shared worker pool."""
+
+    def __init__(self, max_workers=None, max_attempts=None, base_delay=0.2, sleep=time.sleep):
+        self._max_workers = max_workers or _env_int("JOB_QUEUE_WORKERS", 4)
+        self.max_attempts = max_attempts or _env_int("JOB_QUEUE_MAX_ATTEMPTS", 3)
+        self.base_delay = base_delay
+        self._sleep = sleep
+        self._executor = None
+        self._lock = threading.Condition()
+        self._lanes = {}  # userId -> deque of _Job not yet started
+        self._active = set()  # userIds with a worker draining their lane
+        self._pending = 0
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self._max_workers,
+                                                thread_name_prefix="job-queue")
+        return self._executor
+
+    def enqueue(self, userId, fn, *args, name=None, key=None, **kwargs):
+        """
+        Run fn(*args, **kwargs) in the background after the user's earlier jobs. A job with the
+        same key as one still waiting replaces it (for writes that save the latest full state).
+        With JOB_QUEUE_ENABLED off the job runs immediately in the caller's thread.
+        """
+        name = name or getattr(fn, "__name__", "job")
+        if not background_jobs_enabled():
+            fn(*args, **kwargs)
+            return
+        job = _Job(name, fn, args, kwargs, key)
+        metrics_registry.inc("jobs_enqueued_total", {"job": name})
+        with self._lock:
+            lane = self._lanes.setdefault(userId, deque())
+            if key is not None:
+                for i, queued in enumerate(lane):
+                    if queued.key == key:
+                        del lane[i]
+                        self._pending -= 1
+                        metrics_registry.inc("jobs_coalesced_total", {"job": name})
+                        break
+            lane.append(job)
+            self._pending += 1
+            metrics_registry.set_gauge("job_queue_depth", self._pending)
+            if userId not in self._active:
+                self._active.add(userId)
+                self._get_executor().submit(self._drain_lane, userId)
+
+    def _drain_lane(self, userId):
+        while True:
+            with self._lock:
+                lane = self._lanes.get(userId)
+                if not lane:
+                    self._lanes.pop(userId, None)
+                    self._active.discard(userId)
+                    self._lock.notify_all()
+                    return
+                job = lane.popleft()
+            try:
+                self._run(job)
+            finally:
+                with self._lock:
+                    self._pending -= 1
+                    metrics_registry.set_gauge("job_queue_depth", self._pending)
+                    self._lock.notify_all()
+
+    def _run(self, job):
+        for attempt in range(1, self.max_attempts + 1):
+            started = time.monotonic()
+            try:
+                job.fn(*job.args, **job.kwargs)
+                metrics_registry.observe("job_seconds", time.monotonic() - started, {"job": job.name})
+                return True
+            except Exception as e:
+                if attempt >= self.max_attempts:
+                    metrics_registry.inc("jobs_failed_total", {"job": job.name})
+                    print(f"Background job {job.name} failed after {attempt} attempts:", e)
+                    return False
+                metrics_registry.inc("jobs_retries_total", {"job": job.name})
+                self._sleep(self.base_delay * (2 ** (attempt - 1)))
+
+    def flush(self, userId=None, timeout=None):
+        """Wait until the user's jobs (or every job, for None) have run. False on timeout."""
+        give_up_at = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            while (userId in self._active) if userId is not None else self._pending:
+                remaining = None if give_up_at is None else give_up_at - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._lock.wait(remaining)
+        return True
+
+    def pending(self):
+        """Jobs waiting or running, across all users."""
+        with self._lock:
+            return self._pending
+
+    def shutdown(self, timeout=30):
+        """Drain outstanding jobs, then stop the workers."""
+        drained = self.flush(timeout=timeout)
+        if not drained:
+            print(f"Job queue shutdown: {self.pending()} jobs still pending")
+        if self._executor is not None:
+            self._executor.shutdown(wait=drained)
+            self._executor = None
+        return drained
+
+
+job_queue = JobQueue()
+atexit.register(job_queue.shutdown)
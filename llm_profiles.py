@@ -0,0 +1,118 @@
+# Generation settings per call site. call_ai looks up its `site` here for the model, max_tokens,
+# temperature, stop sequences and request timeout, so a one-word yes/no or an NPC name doesn't
+# reserve the same 1024 tokens and long timeout as a room description. "prompt_budget" is the
+# estimated prompt size (tokens) prompt_templates.py trims that site's prompts down to.
+#
+# Built-in profiles can be overridden (or new sites added) with a JSON file named by
+# LLM_PROFILES_FILE, e.g. {"default": {"model": "..."}, "allow_pass": {"max_tokens": 4}}.
+# Fields left out of an override keep their built-in value.
+import json
+import os
+import threading
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+PROFILE_FIELDS = ("model", "max_tokens", "temperature", "stop", "timeout", "prompt_budget")
+
+DEFAULT_CLAUDE_MODEL = "claude-haiku-4-5-20251001"
+
+DEFAULT_PROFILE = {
+    "model": os.getenv("CLAUDE_MODEL", DEFAULT_CLAUDE_MODEL),
+    "max_tokens": 1024,
+    "temperature": None,  # None leaves the provider default
+    "stop": None,
+    "timeout": None,  # seconds; None leaves the client default
+    "prompt_budget": 2000,  # estimated prompt tokens; not sent to the provider
+}
+
+# JSON answers (items, map_layout, room_bundle, content_library) and room descriptions keep the default generation
+# settings; items, map_layout and room_bundle only get a tighter prompt budget.
+BUILTIN_PROFILES = {
+    "allow_pass": {"max_tokens": 8, "temperature": 0.0, "timeout": 10, "prompt_budget": 800},
+    "npc_name": {"max_tokens": 24, "timeout": 10},
+    "npc_description": {"max_tokens": 400, "timeout": 30},
+    "npc_talk": {"max_tokens": 400, "timeout": 30, "prompt_budget": 1500},
+    "bribe_narration": {"max_tokens": 350, "timeout": 30, "prompt_budget": 400},
+    "combat_narration": {"max_tokens": 350, "timeout": 30},
+    "interact_narration": {"max_tokens": 300, "timeout": 30, "prompt_budget": 200},
+    "items": {"prompt_budget": 600},
+    "map_layout": {"prompt_budget": 900},
+    "room_bundle": {"prompt_budget": 500},
+    # Pool top-ups resend one prompt per key; a high temperature keeps the variants apart.
+    "interact_narration_pool": {"max_tokens": 300, "temperature": 1.0},
+    "npc_memory_summary": {"max_tokens": 300, "temperature": 0.3},
+    "health_probe": {"max_tokens": 1, "timeout": 10},
+    "room_touch_up": {"max_tokens": 120, "timeout": 15, "prompt_budget": 400},
+}
+
+_lock = threading.Lock()
+_profiles = None
+
+
+def _read_overrides():
+    path = os.getenv("LLM_PROFILES_FILE")
+    if not path:
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            overrides = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Warning: could not load LLM profiles from {path}:", e)
+        return {}
+    if not isinstance(overrides, dict):
+        print(f"Warning: LLM profiles file {path} must hold a JSON object")
+        return {}
+    return overrides
+
+
+def _clean(fields):
+    """Keep only known profile fields, dropping anything unrecognised."""
+    if not isinstance(fields, dict):
+        return {}
+    return {k: v for k, v in fields.items() if k in PROFILE_FIELDS}
+
+
+def load_profiles():
+    """Built-in profiles merged with the overrides file; "default" applies under every site."""
+    overrides = _read_overrides()
+    default = dict(DEFAULT_PROFILE)
+    default.update(_clean(overrides.get("default")))
+    profiles = {"default": default}
+    for site in set(BUILTIN_PROFILES) | set(overrides):
+        if site == "default":
+            continue
+        profile = dict(default)
+        profile.update(_clean(BUILTIN_PROFILES.get(site)))
+        profile.update(_clean(overrides.get(site)))
+        profiles[site] = profile
+    return profiles
+
+
+def reload_profiles():
+    global _profiles
+    with _lock:
+        _profiles = load_profiles()
+        return _profiles
+
+
+def get_profile(site):
+    """The generation profile for a call site, or the default profile for unknown sites."""
+    global _profiles
+    with _lock:
+        if _profiles is None:
+            _profiles = load_profiles()
+        return dict(_profiles.get(site) or _profiles["default"])
+
+
+def request_options(profile):
+    """Keyword arguments for messages.create / messages.stream built from a profile."""
+    options = {"model": profile["model"], "max_tokens": int(profile["max_tokens"])}
+    if profile.get("temperature") is not None:
+        options["temperature"] = float(profile["temperature"])
+    if profile.get("stop"):
+        options["stop_sequences"] = list(profile["stop"])
+    if profile.get("timeout") is not None:
+        options["timeout"] = float(profile["timeout"])
+    return options
@@ -7,6 +7,8 @@ from all_global_vars import all_global_vars
 from humanoid import Npc
 import hello
 from quests import format_quest_for_display
+from job_queue import job_queue
+from xp import save_character
 
 # Sorted longest-first so multi-word phrases are matched before single words.
 _INTERACT_VERBS = sorted([
@@ -79,15 +81,11 @@ def _brief_room_view(room_array, userId):
     return "<BR>".join(parts)
 
 def _persist_character(userId, player_char):
-    from user_db import get_user_by_id
-    user_doc = get_user_by_id(userId)
-    if user_doc:
-        char_id = user_doc.get("_player_character_id")
-    else:
-        char_id = None
+    # Saves the character's latest state in the background; a newer save replaces a queued one.
+    job_queue.enqueue(userId, save_character, userId, player_char, key="character")
 
-    if char_id:
-        player_char.update_player_character(char_id)
+def _persist_room(userId, room_array, player_char):
+    job_queue.enqueue(userId, room_array.persist_room, userId, player_char, key="rooms")
 
 def do_main_loop(userInput, userId):
     userInput = userInput.lower()
@@ -187,12 +185,8 @@ def do_main_loop(userInput, userId):
                     gold_msg = f"You picked up {info} (+{picked.get('value', 1)} gold).<BR>"
                 else:
                     gold_msg = f"You picked up {info}.<BR>"
-                room_array.persist_room(userId, player_char)
-                from user_db import get_user_by_id
-                user_doc = get_user_by_id(userId)
-                char_id = user_doc.get("_player_character_id") if user_doc else None
-                if char_id:
-                    player_char.update_player_character(char_id)
+                _persist_room(userId, room_array, player_char)
+                _persist_character(userId, player_char)
                 refreshed = _brief_room_view(room_array, userId)
                 return gold_msg + refreshed
             return info + "<BR>"
@@ -204,13 +198,8 @@ def do_main_loop(userInput, userId):
             return "Specify what to drop.<BR>"
         success, info = room_array.drop_item(userId, item, player_char)
         if success:
-            room_array.persist_room(userId, player_char)
-            from user_db import get_user_by_id
-
-            user_doc = get_user_by_id(userId)
-            char_id = user_doc.get("_player_character_id") if user_doc else None
-            if char_id:
-                player_char.update_player_character(char_id)
+            _persist_room(userId, room_array, player_char)
+            _persist_character(userId, player_char)
             refreshed = _brief_room_view(room_array, userId)
             return f"You dropped {info}.<BR>{refreshed}"
         return info + "<BR>"
@@ -223,7 +212,7 @@ def do_main_loop(userInput, userId):
             okay_to_move, npc_response = check_direction_for_npc(userId, room_array)
         if okay_to_move:
             response = room_array.move_north(userId)
-            room_array.persist_room(userId, all_global_vars.get_player_character(userId))
+            _persist_room(userId, room_array, all_global_vars.get_player_character(userId))
             return (npc_response + "<BR>" + response) if npc_response else response
         else:
             return npc_response
@@ -234,7 +223,7 @@ def do_main_loop(userInput, userId):
             okay_to_move, npc_response = check_direction_for_npc(userId, room_array)
         if okay_to_move:
             response = room_array.move_south(userId)
-            room_array.persist_room(userId, all_global_vars.get_player_character(userId))
+            _persist_room(userId, room_array, all_global_vars.get_player_character(userId))
             return (npc_response + "<BR>" + response) if npc_response else response
         else:
             return npc_response
@@ -245,7 +234,7 @@ def do_main_loop(userInput, userId):
             okay_to_move, npc_response = check_direction_for_npc(userId, room_array)
         if okay_to_move:
             response = room_array.move_east(userId)
-            room_array.persist_room(userId, all_global_vars.get_player_character(userId))
+            _persist_room(userId, room_array, all_global_vars.get_player_character(userId))
             return (npc_response + "<BR>" + response) if npc_response else response
         else:
             return npc_response
@@ -256,7 +245,7 @@ def do_main_loop(userInput, userId):
             okay_to_move, npc_response = check_direction_for_npc(userId, room_array)
         if okay_to_move:
             response = room_array.move_west(userId)
-            room_array.persist_room(userId, all_global_vars.get_player_character(userId))
+            _persist_room(userId, room_array, all_global_vars.get_player_character(userId))
             return (npc_response + "<BR>" + response) if npc_response else response
         else:
             return npc_response
@@ -318,7 +307,7 @@ def do_main_loop(userInput, userId):
 
         moved, message = room_array.move_current_room_npc(userId, direction=direction)
         if moved:
-            room_array.persist_room(userId, all_global_vars.get_player_character(userId))
+            _persist_room(userId, room_array, all_global_vars.get_player_character(userId))
         return message + "<BR>"
     if userInput.startswith("version"):
         return all_global_vars.get_version(userId)
@@ -0,0 +1,210 @@
+# Cache of rendered room maps. A map is a pure function of a handful of inputs (theme, interior
+# type, room shape, exits, item markers and the layout seed), so renders are keyed on a hash of
+# those and shared: an in-memory LRU in front of a store every worker can see, either a
+# directory (MAP_CACHE_STORE=disk, the default) or Mongo GridFS (MAP_CACHE_STORE=gridfs).
+# Keys are content addresses, so entries never go stale; bumping RENDER_VERSION when the
+# drawing code changes moves every room to a fresh key. Room pages keep a map's URL for as long
+# as the room is shown, so a second, much smaller cache (render_inputs) keeps what each key was
+# drawn from: a PNG that has been evicted is simply drawn again.
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from dotenv import load_dotenv
+
+from metrics import metrics_registry
+
+load_dotenv()
+
+# Part of every key: change it whenever map_generator draws differently.
+RENDER_VERSION = 3
+
+metrics_registry.describe("map_cache_requests_total",
+                          "Room map cache lookups by cache (render, base_layer, scene, render_inputs) and layer (memory, store, miss)")
+
+
+def _env_int(name, default):
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def map_cache_enabled():
+    return os.getenv("MAP_CACHE_ENABLED", "true").strip().lower() in ("1", "true", "yes", "on")
+
+
+def is_render_key(key):
+    return isinstance(key, str) and len(key) == 64 and all(c in "0123456789abcdef" for c in key)
+
+
+def render_key(**inputs):
+    """Content address for a render: hash of every input that affects the image."""
+    raw = json.dumps([RENDER_VERSION, inputs], sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class DiskStore:
+    """Files (PNGs unless told otherwise) under a directory, trimmed oldest-first to max_bytes."""
+
+    def __init__(self, directory=".map_cache", max_bytes=100 * 1024 * 1024, suffix=".png"):
+        self._directory = directory
+        self._max_bytes = max(0, int(max_bytes))
+        self._suffix = suffix
+
+    def _path(self, key):
+        return os.path.join(self._directory, key[:2], key + self._suffix)
+
+    def get(self, key):
+        try:
+            with open(self._path(key), "rb") as fh:
+                return fh.read()
+        except OSError:
+            return None
+
+    def put(self, key, data):
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as fh:
+                fh.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print("Warning: failed to write map cache entry:", e)
+            return
+        self._trim()
+
+    def _trim(self):
+        files = []
+        total = 0
+        for root, _dirs, names in os.walk(self._directory):
+            for name in names:
+                if not name.endswith(self._suffix):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                files.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+        files.sort()
+        while files and total > self._max_bytes:
+            _mtime, size, path = files.pop(0)
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+
+class GridFSStore:
+    """Files (PNGs unless told otherwise) in a GridFS bucket, one per key; the client is created on first use."""
+
+    def __init__(self, uri=None, bucket="map_renders", content_type="image/png"):
+        self._uri = uri
+        self._bucket = bucket
+        self._content_type = content_type
+        self._fs = None
+        self._lock = threading.Lock()
+
+    def _gridfs(self):
+        with self._lock:
+            if self._fs is None:
+                import gridfs
+                from pymongo import MongoClient
+                db = MongoClient(self._uri or os.getenv('URI'))["dungeons_droids"]
+                self._fs = gridfs.GridFS(db, collection=self._bucket)
+            return self._fs
+
+    def get(self, key):
+        from pymongo.errors import PyMongoError
+        try:
+            doc = self._gridfs().find_one({"filename": key})
+            return doc.read() if doc is not None else None
+        except PyMongoError as e:
+            print("Warning: map cache read failed:", e)
+            return None
+
+    def put(self, key, data):
+        from pymongo.errors import PyMongoError
+        try:
+            fs = self._gridfs()
+            if not fs.exists({"filename": key}):
+                fs.put(data, filename=key, content_type=self._content_type)
+        except PyMongoError as e:
+            print("Warning: map cache write failed:", e)
+
+
+class MapCache:
+    """
+    Rendered map PNGs by render_key: memory LRU first, then the shared store. Without a store
+    it is a plain LRU, which map_generator also uses for its base layer images.
+    """
+
+    def __init__(self, store=None, max_memory_entries=256, name="render"):
+        self._store = store
+        self.name = name
+        self._max_memory_entries = max(1, int(max_memory_entries))
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        kind = os.getenv("MAP_CACHE_STORE", "disk").strip().lower()
+        if kind == "gridfs":
+            store = GridFSStore()
+        elif kind == "disk":
+            store = DiskStore(os.getenv("MAP_CACHE_DIR", ".map_cache"),
+                              _env_int("MAP_CACHE_MAX_DISK_MB", 100) * 1024 * 1024)
+        else:
+            store = None
+        return cls(store, _env_int("MAP_CACHE_MAX_ENTRIES", 256))
+
+    @classmethod
+    def inputs_from_env(cls):
+        """The render_inputs cache: JSON render inputs by key, in the same kind of store."""
+        kind = os.getenv("MAP_CACHE_STORE", "disk").strip().lower()
+        if kind == "gridfs":
+            store = GridFSStore(bucket="map_render_inputs", content_type="application/json")
+        elif kind == "disk":
+            store = DiskStore(os.path.join(os.getenv("MAP_CACHE_DIR", ".map_cache"), "inputs"),
+                              _env_int("MAP_CACHE_MAX_DISK_MB", 100) * 1024 * 1024, suffix=".json")
+        else:
+            store = None
+        return cls(store, _env_int("MAP_RENDER_INPUT_ENTRIES", 8192), name="render_inputs")
+
+    def get(self, key):
+        """The cached entry for key, or None."""
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                metrics_registry.inc("map_cache_requests_total", {"cache": self.name, "layer": "memory"})
+                return data
+        data = self._store.get(key) if self._store is not None else None
+        if data is None:
+            metrics_registry.inc("map_cache_requests_total", {"cache": self.name, "layer": "miss"})
+            return None
+        metrics_registry.inc("map_cache_requests_total", {"cache": self.name, "layer": "store"})
+        self._remember(key, data)
+        return data
+
+    def put(self, key, data):
+        self._remember(key, data)
+        if self._store is not None:
+            self._store.put(key, data)
+
+    def _remember(self, key, data):
+        with self._lock:
+            self._memory[key] = data
+            self._memory.move_to_end(key)
+            while len(self._memory) > self._max_memory_entries:
+                self._memory.popitem(last=False)
+
+
+map_cache = MapCache.from_env()
+render_inputs = MapCache.inputs_from_env()
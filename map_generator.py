@@ -1,9 +1,23 @@
 import io
+import os
 import base64
+import hashlib
+import json
 import random
 import math
+import numpy as np
 from PIL import Image, ImageDraw
 from ai_layout import get_map_layout
+from map_cache import MapCache, map_cache, map_cache_enabled, render_inputs, render_key
+
+MAP_WIDTH = 800
+MAP_HEIGHT = 600
+MAP_BACKGROUND = '#2a2520'
+
+# Base layers (RGBA, about 2 MB each) of recently drawn rooms, kept in memory only.
+base_layers = MapCache(max_memory_entries=int(os.getenv("MAP_BASE_LAYER_ENTRIES", "32")), name="base_layer")
+# JSON scenes (MAP_OUTPUT=scene) by render key; a few KB each.
+scenes = MapCache(name="scene")
 
 
 # ─── Classification helpers ───────────────────────────────────────────────────
@@ -60,7 +74,7 @@ def _get_wall_style(theme_lower, interior_type):
 
 # ─── Wall drawing functions ───────────────────────────────────────────────────
 
-def draw_stone_wall(draw, x1, y1, x2, y2, base_color, accent_color):
+def draw_stone_wall(draw, x1, y1, x2, y2, base_color, accent_color, rng):
     """Draw a textured stone wall."""
     x1, y1, x2, y2 = min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2)
     if x2 - x1 < 1 or y2 - y1 < 1:
@@ -68,12 +82,12 @@ def draw_stone_wall(draw, x1, y1, x2, y2, base_color, accent_color):
     draw.rectangle([x1, y1, x2, y2], fill=base_color, outline=accent_color, width=2)
     for i in range(int((x2 - x1) / 40)):
         for j in range(int((y2 - y1) / 40)):
-            sx = x1 + i * 40 + random.randint(-5, 5)
-            sy = y1 + j * 40 + random.randint(-5, 5)
+            sx = x1 + i * 40 + rng.randint(-5, 5)
+            sy = y1 + j * 40 + rng.randint(-5, 5)
             draw.rectangle([sx, sy, sx + 35, sy + 35], outline=accent_color, width=1)
 
 
-def draw_metal_wall(draw, x1, y1, x2, y2, base_color, accent_color):
+def draw_metal_wall(draw, x1, y1, x2, y2, base_color, accent_color, rng):
     """Draw a sci-fi metal panel wall with rivets and neon trim."""
     x1, y1, x2, y2 = min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2)
     if x2 - x1 < 1 or y2 - y1 < 1:
@@ -92,7 +106,7 @@ def draw_metal_wall(draw, x1, y1, x2, y2, base_color, accent_color):
     draw.rectangle([x1, y1, x2, y2], outline='#00ccaa', width=1)
 
 
-def draw_copper_wall(draw, x1, y1, x2, y2, base_color, accent_color):
+def draw_copper_wall(draw, x1, y1, x2, y2, base_color, accent_color, rng):
     """Draw a steampunk copper/wood wall with bolts."""
     x1, y1, x2, y2 = min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2)
     if x2 - x1 < 1 or y2 - y1 < 1:
@@ -109,7 +123,7 @@ def draw_copper_wall(draw, x1, y1, x2, y2, base_color, accent_color):
             draw.ellipse([px - 4, py - 4, px + 4, py + 4], fill=bolt_color, outline=bolt_hi, width=1)
 
 
-def draw_cave_wall(draw, x1, y1, x2, y2, base_color, accent_color):
+def draw_cave_wall(draw, x1, y1, x2, y2, base_color, accent_color, rng):
     """Draw rough, organic cave/crypt walls."""
     x1, y1, x2, y2 = min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2)
     if x2 - x1 < 1 or y2 - y1 < 1:
@@ -117,15 +131,15 @@ def draw_cave_wall(draw, x1, y1, x2, y2, base_color, accent_color):
     draw.rectangle([x1, y1, x2, y2], fill='#1a1510', outline='#2a2018', width=2)
     area = max(1, (x2 - x1) * (y2 - y1))
     for _ in range(max(1, area // 300)):
-        rx = random.randint(x1, max(x1, x2 - 10))
-        ry = random.randint(y1, max(y1, y2 - 8))
-        rw = random.randint(4, 18)
-        rh = random.randint(3, 12)
+        rx = rng.randint(x1, max(x1, x2 - 10))
+        ry = rng.randint(y1, max(y1, y2 - 8))
+        rw = rng.randint(4, 18)
+        rh = rng.randint(3, 12)
         draw.ellipse([rx, ry, rx + rw, ry + rh], fill='#2a2018')
     for _ in range(max(1, (x2 - x1 + y2 - y1) // 60)):
-        cx = random.randint(x1, x2)
-        cy = random.randint(y1, y2)
-        draw.line([cx, cy, cx + random.randint(-20, 20), cy + random.randint(-20, 20)],
+        cx = rng.randint(x1, x2)
+        cy = rng.randint(y1, y2)
+        draw.line([cx, cy, cx + rng.randint(-20, 20), cy + rng.randint(-20, 20)],
                   fill='#0a0a08', width=1)
 
 
@@ -150,7 +164,7 @@ def draw_door(draw, x, y, w, h, direction, color):
 
 
 def _draw_all_walls(draw, wall_style, has_north, has_south, has_east, has_west,
-                    margin, width, height, wall_base, wall_accent, furniture_color, wall_thickness):
+                    margin, width, height, wall_base, wall_accent, furniture_color, wall_thickness, rng):
     """Draw all four outer walls with appropriate exits."""
     wall_fn = _wall_fn_for_style(wall_style)
     door_w = 80
@@ -158,38 +172,38 @@ def _draw_all_walls(draw, wall_style, has_north, has_south, has_east, has_west,
 
     # North wall
     if not has_north:
-        wall_fn(draw, margin, margin, width - margin, margin + wall_thickness, wall_base, wall_accent)
+        wall_fn(draw, margin, margin, width - margin, margin + wall_thickness, wall_base, wall_accent, rng)
     else:
         dx = width // 2 - door_w // 2
-        wall_fn(draw, margin, margin, dx - 10, margin + wall_thickness, wall_base, wall_accent)
-        wall_fn(draw, dx + door_w + 10, margin, width - margin, margin + wall_thickness, wall_base, wall_accent)
+        wall_fn(draw, margin, margin, dx - 10, margin + wall_thickness, wall_base, wall_accent, rng)
+        wall_fn(draw, dx + door_w + 10, margin, width - margin, margin + wall_thickness, wall_base, wall_accent, rng)
         draw_door(draw, dx, margin, door_w, wall_thickness, 'north', furniture_color)
 
     # South wall
     if not has_south:
-        wall_fn(draw, margin, height - margin - wall_thickness, width - margin, height - margin, wall_base, wall_accent)
+        wall_fn(draw, margin, height - margin - wall_thickness, width - margin, height - margin, wall_base, wall_accent, rng)
     else:
         dx = width // 2 - door_w // 2
-        wall_fn(draw, margin, height - margin - wall_thickness, dx - 10, height - margin, wall_base, wall_accent)
-        wall_fn(draw, dx + door_w + 10, height - margin - wall_thickness, width - margin, height - margin, wall_base, wall_accent)
+        wall_fn(draw, margin, height - margin - wall_thickness, dx - 10, height - margin, wall_base, wall_accent, rng)
+        wall_fn(draw, dx + door_w + 10, height - margin - wall_thickness, width - margin, height - margin, wall_base, wall_accent, rng)
         draw_door(draw, dx, height - margin - wall_thickness, door_w, wall_thickness, 'south', furniture_color)
 
     # West wall
     if not has_west:
-        wall_fn(draw, margin, margin, margin + wall_thickness, height - margin, wall_base, wall_accent)
+        wall_fn(draw, margin, margin, margin + wall_thickness, height - margin, wall_base, wall_accent, rng)
     else:
         dy = height // 2 - door_h // 2
-        wall_fn(draw, margin, margin, margin + wall_thickness, dy - 10, wall_base, wall_accent)
-        wall_fn(draw, margin, dy + door_h + 10, margin + wall_thickness, height - margin, wall_base, wall_accent)
+        wall_fn(draw, margin, margin, margin + wall_thickness, dy - 10, wall_base, wall_accent, rng)
+        wall_fn(draw, margin, dy + door_h + 10, margin + wall_thickness, height - margin, wall_base, wall_accent, rng)
         draw_door(draw, margin, dy, wall_thickness, door_h, 'west', furniture_color)
 
     # East wall
     if not has_east:
-        wall_fn(draw, width - margin - wall_thickness, margin, width - margin, height - margin, wall_base, wall_accent)
+        wall_fn(draw, width - margin - wall_thickness, margin, width - margin, height - margin, wall_base, wall_accent, rng)
     else:
         dy = height // 2 - door_h // 2
-        wall_fn(draw, width - margin - wall_thickness, margin, width - margin, dy - 10, wall_base, wall_accent)
-        wall_fn(draw, width - margin - wall_thickness, dy + door_h + 10, width - margin, height - margin, wall_base, wall_accent)
+        wall_fn(draw, width - margin - wall_thickness, margin, width - margin, dy - 10, wall_base, wall_accent, rng)
+        wall_fn(draw, width - margin - wall_thickness, dy + door_h + 10, width - margin, height - margin, wall_base, wall_accent, rng)
         draw_door(draw, width - margin - wall_thickness, dy, wall_thickness, door_h, 'east', furniture_color)
 
 
@@ -261,7 +275,7 @@ def _draw_shelf_with_bottles(draw, x1, y1, x2, y2, color):
 
 # ─── Interior layout functions ────────────────────────────────────────────────
 
-def _interior_library(draw, margin, width, height, color, theme):
+def _interior_library(draw, margin, width, height, color, theme, rng):
     """Bookshelves along walls, central reading table, candles."""
     wt = 30
     # North and south wall bookshelves
@@ -285,7 +299,7 @@ def _interior_library(draw, margin, width, height, color, theme):
         draw.polygon([(cax, cy - 18), (cax - 5, cy - 12), (cax + 5, cy - 12)], fill='#ff8800')
 
 
-def _interior_crypt(draw, margin, width, height, color, theme):
+def _interior_crypt(draw, margin, width, height, color, theme, rng):
     """Sarcophagi, corner pillars, central altar with candles."""
     wt = 30
     cx, cy = width // 2, height // 2
@@ -316,7 +330,7 @@ def _interior_crypt(draw, margin, width, height, color, theme):
             draw.line([wx, wy, wx + dx * (20 - i * 4), wy + dy * (20 - i * 4)], fill='#4a4a4a', width=1)
 
 
-def _interior_chapel(draw, margin, width, height, color, theme):
+def _interior_chapel(draw, margin, width, height, color, theme, rng):
     """Pews in rows, altar at north end, torches on sides."""
     wt = 35
     cx = width // 2
@@ -345,7 +359,7 @@ def _interior_chapel(draw, margin, width, height, color, theme):
             draw.polygon([(tx, ty - 24), (tx - 7, ty - 18), (tx + 7, ty - 18)], fill='#ff8800', outline='#ff6600')
 
 
-def _interior_market(draw, margin, width, height, color, theme):
+def _interior_market(draw, margin, width, height, color, theme, rng):
     """Market stalls in two rows flanking a central aisle, well in center."""
     wt = 30
     cx, cy = width // 2, height // 2
@@ -370,7 +384,7 @@ def _interior_market(draw, margin, width, height, color, theme):
     draw.ellipse([cx - 12, cy - 12, cx + 12, cy + 12], fill='#1a3a5a', outline='#2a6a8a', width=1)
 
 
-def _interior_boiler(draw, margin, width, height, color, theme):
+def _interior_boiler(draw, margin, width, height, color, theme, rng):
     """Boilers, pipes, gear wheels for industrial rooms."""
     cx, cy = width // 2, height // 2
     boiler_color = '#6a5a3a' if 'steam' in theme else '#4a4a5a'
@@ -409,7 +423,7 @@ def _interior_boiler(draw, margin, width, height, color, theme):
                          fill=None, outline='#c0c0c0', width=1)
 
 
-def _interior_tavern(draw, margin, width, height, color, theme):
+def _interior_tavern(draw, margin, width, height, color, theme, rng):
     """Bar counter along south wall, scattered tables, barrels in corners."""
     wt = 30
     # Bar counter
@@ -444,7 +458,7 @@ def _interior_tavern(draw, margin, width, height, color, theme):
             draw.line([bx, by + 30, bx + 40, by + 30], fill='#3a2a0a', width=1)
 
 
-def _interior_throne(draw, margin, width, height, color, theme):
+def _interior_throne(draw, margin, width, height, color, theme, rng):
     """Throne at north end, grand columns, red carpet down center."""
     cx, cy = width // 2, height // 2
     wt = 35
@@ -481,7 +495,7 @@ def _interior_throne(draw, margin, width, height, color, theme):
                    fill='#8a7a2a', outline='#ccaa33', width=2)
 
 
-def _interior_prison(draw, margin, width, height, color, theme):
+def _interior_prison(draw, margin, width, height, color, theme, rng):
     """Cell bars dividing sections, chains on north wall."""
     cx, cy = width // 2, height // 2
     wt = 35
@@ -509,7 +523,7 @@ def _interior_prison(draw, margin, width, height, color, theme):
                   fill='#6a5a2a', width=1)
 
 
-def _interior_laboratory(draw, margin, width, height, color, theme):
+def _interior_laboratory(draw, margin, width, height, color, theme, rng):
     """Workbenches, shelves with potions, central alchemy circle."""
     cx, cy = width // 2, height // 2
     wt = 35
@@ -538,7 +552,7 @@ def _interior_laboratory(draw, margin, width, height, color, theme):
                   fill='#4a8a5a', width=1)
 
 
-def _interior_armory(draw, margin, width, height, color, theme):
+def _interior_armory(draw, margin, width, height, color, theme, rng):
     """Weapon racks on north wall, armor stands, shields on east wall."""
     cx, cy = width // 2, height // 2
     wt = 35
@@ -571,7 +585,7 @@ def _interior_armory(draw, margin, width, height, color, theme):
         draw.line([shx - 28, sy + 24, shx - 2, sy + 24], fill='#ccaa33', width=2)
 
 
-def _interior_server(draw, margin, width, height, color, theme):
+def _interior_server(draw, margin, width, height, color, theme, rng):
     """Server racks with blinking LEDs, cable channels, central terminal."""
     cx, cy = width // 2, height // 2
     wt = 35
@@ -595,7 +609,7 @@ def _interior_server(draw, margin, width, height, color, theme):
             if uy + unit_h > ry + rh - 5:
                 break
             draw.rectangle([rx + 3, uy, rx + rw - 3, uy + unit_h], fill='#0a0a1a', outline='#2a2a4a', width=1)
-            led = neon if random.random() > 0.3 else '#cc2222'
+            led = neon if rng.random() > 0.3 else '#cc2222'
             draw.ellipse([rx + rw - 14, uy + 4, rx + rw - 7, uy + 11], fill=led)
             draw.ellipse([rx + rw - 22, uy + 4, rx + rw - 15, uy + 11], fill='#5a5a8a')
     # Cable channel on floor
@@ -611,11 +625,11 @@ def _interior_server(draw, margin, width, height, color, theme):
     draw.rectangle([tx + 5, ty + 5, tx + 55, ty + 30], fill='#0a1a0a', outline='#1a3a1a', width=1)
     for li in range(4):
         ly = ty + 8 + li * 6
-        lw = random.randint(10, 40)
+        lw = rng.randint(10, 40)
         draw.line([tx + 5 + (50 - lw) // 2, ly, tx + 5 + (50 + lw) // 2, ly], fill=neon, width=1)
 
 
-def _interior_treasury(draw, margin, width, height, color, theme):
+def _interior_treasury(draw, margin, width, height, color, theme, rng):
     """Vault door on north wall, chests around room, coin piles."""
     cx, cy = width // 2, height // 2
     wt = 35
@@ -644,8 +658,8 @@ def _interior_treasury(draw, margin, width, height, color, theme):
     # Coin piles
     for px, py in [(cx, cy), (margin + wt + 120, cy + 50), (width - margin - wt - 120, cy + 50)]:
         for _ in range(8):
-            ox = px + random.randint(-20, 20)
-            oy = py + random.randint(-15, 15)
+            ox = px + rng.randint(-20, 20)
+            oy = py + rng.randint(-15, 15)
             draw.ellipse([ox - 6, oy - 4, ox + 6, oy + 4], fill=gold, outline='#8a6a10', width=1)
 
 
@@ -702,26 +716,28 @@ def _interior_generic(draw, description, margin, width, height, color, theme):
             draw.polygon([(tx, ty - 24), (tx - 7, ty - 18), (tx + 7, ty - 18)], fill='#ff8800', outline='#ff6600')
 
 
+_INTERIOR_FUNCS = {
+    'library': _interior_library,
+    'crypt': _interior_crypt,
+    'chapel': _interior_chapel,
+    'market': _interior_market,
+    'boiler': _interior_boiler,
+    'tavern': _interior_tavern,
+    'throne': _interior_throne,
+    'prison': _interior_prison,
+    'laboratory': _interior_laboratory,
+    'armory': _interior_armory,
+    'server': _interior_server,
+    'treasury': _interior_treasury,
+}
+
+
 def _draw_identity_interior(draw, interior_type, identity_lower, description,
-                             margin, width, height, furniture_color, theme_lower):
+                             margin, width, height, furniture_color, theme_lower, rng):
     """Dispatch to the correct interior layout function."""
-    funcs = {
-        'library': _interior_library,
-        'crypt': _interior_crypt,
-        'chapel': _interior_chapel,
-        'market': _interior_market,
-        'boiler': _interior_boiler,
-        'tavern': _interior_tavern,
-        'throne': _interior_throne,
-        'prison': _interior_prison,
-        'laboratory': _interior_laboratory,
-        'armory': _interior_armory,
-        'server': _interior_server,
-        'treasury': _interior_treasury,
-    }
-    fn = funcs.get(interior_type)
+    fn = _INTERIOR_FUNCS.get(interior_type)
     if fn:
-        fn(draw, margin, width, height, furniture_color, theme_lower)
+        fn(draw, margin, width, height, furniture_color, theme_lower, rng)
     else:
         _interior_generic(draw, description, margin, width, height, furniture_color, theme_lower)
 
@@ -761,16 +777,16 @@ def _add_large_hall_columns(draw, room_shape, margin, width, height, color):
 
 # ─── Main generation function ─────────────────────────────────────────────────
 
-def generate_room_map(room_holder, theme_era="Medieval", userId=None):
-    """Generate a detailed top-down D&D style battle map."""
-    width = 800
-    height = 600
-    img = Image.new('RGB', (width, height), color='#2a2520')
-    draw = ImageDraw.Draw(img)
+def generate_room_map(room_holder, theme_era="Medieval", userId=None, pos=None):
+    """Generate a detailed top-down D&D style battle map.
 
+    pos is the (x, y) of the room to draw; it defaults to the player's current room.
+    Returns an <img> tag pointing at the cached render (see map_output).
+    """
     # Get current room info
-    cur_x = room_holder._cur_pos_x
-    cur_y = room_holder._cur_pos_y
+    if pos is None:
+        pos = (room_holder._cur_pos_x, room_holder._cur_pos_y)
+    cur_x, cur_y = pos
     room_array = room_holder._array_of_rooms
     current_room = room_array[cur_y][cur_x]
     description = current_room._description.lower() if current_room._description else ""
@@ -781,9 +797,192 @@ def generate_room_map(room_holder, theme_era="Medieval", userId=None):
     identity_lower = room_identity.lower()
     room_shape = _classify_room_shape(identity_lower)
     interior_type = _classify_interior(identity_lower, description)
+    theme_lower = theme_era.lower()
+
+    # Pre-load neighboring rooms so exit checks are accurate
+    if userId is not None:
+        for nx, ny in [(cur_x, cur_y + 1), (cur_x, cur_y - 1),
+                       (cur_x + 1, cur_y), (cur_x - 1, cur_y)]:
+            room_holder.get_room(userId, nx, ny)
+
+    # Build exits map
+    cols = room_holder._cols
+    rows = room_holder._rows
+    exits_map = {
+        'north': bool(cur_y + 1 < rows and room_array[cur_y + 1][cur_x] is not None),
+        'south': bool(cur_y - 1 >= 0 and room_array[cur_y - 1][cur_x] is not None),
+        'east':  bool(cur_x + 1 < cols and room_array[cur_y][cur_x + 1] is not None),
+        'west':  bool(cur_x - 1 >= 0 and room_array[cur_y][cur_x - 1] is not None),
+    }
+    item_rarities = [((item.get("rarity") if isinstance(item, dict) else "Common") or "Common")
+                     for item in room_items]
+
+    # Only the generic interior reads the description (for its props).
+    inputs = {
+        'theme': theme_lower,
+        'interior': interior_type,
+        'shape': room_shape,
+        'exits': _exit_bits(exits_map),
+        'items': item_rarities,
+        'seed': f"{cur_x}_{cur_y}",
+        'description': '' if interior_type in _INTERIOR_FUNCS else description,
+    }
+    key = render_key(**inputs)
+    if map_output() == 'scene':
+        scene = scenes.get(key) if map_cache_enabled() else None
+        if scene is None:
+            scene = _room_scene(theme_lower, interior_type, room_shape, exits_map, item_rarities,
+                                inputs['seed'], description)
+            scenes.put(key, scene)
+        # Inert JSON for the page to draw; "</" is escaped so the data can't close the tag.
+        scene_json = scene.replace('</', '<\\/')
+        return f'<script type="application/json" data-role="map-scene" data-key="{key}">{scene_json}</script>'
+
+    # The cache is also what /map/<key>.png serves from, so renders always go into it;
+    # MAP_CACHE_ENABLED=false only skips the lookup.
+    png = map_cache.get(key) if map_cache_enabled() else None
+    if png is None:
+        png = _draw_room_png(theme_lower, interior_type, room_shape, exits_map, item_rarities,
+                             inputs['seed'], description)
+        map_cache.put(key, png)
+    if render_inputs.get(key) is None:
+        render_inputs.put(key, json.dumps(inputs).encode('utf-8'))
+    style = 'border:2px solid #444; border-radius:8px;'
+    if map_output() == 'inline':
+        img_str = base64.b64encode(png).decode()
+        return f'<img src="data:image/png;base64,{img_str}" style="{style}"/>'
+    return f'<img src="{map_url(key)}" style="{style}"/>'
+
+
+def map_output():
+    """
+    How maps reach the browser: "url" (a PNG served by /map/<key>.png), "inline" (a PNG data:
+    URI) or "scene" (a JSON scene the page draws on a canvas, see _room_scene).
+    """
+    return os.getenv("MAP_OUTPUT", "url").strip().lower()
+
+
+def map_url(key):
+    return f"/map/{key}.png"
+
+
+def render_map_png(key):
+    """
+    The PNG behind map_url(key): from the cache, or drawn again from the key's recorded render
+    inputs if it has been evicted. None for a key no map was rendered under.
+    """
+    png = map_cache.get(key)
+    if png is not None:
+        return png
+    raw = render_inputs.get(key)
+    if raw is None:
+        return None
+    inputs = json.loads(raw)
+    if render_key(**inputs) != key:
+        return None
+    png = _draw_room_png(inputs['theme'], inputs['interior'], inputs['shape'],
+                         _exits_from_bits(inputs['exits']), inputs['items'], inputs['seed'],
+                         inputs['description'])
+    map_cache.put(key, png)
+    return png
+
+
+def _hex_rgb(color):
+    return tuple(int(color[i:i + 2], 16) for i in (1, 3, 5))
+
+
+def _floor_rng(seed):
+    """The floor's own generator, so its shades don't shift the layout's `random` stream."""
+    return np.random.default_rng(int.from_bytes(hashlib.sha256(seed.encode('utf-8')).digest()[:8], 'big'))
+
+
+def _floor_array(floor_base, floor_accent, cols, rows, tile_size, rng):
+    """
+    The tiled floor as an (rows * tile_size, cols * tile_size, 3) array: each tile the base
+    colour shaded by -12..12, with a one-pixel grout outline in the accent colour.
+    """
+    shades = rng.integers(-12, 13, size=(rows, cols, 1))
+    tiles = np.clip(np.array(_hex_rgb(floor_base)) + shades, 0, 255).astype(np.uint8)
+    # Grout is whole pixel rows and columns: each tile's first and last. The columns are set on
+    # one pixel row per tile row before it is stretched, so the full-size array is built once.
+    edge = np.zeros(tile_size, dtype=bool)
+    edge[[0, -1]] = True
+    accent = _hex_rgb(floor_accent)
+    band = tiles.repeat(tile_size, axis=1)
+    band[:, np.tile(edge, cols)] = accent
+    floor = band.repeat(tile_size, axis=0)
+    floor[np.tile(edge, rows)] = accent
+    return floor
+
+
+def _draw_floor(img, floor_base, floor_accent, margin, tile_size, rng):
+    width, height = img.size
+    cols = -(-(width - 2 * margin) // tile_size)
+    rows = -(-(height - 2 * margin) // tile_size)
+    floor = _floor_array(floor_base, floor_accent, cols, rows, tile_size, rng)
+    # Tiles overhanging the far edge are clipped, as the per-tile rectangles were.
+    img.paste(Image.fromarray(floor[:height - 2 * margin, :width - 2 * margin]), (margin, margin))
+
+
+_EXIT_BITS = ((1, 'north'), (2, 'south'), (4, 'east'), (8, 'west'))
+
+
+def _exit_bits(exits_map):
+    """Exits as a bitmask: north 1, south 2, east 4, west 8."""
+    return sum(bit for bit, direction in _EXIT_BITS if exits_map[direction])
+
+
+def _exits_from_bits(bits):
+    return {direction: bool(bits & bit) for bit, direction in _EXIT_BITS}
+
+
+def _draw_room_png(theme_lower, interior_type, room_shape, exits_map, item_rarities, seed, description):
+    """
+    The map's PNG bytes from its render inputs: the cached base layer (floor, walls, doors and
+    furniture) with the item and player markers composited on top. Picking up or dropping an
+    item only redraws the markers.
+    """
+    base_inputs = {
+        'theme': theme_lower,
+        'interior': interior_type,
+        'shape': room_shape,
+        'exits': _exit_bits(exits_map),
+        'seed': seed,
+        'description': '' if interior_type in _INTERIOR_FUNCS else description,
+    }
+    base_key = render_key(layer='base', **base_inputs)
+    base = base_layers.get(base_key)
+    if base is None:
+        base = _draw_base_layer(theme_lower, interior_type, room_shape, exits_map, seed, description)
+        base_layers.put(base_key, base)
+    img = Image.alpha_composite(base, _draw_overlay(base.size, item_rarities, seed))
+
+    # ── ENCODE ────────────────────────────────────────────────────────────────
+    buffer = io.BytesIO()
+    img.convert('RGB').save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def _draw_base_layer(theme_lower, interior_type, room_shape, exits_map, seed, description):
+    """The static part of the map as an RGBA image."""
+    img = Image.new('RGB', (MAP_WIDTH, MAP_HEIGHT), color=MAP_BACKGROUND)
+
+    def floor(floor_base, floor_accent, margin, tile_size):
+        _draw_floor(img, floor_base, floor_accent, margin, tile_size, _floor_rng(seed))
+
+    _draw_static(ImageDraw.Draw(img), floor, theme_lower, interior_type, room_shape, exits_map, seed, description)
+    return img.convert('RGBA')
+
+
+def _draw_static(draw, floor, theme_lower, interior_type, room_shape, exits_map, seed, description):
+    """
+    Draw everything but the markers: `floor` lays the tiles, `draw` is an ImageDraw or a
+    SceneRecorder.
+    """
+    width = MAP_WIDTH
+    height = MAP_HEIGHT
 
     # Theme colors
-    theme_lower = theme_era.lower()
     if 'cyber' in theme_lower:
         # Cyberpunk: near-black with neon blue tints
         floor_base = '#080e18'
@@ -806,57 +1005,103 @@ def generate_room_map(room_holder, theme_era="Medieval", userId=None):
         wall_accent = '#363634'
         furniture_color = '#5a5a56'
 
-    # Seed for deterministic room appearance
-    random.seed(hash(f"{cur_x}_{cur_y}"))
+    # Seed for deterministic room appearance. A string seed hashes the same in every process
+    # (unlike hash()), so workers agree on a room's look and can share cached renders. The
+    # generator is this render's own, so maps for different rooms can be drawn concurrently.
+    rng = random.Random(seed)
 
     tile_size = 20
     margin = 60
     wall_thickness = 25
 
-    # Pre-load neighboring rooms so exit checks are accurate
-    if userId is not None:
-        for nx, ny in [(cur_x, cur_y + 1), (cur_x, cur_y - 1),
-                       (cur_x + 1, cur_y), (cur_x - 1, cur_y)]:
-            room_holder.get_room(userId, nx, ny)
-
-    # Build exits map
-    cols = room_holder._cols
-    rows = room_holder._rows
-    exits_map = {
-        'north': bool(cur_y + 1 < rows and room_array[cur_y + 1][cur_x] is not None),
-        'south': bool(cur_y - 1 >= 0 and room_array[cur_y - 1][cur_x] is not None),
-        'east':  bool(cur_x + 1 < cols and room_array[cur_y][cur_x + 1] is not None),
-        'west':  bool(cur_x - 1 >= 0 and room_array[cur_y][cur_x - 1] is not None),
-    }
     has_north = exits_map['north']
     has_south = exits_map['south']
     has_east  = exits_map['east']
     has_west  = exits_map['west']
 
     # ── FLOOR ─────────────────────────────────────────────────────────────────
-    for y in range(margin, height - margin, tile_size):
-        for x in range(margin, width - margin, tile_size):
-            shade = random.randint(-12, 12)
-            r = min(255, max(0, int(floor_base[1:3], 16) + shade))
-            g = min(255, max(0, int(floor_base[3:5], 16) + shade))
-            b = min(255, max(0, int(floor_base[5:7], 16) + shade))
-            draw.rectangle([x, y, x + tile_size - 1, y + tile_size - 1],
-                           fill=f'#{r:02x}{g:02x}{b:02x}', outline=floor_accent, width=1)
+    floor(floor_base, floor_accent, margin, tile_size)
 
     # ── WALLS ─────────────────────────────────────────────────────────────────
     wall_style = _get_wall_style(theme_lower, interior_type)
     _draw_all_walls(draw, wall_style, has_north, has_south, has_east, has_west,
-                    margin, width, height, wall_base, wall_accent, furniture_color, wall_thickness)
+                    margin, width, height, wall_base, wall_accent, furniture_color, wall_thickness, rng)
 
     # ── INTERIOR FEATURES ─────────────────────────────────────────────────────
-    _draw_identity_interior(draw, interior_type, identity_lower, description,
-                            margin, width, height, furniture_color, theme_lower)
+    # The identity only matters through interior_type, so it isn't a render input.
+    _draw_identity_interior(draw, interior_type, '', description,
+                            margin, width, height, furniture_color, theme_lower, rng)
 
     # ── ROOM SHAPE MODIFIERS ──────────────────────────────────────────────────
     _add_corridor_pillars(draw, room_shape, has_north, has_south, has_east, has_west,
                           margin, width, height, furniture_color)
     _add_large_hall_columns(draw, room_shape, margin, width, height, furniture_color)
 
+
+class SceneRecorder:
+    """
+    Stands in for ImageDraw: the drawing helpers call it the same way, and it records each shape
+    as [kind, points, fill, outline, width] with kind r(ectangle), e(llipse), p(olygon) or l(ine).
+    """
+
+    def __init__(self):
+        self.shapes = []
+
+    def _add(self, kind, xy, fill, outline, width):
+        points = []
+        for point in xy:
+            points.extend(point if isinstance(point, (tuple, list)) else (point,))
+        self.shapes.append([kind, [round(v) for v in points], fill, outline, width])
+
+    def rectangle(self, xy, fill=None, outline=None, width=1):
+        self._add('r', xy, fill, outline, width)
+
+    def ellipse(self, xy, fill=None, outline=None, width=1):
+        self._add('e', xy, fill, outline, width)
+
+    def polygon(self, xy, fill=None, outline=None, width=1):
+        self._add('p', xy, fill, outline, width)
+
+    def line(self, xy, fill=None, width=0):
+        self._add('l', xy, fill, None, width or 1)
+
+
+def _room_scene(theme_lower, interior_type, room_shape, exits_map, item_rarities, seed, description):
+    """
+    The map as compact JSON for the browser to draw (MAP_OUTPUT=scene): the floor's parameters
+    with one character per tile shade ('m' is unshaded), then every shape the raster path would
+    draw, markers last. The same drawing code runs against a SceneRecorder, so the two agree.
+    """
+    scene = {'v': 1, 'w': MAP_WIDTH, 'h': MAP_HEIGHT, 'bg': MAP_BACKGROUND}
+
+    def floor(floor_base, floor_accent, margin, tile_size):
+        w, h = MAP_WIDTH - 2 * margin, MAP_HEIGHT - 2 * margin
+        cols, rows = -(-w // tile_size), -(-h // tile_size)
+        shades = _floor_rng(seed).integers(-12, 13, size=(rows, cols))
+        scene['floor'] = {'x': margin, 'y': margin, 'w': w, 'h': h, 'tile': tile_size, 'cols': cols,
+                          'base': floor_base, 'accent': floor_accent,
+                          'shades': ''.join(chr(ord('m') + int(shade)) for shade in shades.ravel())}
+
+    recorder = SceneRecorder()
+    _draw_static(recorder, floor, theme_lower, interior_type, room_shape, exits_map, seed, description)
+    _draw_markers(recorder, (MAP_WIDTH, MAP_HEIGHT), item_rarities, seed)
+    scene['shapes'] = recorder.shapes
+    return json.dumps(scene, separators=(',', ':'))
+
+
+def _draw_overlay(size, item_rarities, seed):
+    """The player and item markers on a transparent RGBA layer the size of the base."""
+    overlay = Image.new('RGBA', size, (0, 0, 0, 0))
+    _draw_markers(ImageDraw.Draw(overlay), size, item_rarities, seed)
+    return overlay
+
+
+def _draw_markers(draw, size, item_rarities, seed):
+    width, height = size
+    margin = 60
+    # Item positions have their own generator so they don't depend on how the base was drawn.
+    rng = random.Random(f"{seed}:items")
+
     # ── PLAYER MARKER ─────────────────────────────────────────────────────────
     player_x = width // 2
     player_y = height // 2
@@ -874,28 +1119,18 @@ def generate_room_map(room_holder, theme_era="Medieval", userId=None):
 
     def pick_pos():
         for _ in range(12):
-            x = random.randint(margin + 20, width - margin - 20)
-            y = random.randint(margin + 20, height - margin - 20)
+            x = rng.randint(margin + 20, width - margin - 20)
+            y = rng.randint(margin + 20, height - margin - 20)
             if (abs(x - player_x) + abs(y - player_y)) > 80:
                 return x, y
         return width // 3, height // 3
 
-    for item in room_items:
-        name = item.get("name") if isinstance(item, dict) else str(item)
-        rarity = (item.get("rarity") if isinstance(item, dict) else "Common") or "Common"
+    for rarity in item_rarities:
         c = rarity_colors.get(rarity, "#d0d0d0")
         ix, iy = pick_pos()
         draw.ellipse([ix - 8, iy - 8, ix + 8, iy + 8], fill=c, outline="#000000", width=2)
         draw.ellipse([ix - 2, iy - 2, ix + 2, iy + 2], fill="#000000")
 
-    # ── ENCODE ────────────────────────────────────────────────────────────────
-    buffer = io.BytesIO()
-    img.save(buffer, format='PNG')
-    buffer.seek(0)
-    img_str = base64.b64encode(buffer.getvalue()).decode()
-    style = 'border:2px solid #444; border-radius:8px;'
-    return f'<img src="data:image/png;base64,{img_str}" style="{style}"/>'
-
 
 # ─── Legacy helpers (kept for compatibility) ──────────────────────────────────
 
@@ -938,12 +1173,12 @@ def _draw_prop(draw, prop, margin, width, height, color, theme):
 
 def add_tavern_furniture(draw, margin, width, height, color):
     """Legacy: add tavern-style furniture."""
-    _interior_tavern(draw, margin, width, height, color, 'medieval')
+    _interior_tavern(draw, margin, width, height, color, 'medieval', random.Random())
 
 
 def add_library_furniture(draw, margin, width, height, color):
     """Legacy: add library-style furniture."""
-    _interior_library(draw, margin, width, height, color, 'medieval')
+    _interior_library(draw, margin, width, height, color, 'medieval', random.Random())
 
 
 def add_room_furniture(draw, description, margin, width, height, color, theme):
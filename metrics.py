@@ -0,0 +1,138 @@
+# In-process metrics registry. Counters and histograms are keyed by name plus a small set of
+# labels (e.g. the call site of an LLM request) and exposed by the /metrics endpoint in
+# application.py, either in Prometheus text format or as JSON.
+import threading
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 16.0, 32.0)
+TOKEN_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192)
+
+
+def _label_key(labels):
+    return tuple(sorted((labels or {}).items()))
+
+
+class Histogram:
+    """Cumulative-bucket histogram with a running count and sum."""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th quantile (None when empty)."""
+        if not self.count:
+            return None
+        target = q * self.count
+        for bound, cumulative in zip(self.buckets, self.counts):
+            if cumulative >= target:
+                return bound
+        return float("inf")
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "buckets": {str(b): c for b, c in zip(self.buckets, self.counts)},
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+        }
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}  # name -> {label_key: value}
+        self._gauges = {}  # name -> {label_key: value}
+        self._histograms = {}  # name -> {label_key: Histogram}
+        self._help = {}
+
+    def describe(self, name, text):
+        self._help[name] = text
+
+    def inc(self, name, labels=None, amount=1):
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            key = _label_key(labels)
+            series[key] = series.get(key, 0) + amount
+
+    def set_gauge(self, name, value, labels=None):
+        with self._lock:
+            self._gauges.setdefault(name, {})[_label_key(labels)] = value
+
+    def observe(self, name, value, labels=None, buckets=LATENCY_BUCKETS):
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            key = _label_key(labels)
+            if key not in series:
+                series[key] = Histogram(buckets)
+            series[key].observe(value)
+
+    def get_counter(self, name, labels=None):
+        with self._lock:
+            return self._counters.get(name, {}).get(_label_key(labels), 0)
+
+    def get_gauge(self, name, labels=None):
+        with self._lock:
+            return self._gauges.get(name, {}).get(_label_key(labels))
+
+    def get_histogram(self, name, labels=None):
+        with self._lock:
+            return self._histograms.get(name, {}).get(_label_key(labels))
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._histograms.clear()
+
+    def snapshot(self):
+        """Everything recorded so far as plain dicts, grouped by metric name."""
+        def rows(series, convert):
+            return [dict(labels=dict(key), value=convert(v)) for key, v in series.items()]
+
+        with self._lock:
+            return {
+                "counters": {n: rows(s, lambda v: v) for n, s in self._counters.items()},
+                "gauges": {n: rows(s, lambda v: v) for n, s in self._gauges.items()},
+                "histograms": {n: rows(s, Histogram.to_dict) for n, s in self._histograms.items()},
+            }
+
+    def render_prometheus(self):
+        def fmt_labels(key, extra=()):
+            pairs = list(key) + list(extra)
+            if not pairs:
+                return ""
+            return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+        lines = []
+        with self._lock:
+            for kind, store in (("counter", self._counters), ("gauge", self._gauges)):
+                for name, series in sorted(store.items()):
+                    if name in self._help:
+                        lines.append(f"# HELP {name} {self._help[name]}")
+                    lines.append(f"# TYPE {name} {kind}")
+                    for key, value in series.items():
+                        lines.append(f"{name}{fmt_labels(key)} {value}")
+            for name, series in sorted(self._histograms.items()):
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} histogram")
+                for key, hist in series.items():
+                    for bound, cumulative in zip(hist.buckets, hist.counts):
+                        lines.append(f"{name}_bucket{fmt_labels(key, [('le', bound)])} {cumulative}")
+                    lines.append(f"{name}_bucket{fmt_labels(key, [('le', '+Inf')])} {hist.count}")
+                    lines.append(f"{name}_sum{fmt_labels(key)} {hist.sum}")
+                    lines.append(f"{name}_count{fmt_labels(key)} {hist.count}")
+        return "\n".join(lines) + "\n"
+
+
+metrics_registry = MetricsRegistry()
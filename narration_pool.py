@@ -0,0 +1,191 @@
+# Reusable narration for prop and item interactions. The text for "search the bookshelf" in a
+# medieval library hardly depends on anything but (theme, interior type, object, action, kind
+# of result), so a few LLM-written variants are kept per key and served in rotation. A pool
+# below its target size is topped up in the background; only the very first request for a key
+# waits on the model.
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+
+from call_scheduler import call_context
+from deadlines import call_by_deadline
+from metrics import metrics_registry
+from open_ai_api import call_ai
+
+load_dotenv()
+
+# How each effect class is described to the model. The exact numbers and loot names are not
+# part of the pooled text; the caller shows them next to it.
+EFFECT_NOTES = {
+    "none": "No special result. Describe the sensory experience.",
+    "heal": "The player feels restored.",
+    "harm": "It tastes foul and hurts the player.",
+    "loot": "The player discovers something of value.",
+    "empty": "Nothing of value turns up.",
+    "taken": "The player takes it with them.",
+    "other": "Something happens as a result.",
+}
+
+# Each top-up attempt asks for a different emphasis, so the pool holds distinct variants
+# rather than rewordings of one.
+VARIANT_ANGLES = (
+    "what the player sees",
+    "sounds and smells",
+    "how it feels to the touch",
+    "the player's reaction",
+)
+
+metrics_registry.describe("narration_pool_requests_total", "Interaction narrations by pool outcome (hit or miss)")
+
+
+def pool_enabled():
+    return os.getenv("NARRATION_POOL_ENABLED", "true").strip().lower() in ("1", "true", "yes", "on")
+
+
+def _env_int(name, default):
+    try:
+        return max(1, int(os.getenv(name, default)))
+    except (TypeError, ValueError):
+        return default
+
+
+def effect_class(effect_text):
+    """Bucket the mechanical result of an interaction into one of EFFECT_NOTES."""
+    text = (effect_text or "").strip()
+    if not text:
+        return "none"
+    if text.startswith("+"):
+        return "heal"
+    if text.startswith("-"):
+        return "harm"
+    if text.startswith("You find"):
+        return "loot"
+    if text.startswith("Nothing of value"):
+        return "empty"
+    if text.endswith("added to inventory."):
+        return "taken"
+    return "other"
+
+
+def pool_prompt(theme, interior, obj_name, action, effect):
+    return (
+        f"Theme: {theme}. Room type: {interior or 'room'}.\n"
+        f"The player performs '{action}' on the {obj_name}.\n"
+        f"Result: {EFFECT_NOTES.get(effect, EFFECT_NOTES['other'])}\n"
+        f"Write 2-3 sentences narrating this in an immersive, theme-appropriate way. "
+        f"Do not name specific items, amounts or characters. No lists, no headings."
+    )
+
+
+class NarrationPool:
+    """A few narration variants per key, served round-robin and topped up in the background."""
+
+    def __init__(self, target_size=None, max_keys=None, max_workers=2):
+        self.target_size = target_size or _env_int("NARRATION_POOL_SIZE", 4)
+        self.max_keys = max_keys or _env_int("NARRATION_POOL_MAX_KEYS", 2000)
+        self._max_workers = max_workers
+        self._executor = None
+        self._lock = threading.Lock()
+        self._pools = OrderedDict()  # key -> list of variants
+        self._next = {}  # key -> index of the variant to serve next
+        self._filling = {}  # key -> Future of the running top-up
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self._max_workers,
+                                                thread_name_prefix="narration-pool")
+        return self._executor
+
+    def size(self, key):
+        with self._lock:
+            return len(self._pools.get(key, []))
+
+    def get(self, key, prompt, stream=False, userId=None, fallback=None):
+        """
+        A variant for key; generated on the spot (and streamed if asked) when the pool is empty.
+        With a fallback, a first generation that misses the command deadline shows the fallback
+        and joins the pool when it arrives.
+        """
+        with self._lock:
+            variants = self._pools.get(key)
+            if variants:
+                self._pools.move_to_end(key)
+                index = self._next.get(key, 0) % len(variants)
+                self._next[key] = index + 1
+                text = variants[index]
+            else:
+                text = None
+        if text is not None:
+            metrics_registry.inc("narration_pool_requests_total", {"outcome": "hit"})
+        else:
+            metrics_registry.inc("narration_pool_requests_total", {"outcome": "miss"})
+            generate = lambda: call_ai(prompt, stream=stream, site="interact_narration")
+            if fallback is None:
+                text, late = generate(), None
+            else:
+                text, late = call_by_deadline(userId, generate, fallback, site="interact_narration")
+            if late is not None:
+                late.when_ready(lambda real: self._arrived(key, prompt, real))
+                return late.placeholder(text)
+            self._add(key, text)
+            # The fresh variant has just been shown; serve the next one first.
+            with self._lock:
+                self._next[key] = len(self._pools.get(key, []))
+        self._top_up(key, prompt)
+        return text
+
+    def _arrived(self, key, prompt, text):
+        """A first generation that missed the deadline: pool it and start filling the rest."""
+        self._add(key, text)
+        self._top_up(key, prompt)
+
+    def _add(self, key, text):
+        if not text:
+            return False
+        with self._lock:
+            variants = self._pools.setdefault(key, [])
+            self._pools.move_to_end(key)
+            if text in variants or len(variants) >= self.target_size:
+                return False
+            variants.append(text)
+            while len(self._pools) > self.max_keys:
+                old_key, _ = self._pools.popitem(last=False)
+                self._next.pop(old_key, None)
+            return True
+
+    def _top_up(self, key, prompt):
+        with self._lock:
+            if len(self._pools.get(key, [])) >= self.target_size:
+                return None
+            future = self._filling.get(key)
+            if future is not None and not future.done():
+                return future
+            future = self._filling[key] = self._get_executor().submit(self._fill, key, prompt)
+        return future
+
+    def _fill(self, key, prompt):
+        # Each attempt may repeat an earlier variant; give up after a few tries.
+        for attempt in range(self.target_size * 2):
+            if self.size(key) >= self.target_size:
+                break
+            angle = VARIANT_ANGLES[attempt % len(VARIANT_ANGLES)]
+            try:
+                # Top-ups only serve later requests, so they wait behind everything else.
+                with call_context("batch"):
+                    self._add(key, call_ai(f"{prompt}\nDwell on {angle}.", site="interact_narration_pool"))
+            except Exception as e:
+                print("Warning: narration pool top-up failed:", e)
+                break
+        with self._lock:
+            self._filling.pop(key, None)
+
+    def shutdown(self, wait=True):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+
+
+narration_pool = NarrationPool()
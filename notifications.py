@@ -0,0 +1,33 @@
+# Per-user outbox for text that is finished after a command has already been answered, e.g.
+# LLM prose replacing a quick template narration. Each update names the id of a placeholder
+# element in an earlier response; the client polls /updates and swaps the placeholder's HTML.
+import threading
+from collections import deque
+
+MAX_PENDING_PER_USER = 50
+
+_lock = threading.Lock()
+_outbox = {}  # userId -> deque of {"id": ..., "html": ...}
+
+
+def placeholder(update_id, html):
+    """Wrap html so a later update with the same id can replace it."""
+    return f'<span id="{update_id}" data-pending-update="1">{html}</span>'
+
+
+def push(userId, update_id, html):
+    with _lock:
+        box = _outbox.setdefault(userId, deque(maxlen=MAX_PENDING_PER_USER))
+        box.append({"id": update_id, "html": html})
+
+
+def drain(userId):
+    """Return and forget all updates waiting for the user."""
+    with _lock:
+        box = _outbox.pop(userId, None)
+    return list(box) if box else []
+
+
+def clear(userId):
+    with _lock:
+        _outbox.pop(userId, None)
@@ -78,13 +78,15 @@ class npc:
             all_global_vars.get_player_character(userId).get_theme() +
             " that has a toughness of " + str(self._toughness) + " out of 100, with 100/100 being very tough" + 
             " and has a friendliness score where 100 is very friendly and 0 is very hostile of " + 
-            str(self._friendlyness) + " Just include the name by itself, don't put any other words in the response")
+            str(self._friendlyness) + " Just include the name by itself, don't put any other words in the response",
+            site="npc_name")
             
         self._description = call_ai("Describe the NPC with the name " + self._name + "and the theme " + 
             all_global_vars.get_player_character(userId).get_theme() +
             " that has a toughness of " + str(self._toughness) + " out of 100, with 100/100 being very tough" + 
             " and has a friendliness score where 100 is very friendly and 0 is very hostile of " + 
-            str(self._friendlyness) + " Just write about a paragraph of plain text to describe the npc, like in a novel")
+            str(self._friendlyness) + " Just write about a paragraph of plain text to describe the npc, like in a novel",
+            site="npc_description")
 
         self._past_conversation = []
         # Chance that this NPC has a quest to offer (defeat enemies, obtain item, obtain gold, etc.)
@@ -107,7 +109,7 @@ class npc:
             call_string += line + " " 
         call_string += "And the current thing they're saying is: "  + talk_string
         call_string += "Say just the response text you'd say in a conversation as that npc, nothing else"
-        response = call_ai(call_string)
+        response = call_ai(call_string, site="npc_talk")
         self._past_conversation.append(talk_string)
         self._past_conversation.append(response)
 
@@ -146,7 +148,7 @@ class npc:
                         f"Modifiers: persuasion {mods['persuasion']}/16, intimidation {mods['intimidation']}/15, awareness {mods['awareness']}/15. "
                         "Answer with one word, yes or no.")
         print("Calling AI")
-        response = call_ai(call_string)
+        response = call_ai(call_string, site="allow_pass")
         print("Got response: " + str(response))
         if  response.strip().lower().startswith("no"): 
             self._past_conversation.append("Note: The player tried to go past the npc to exit the room here and was blocked")
@@ -0,0 +1,221 @@
+# Bounded conversation memory for NPCs. The last few turns are kept verbatim in
+# npc._past_conversation; older turns are folded into npc._conversation_summary, a rolling
+# summary rewritten by a background LLM call. Until the summary catches up, folded turns wait
+# in npc._summary_pending. Prompts get at most a fixed token budget of history, newest first,
+# so prompt size stays flat however long the player keeps talking. Alongside the text, each NPC
+# keeps a running pass record (fights, refused bribes, blocked attempts; see npc_rules) that
+# folding never loses.
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+
+import npc_rules
+from call_scheduler import call_context
+from open_ai_api import call_ai
+
+load_dotenv()
+
+# Phrases that mean the NPC has already agreed to let the player pass (see Npc.allow_pass).
+PASS_GRANTED_PHRASES = ("agreeing to let them pass", "steps aside. you may pass", "was allowed")
+
+_executor = None
+_lock = threading.RLock()
+
+
+def _env_int(name, default):
+    try:
+        return max(1, int(os.getenv(name, default)))
+    except (TypeError, ValueError):
+        return default
+
+
+def recent_turns():
+    """How many conversation lines are kept verbatim."""
+    return _env_int("NPC_MEMORY_RECENT_TURNS", 8)
+
+
+def token_budget():
+    """Most tokens of conversation history put into a single prompt."""
+    return _env_int("NPC_MEMORY_TOKEN_BUDGET", 600)
+
+
+def estimate_tokens(text):
+    return (len(text or "") + 3) // 4
+
+
+def _truncate_to_tokens(text, tokens):
+    max_chars = tokens * 4
+    if len(text) <= max_chars:
+        return text
+    return "..." + text[-max(0, max_chars - 3):]
+
+
+def grants_pass(line):
+    lower = str(line).lower()
+    return any(phrase in lower for phrase in PASS_GRANTED_PHRASES)
+
+
+def remember(npc, *lines):
+    """Add lines to the NPC's memory, folding the oldest ones out of the verbatim window."""
+    with _lock:
+        if getattr(npc, "_past_conversation", None) is None:
+            npc._past_conversation = []
+        npc._memory_turns = conversation_length(npc) + len(lines)
+        npc._pass_record = npc_rules.record_lines(lines, getattr(npc, "_pass_record", None))
+        npc._past_conversation.extend(lines)
+        overflow = len(npc._past_conversation) - recent_turns()
+        if overflow <= 0:
+            return None
+        folded = npc._past_conversation[:overflow]
+        del npc._past_conversation[:overflow]
+        if any(grants_pass(line) for line in folded):
+            npc._pass_granted = True
+        npc._summary_pending = list(getattr(npc, "_summary_pending", None) or []) + folded
+    return schedule_summary(npc)
+
+
+def replace_line(npc, old, new):
+    """Replace the newest remembered copy of `old` (e.g. fallback text answered late). False if gone."""
+    with _lock:
+        for lines in (getattr(npc, "_past_conversation", None), getattr(npc, "_summary_pending", None)):
+            if not lines:
+                continue
+            for i in range(len(lines) - 1, -1, -1):
+                if lines[i] == old:
+                    lines[i] = new
+                    return True
+    return False
+
+
+def conversation_length(npc):
+    """Lines ever remembered by this NPC; unlike the verbatim window, it only grows."""
+    turns = getattr(npc, "_memory_turns", None)
+    if turns is None:
+        turns = (len(getattr(npc, "_past_conversation", None) or [])
+                 + len(getattr(npc, "_summary_pending", None) or []))
+    return turns
+
+
+def pass_record(npc):
+    """The NPC's running pass record (see npc_rules.record_lines)."""
+    with _lock:
+        record = getattr(npc, "_pass_record", None)
+        if record is None:
+            # Built by hand rather than through remember(); count what is still verbatim.
+            record = npc_rules.record_lines(list(getattr(npc, "_summary_pending", None) or [])
+                                            + list(getattr(npc, "_past_conversation", None) or []))
+        return dict(record)
+
+
+def history_for_prompt(npc, budget=None):
+    """Summary, pending and recent lines as prompt text, trimmed to the token budget."""
+    budget = budget or token_budget()
+    with _lock:
+        recent = list(getattr(npc, "_past_conversation", None) or [])
+        pending = list(getattr(npc, "_summary_pending", None) or [])
+        summary = getattr(npc, "_conversation_summary", None) or ""
+
+    # Newest lines are worth the most, so fill the budget from the end backwards.
+    kept = []
+    remaining = budget
+    for line in reversed(pending + recent):
+        cost = estimate_tokens(line) + 1
+        if cost > remaining:
+            if not kept:
+                kept.append(_truncate_to_tokens(str(line), remaining))
+                remaining = 0
+            break
+        kept.append(str(line))
+        remaining -= cost
+    kept.reverse()
+
+    parts = []
+    if summary and remaining > 8:
+        parts.append("Summary of earlier events: " + _truncate_to_tokens(summary, remaining - 8) + ".")
+    if kept:
+        parts.append(" ".join(kept))
+    return " ".join(parts)
+
+
+def _summary_prompt(npc, summary, lines):
+    return (
+        "Update the running memory of the NPC named " + str(getattr(npc, "_name", "the NPC"))
+        + " about their dealings with the player. Keep it under 120 words, written as plain notes."
+        + " Keep facts that matter later: promises, insults, bribes, whether the player was allowed"
+        + " to pass, fights and injuries, and quests offered."
+        + " Current memory: " + (summary or "(none)")
+        + " New events: " + " ".join(str(line) for line in lines)
+        + " Return only the updated memory."
+    )
+
+
+def refresh_summary(npc):
+    """Fold the pending lines into the summary with one LLM call, then persist the NPC's memory."""
+    with _lock:
+        pending = list(getattr(npc, "_summary_pending", None) or [])
+        summary = getattr(npc, "_conversation_summary", None) or ""
+    if not pending:
+        return summary
+    try:
+        with call_context("batch"):
+            new_summary = call_ai(_summary_prompt(npc, summary, pending), site="npc_memory_summary")
+    except Exception as e:
+        # The lines stay pending and are retried with the next fold.
+        print("Warning: failed to refresh NPC memory summary:", e)
+        return summary
+    with _lock:
+        npc._conversation_summary = new_summary
+        # Lines folded while the call was running stay pending for the next refresh.
+        npc._summary_pending = list(getattr(npc, "_summary_pending", None) or [])[len(pending):]
+        fields = memory_fields(npc)
+    npc_id = getattr(npc, "_id", None)
+    if npc_id is not None:
+        npc.update_npc(npc_id, fields)
+    return new_summary
+
+
+def _get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="npc-memory")
+        return _executor
+
+
+def schedule_summary(npc):
+    """Refresh the NPC's summary in the background, one refresh per NPC at a time."""
+    with _lock:
+        if getattr(npc, "_summary_future", None) is not None and not npc._summary_future.done():
+            return npc._summary_future
+        npc._summary_future = _get_executor().submit(refresh_summary, npc)
+        return npc._summary_future
+
+
+def memory_fields(npc):
+    """The NPC document fields that hold its memory."""
+    with _lock:
+        return {
+            "conversations": list(getattr(npc, "_past_conversation", None) or []),
+            "conversation_summary": getattr(npc, "_conversation_summary", None) or "",
+            "conversation_pending": list(getattr(npc, "_summary_pending", None) or []),
+            "pass_granted": bool(getattr(npc, "_pass_granted", False)),
+            "pass_record": pass_record(npc),
+            "conversation_turns": conversation_length(npc),
+        }
+
+
+def load_memory(npc, doc):
+    """Restore the memory fields written by memory_fields()."""
+    npc._past_conversation = doc.get("conversations") or []
+    npc._conversation_summary = doc.get("conversation_summary") or ""
+    npc._summary_pending = doc.get("conversation_pending") or []
+    npc._pass_granted = bool(doc.get("pass_granted", False))
+    # Documents written before the record existed only have their unsummarised lines to go on.
+    npc._pass_record = doc.get("pass_record") or npc_rules.record_lines(
+        npc._summary_pending + npc._past_conversation)
+    npc._memory_turns = doc.get("conversation_turns")
+    # Documents written before memory was bounded can hold a long history; fold it now.
+    if len(npc._past_conversation) > recent_turns():
+        remember(npc)
@@ -0,0 +1,96 @@
+# Deterministic scoring for whether an NPC lets the player past. Clear-cut cases are decided
+# here without an LLM call; only scores inside the ambiguous band (NPC_PASS_DENY_BELOW ..
+# NPC_PASS_ALLOW_ABOVE) are left to the model. The score reads a running record of the NPC's
+# dealings with the player (see record_lines) rather than its memory text, since old lines are
+# folded into an LLM-written summary where they can no longer be counted.
+import os
+import re
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+COMBAT_PENALTY = 12
+MAX_COMBAT_PENALTY = 36
+REFUSED_BRIBE_PENALTY = 8
+BLOCKED_PENALTY = 3
+MAX_BRIBE_BONUS = 30
+
+_BRIBE_AMOUNT = re.compile(r"(\d+) gold")
+
+
+def _env_int(name, default):
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def pass_band():
+    """(deny_below, allow_above): scores outside this range are decided without the LLM."""
+    low = _env_int("NPC_PASS_DENY_BELOW", 35)
+    high = _env_int("NPC_PASS_ALLOW_ABOVE", 75)
+    return low, max(low, high)
+
+
+def empty_record():
+    return {"fights": 0, "refused_bribes": 0, "blocked": 0, "largest_bribe": 0}
+
+
+def record_lines(lines, record=None):
+    """
+    `record` (a dict from empty_record) updated with memory lines: fights, refused bribes and
+    blocked pass attempts are counted, and the largest bribe offered, in gold, is kept.
+    """
+    record = dict(record or empty_record())
+    for line in lines:
+        lower = str(line).lower()
+        if lower.startswith("combat note"):
+            record["fights"] += 1
+        elif "refused" in lower and "bribe" in lower:
+            record["refused_bribes"] += 1
+        elif "exit the room here and was blocked" in lower:
+            record["blocked"] += 1
+        if "bribe" in lower:
+            offers = [int(amount) for amount in _BRIBE_AMOUNT.findall(lower)]
+            record["largest_bribe"] = max([record["largest_bribe"]] + offers)
+    return record
+
+
+def bribe_bonus(bribe, friendlyness, toughness):
+    """
+    Goodwill from a bribe: the offer weighed against the NPC's toughness, as the bribe odds
+    are, up to MAX_BRIBE_BONUS. A hostile NPC counts it for half as much as a friendly one.
+    """
+    if not bribe or bribe <= 0:
+        return 0
+    worth = min(1.0, bribe / (int(toughness or 0) + 1))
+    return int(MAX_BRIBE_BONUS * worth * (0.5 + int(friendlyness or 0) / 200))
+
+
+def pass_score(friendlyness, toughness, modifiers, record):
+    """
+    Score 0-100 for letting the player pass. Friendliness is the base; persuasion and
+    intimidation (from Npc._interaction_modifiers) help, a tough NPC is harder to intimidate,
+    and the largest bribe offered (see bribe_bonus) buys goodwill even if it was refused.
+    Fights, refused bribes and earlier blocked attempts in the NPC's record count against it.
+    """
+    record = record or empty_record()
+    score = int(friendlyness or 0)
+    score += 2 * int(modifiers.get("persuasion", 0) or 0)
+    score += max(0, int(modifiers.get("intimidation", 0) or 0) - int(toughness or 0) // 10)
+    score += bribe_bonus(record.get("largest_bribe", 0), friendlyness, toughness)
+    score -= min(MAX_COMBAT_PENALTY, record.get("fights", 0) * COMBAT_PENALTY)
+    score -= record.get("refused_bribes", 0) * REFUSED_BRIBE_PENALTY
+    score -= record.get("blocked", 0) * BLOCKED_PENALTY
+    return max(0, min(100, score))
+
+
+def decide_pass(score, band=None):
+    """True/False for clear-cut scores, None when the LLM should decide."""
+    low, high = band or pass_band()
+    if score < low:
+        return False
+    if score > high:
+        return True
+    return None
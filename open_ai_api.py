@@ -1,15 +1,71 @@
 from dotenv import load_dotenv
 import os
+import threading
+import time
+from contextlib import contextmanager
+
+from ai_cache import ResponseCache, cache_enabled
+from call_scheduler import CallScheduler
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+from llm_profiles import DEFAULT_PROFILE, get_profile, request_options
+from metrics import TOKEN_BUCKETS, metrics_registry
 
 load_dotenv()
 
-DEFAULT_CLAUDE_MODEL = "claude-haiku-4-5-20251001"
-CLAUDE_MODEL = os.getenv("CLAUDE_MODEL", DEFAULT_CLAUDE_MODEL)
+# Per-site model, max_tokens, temperature, stop sequences and timeout live in llm_profiles.py.
+CLAUDE_MODEL = DEFAULT_PROFILE["model"]
+DEFAULT_MAX_TOKENS = DEFAULT_PROFILE["max_tokens"]
 _client = None
+_response_cache = None
+_response_cache_lock = threading.Lock()
+# Per-thread destination for streamed text; set by stream_to() while a streaming request runs.
+_stream_local = threading.local()
+# Concurrency cap, single-flight and retry/backoff for every provider call.
+_scheduler = CallScheduler.from_env()
+
+metrics_registry.describe("llm_calls_total",
+                          "LLM calls by call site and outcome (ok, error, cache_hit, coalesced, circuit_open)")
+metrics_registry.describe("llm_errors_total", "Failed LLM calls by call site and exception type")
+metrics_registry.describe("llm_latency_seconds", "LLM call duration by call site")
+metrics_registry.describe("llm_first_token_seconds", "Time to first streamed token by call site")
+metrics_registry.describe("llm_input_tokens", "Prompt tokens per LLM call by call site")
+metrics_registry.describe("llm_output_tokens", "Completion tokens per LLM call by call site")
+metrics_registry.describe("llm_cache_read_tokens_total", "Prompt tokens served from the provider's prompt cache")
+metrics_registry.describe("llm_cache_write_tokens_total", "Prompt tokens written to the provider's prompt cache")
+
+
+def prompt_cache_enabled():
+    """Whether system prefixes carry cache_control markers for provider-side prompt caching."""
+    return os.getenv("PROMPT_CACHE_ENABLED", "true").strip().lower() in ("1", "true", "yes", "on")
+
+
+def system_blocks(system):
+    """
+    The `system` argument of call_ai as provider text blocks. A string or a sequence of strings
+    (ordered from most to least widely shared, e.g. instructions then persona); the last block
+    carries the cache breakpoint, so everything up to it can be served from the prompt cache.
+    """
+    if not system:
+        return None
+    parts = [system] if isinstance(system, str) else [part for part in system if part]
+    blocks = [{"type": "text", "text": part} for part in parts]
+    if blocks and prompt_cache_enabled():
+        blocks[-1]["cache_control"] = {"type": "ephemeral"}
+    return blocks or None
+
+
+def llm_backend():
+    """Which client call_ai uses: "anthropic" (default) or "stub" (see stub_llm.py)."""
+    return os.getenv("LLM_BACKEND", "anthropic").strip().lower()
 
 
 def _get_client():
     global _client
+    if _client is None and llm_backend() == "stub":
+        from stub_llm import StubClient
+
+        print("LLM_BACKEND=stub: using the local stand-in backend, no provider calls will be made")
+        _client = StubClient()
     if _client is None:
         import anthropic
 
@@ -20,10 +76,166 @@ def _get_client():
     return _client
 
 
-def call_ai(request_text):
+def get_response_cache():
+    """Return the shared response cache, or None when AI_CACHE_ENABLED is off."""
+    global _response_cache
+    if not cache_enabled():
+        return None
+    with _response_cache_lock:
+        if _response_cache is None:
+            _response_cache = ResponseCache.from_env()
+        return _response_cache
+
+
+@contextmanager
+def stream_to(sink):
+    """
+    While active, call_ai(..., stream=True) calls made on this thread pass each piece of
+    text to sink(text) as it arrives, in addition to returning the full response.
+    """
+    previous = getattr(_stream_local, "sink", None)
+    _stream_local.sink = sink
+    try:
+        yield
+    finally:
+        _stream_local.sink = previous
+
+
+def promote_calls(context, priority="interactive"):
+    """Move calls made under a call_context() up to `priority`, e.g. when a player now waits on them."""
+    _scheduler.promote(context, priority)
+
+
+def current_stream_sink():
+    """The stream_to() sink active on this thread, or None."""
+    return getattr(_stream_local, "sink", None)
+
+
+def call_ai(request_text, cacheable=False, stream=False, site="unlabelled", system=None):
+    """
+    Send a prompt to the model and return the stripped response text.
+
+    Pass cacheable=True only for prompts that contain nothing player-specific; those responses
+    may be served from the response cache when it is enabled. Pass stream=True for player-facing
+    narration; when a stream_to() sink is active the text is relayed to it as it is generated.
+    `site` names the caller (e.g. "npc_name", "allow_pass"); it selects the generation profile
+    (see llm_profiles.py) and labels the /metrics latency, token and error series.
+    Raises CircuitOpenError while the provider is down (cached responses are still served).
+
+    Put text that stays the same across calls (instructions, persona, room context) in
+    `system` and only the changing part in request_text, so the provider can cache the prefix.
+    """
+    options = request_options(get_profile(site))
+    blocks = system_blocks(system)
+    if blocks:
+        options["system"] = blocks
+    prefix = "\n".join(block["text"] for block in blocks or ())
+    sink = getattr(_stream_local, "sink", None) if stream else None
+    cache = get_response_cache() if cacheable else None
+    cache_key = None
+    if cache is not None:
+        cache_key = cache.make_key(options["model"], options["max_tokens"], prefix + request_text,
+                                   temperature=options.get("temperature"), stop=options.get("stop_sequences"))
+        cached = cache.get(cache_key)
+        if cached is not None:
+            metrics_registry.inc("llm_calls_total", {"site": site, "outcome": "cache_hit"})
+            if sink is not None:
+                sink(cached)
+            return cached
+
+    started = time.monotonic()
+    try:
+        # Fail fast while the provider is down, rather than queueing for a slot.
+        _breaker.before_call(site)
+        if sink is not None:
+            # Streamed text can't be taken back, so only retry until the first chunk is sent.
+            sent = []
+            (text, usage), coalesced = _scheduler.run(
+                lambda: _breaker.call(
+                    lambda: _stream_message(request_text, options,
+                                            lambda chunk: (sent.append(1), sink(chunk)), site, started),
+                    site),
+                site=site,
+                can_retry=lambda: not sent,
+            )
+        else:
+            # Identical prompts already in flight share one provider call.
+            (text, usage), coalesced = _scheduler.run(
+                lambda: _breaker.call(lambda: _create_message(request_text, options), site),
+                site=site,
+                key=(options["model"], options["max_tokens"], options.get("temperature"),
+                     tuple(options.get("stop_sequences") or ()), prefix, request_text),
+            )
+    except CircuitOpenError:
+        _record_call(site, started, "circuit_open")
+        raise
+    except Exception as e:
+        _record_call(site, started, "error", error=type(e).__name__)
+        raise
+    if coalesced:
+        # The call that actually reached the provider has already recorded its tokens.
+        _record_call(site, started, "coalesced")
+    else:
+        _record_call(site, started, "ok", usage=usage)
+
+    if cache is not None:
+        cache.put(cache_key, text)
+    return text
+
+
+def _probe_provider():
+    """Smallest possible request, used by the circuit breaker to notice the provider is back."""
+    _create_message("ping", request_options(get_profile("health_probe")))
+
+
+# Stops calling the provider after repeated failures; see circuit_breaker.py.
+_breaker = CircuitBreaker.from_env(probe=_probe_provider)
+
+
+def circuit_open():
+    """True while provider calls are refused and callers should use fallback content."""
+    return _breaker.is_open
+
+
+def _create_message(request_text, options):
     message = _get_client().messages.create(
-        model=CLAUDE_MODEL,
-        max_tokens=1024,
         messages=[{"role": "user", "content": request_text}],
+        **options,
     )
-    return message.content[0].text.strip()
+    return message.content[0].text.strip(), getattr(message, "usage", None)
+
+
+def _stream_message(request_text, options, sink, site, started):
+    parts = []
+    with _get_client().messages.stream(
+        messages=[{"role": "user", "content": request_text}],
+        **options,
+    ) as stream:
+        for chunk in stream.text_stream:
+            if not parts:
+                metrics_registry.observe("llm_first_token_seconds", time.monotonic() - started,
+                                         {"site": site})
+            parts.append(chunk)
+            sink(chunk)
+        get_final_message = getattr(stream, "get_final_message", None)
+        usage = getattr(get_final_message(), "usage", None) if get_final_message else None
+    return "".join(parts).strip(), usage
+
+
+def _record_call(site, started, outcome, usage=None, error=None):
+    labels = {"site": site}
+    metrics_registry.inc("llm_calls_total", {"site": site, "outcome": outcome})
+    metrics_registry.observe("llm_latency_seconds", time.monotonic() - started, labels)
+    if error is not None:
+        metrics_registry.inc("llm_errors_total", {"site": site, "error": error})
+    if usage is not None:
+        input_tokens = getattr(usage, "input_tokens", None) or 0
+        output_tokens = getattr(usage, "output_tokens", None) or 0
+        metrics_registry.inc("llm_input_tokens_total", labels, input_tokens)
+        metrics_registry.inc("llm_output_tokens_total", labels, output_tokens)
+        metrics_registry.observe("llm_input_tokens", input_tokens, labels, buckets=TOKEN_BUCKETS)
+        metrics_registry.observe("llm_output_tokens", output_tokens, labels, buckets=TOKEN_BUCKETS)
+        metrics_registry.inc("llm_cache_read_tokens_total", labels,
+                             getattr(usage, "cache_read_input_tokens", None) or 0)
+        metrics_registry.inc("llm_cache_write_tokens_total", labels,
+                             getattr(usage, "cache_creation_input_tokens", None) or 0)
@@ -0,0 +1,159 @@
+# Speculative generation of the rooms next to the player. When a room is shown, its unvisited
+# neighbours get their NPC, description, items and map generated in the background so the next
+# move usually finds them ready instead of waiting on several LLM round-trips. Their LLM calls
+# run in the "prefetch" priority class, and are promoted to interactive once the player walks
+# into a room that is still being prefetched.
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from dotenv import load_dotenv
+
+from call_scheduler import CallContext, using_call_context
+
+load_dotenv()
+
+NEIGHBOUR_OFFSETS = [(0, 1), (0, -1), (1, 0), (-1, 0)]
+
+
+def prefetch_enabled():
+    return os.getenv("ROOM_PREFETCH_ENABLED", "true").strip().lower() in ("1", "true", "yes", "on")
+
+
+def _env_int(name, default):
+    try:
+        return max(1, int(os.getenv(name, default)))
+    except (TypeError, ValueError):
+        return default
+
+
+class RoomPrefetcher:
+    """Background room generation with a per-user cap and per-user cancellation."""
+
+    def __init__(self, max_workers=None, per_user_limit=None):
+        self._max_workers = max_workers or _env_int("ROOM_PREFETCH_WORKERS", 4)
+        self._per_user_limit = per_user_limit or _env_int("ROOM_PREFETCH_PER_USER", 2)
+        self._executor = None
+        self._lock = threading.Lock()
+        self._jobs = {}  # userId -> {(x, y): Future}
+        self._contexts = {}  # Future -> CallContext its LLM calls run under
+        self._cancelled = {}  # userId -> Event for the user's current session
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self._max_workers,
+                                                thread_name_prefix="room-prefetch")
+        return self._executor
+
+    def in_flight(self, userId):
+        with self._lock:
+            return len(self._jobs.get(userId, {}))
+
+    def prefetch_neighbours(self, userId, holder):
+        """Queue generation for unvisited, ungenerated rooms next to the player's position."""
+        cur_x, cur_y = holder.get_current_pos()
+        queued = []
+        for dx, dy in NEIGHBOUR_OFFSETS:
+            x, y = cur_x + dx, cur_y + dy
+            room = holder.get_room(userId, x, y)
+            if room is None or room._visited or getattr(room, "_generated", False):
+                continue
+            if self._submit(userId, holder, room, x, y):
+                queued.append((x, y))
+        return queued
+
+    def _submit(self, userId, holder, room, x, y):
+        with self._lock:
+            jobs = self._jobs.setdefault(userId, {})
+            if (x, y) in jobs:
+                return False
+            if len(jobs) >= self._per_user_limit:
+                return False
+            cancelled = self._cancelled.setdefault(userId, threading.Event())
+            context = CallContext("prefetch", userId)
+            future = self._get_executor().submit(self._run, userId, holder, room, x, y, cancelled, context)
+            jobs[(x, y)] = future
+            self._contexts[future] = context
+        future.add_done_callback(lambda _f: self._forget(userId, (x, y), future))
+        return True
+
+    def _forget(self, userId, pos, future):
+        with self._lock:
+            self._contexts.pop(future, None)
+            jobs = self._jobs.get(userId)
+            if jobs is not None and jobs.get(pos) is future:
+                del jobs[pos]
+                if not jobs:
+                    del self._jobs[userId]
+
+    def _run(self, userId, holder, room, x, y, cancelled, context):
+        # A running LLM call can't be interrupted, so cancellation is checked between steps.
+        from all_global_vars import all_global_vars
+        from map_generator import generate_room_map
+
+        if cancelled.is_set():
+            return False
+        try:
+            with using_call_context(context):
+                room.generate_description(userId, mark_visited=False)
+            if cancelled.is_set():
+                return False
+            theme_era = all_global_vars.get_player_character(userId).get_theme()
+            room._map_html = generate_room_map(holder, theme_era, userId=userId, pos=(x, y))
+            print(f"Prefetched room at {x}, {y} for {userId}")
+            return True
+        except Exception as e:
+            print(f"Prefetch of room {x}, {y} failed, it will be generated on entry:", e)
+            return False
+
+    def wait_for(self, userId, x, y, timeout=None):
+        """Block until an in-flight prefetch of this room finishes, so it isn't generated twice."""
+        from open_ai_api import promote_calls
+
+        with self._lock:
+            future = self._jobs.get(userId, {}).get((x, y))
+            context = self._contexts.get(future)
+        if future is None:
+            return False
+        if context is not None:
+            # The player is waiting now; queued prefetch calls shouldn't sit behind other work.
+            promote_calls(context)
+        try:
+            return bool(future.result(timeout=timeout))
+        except Exception:
+            return False
+
+    def cancel_user(self, userId, wait_timeout=None):
+        """
+        Drop queued prefetches for a user whose session ended; running ones discard their work.
+        A running job still stores the room and NPC it generated, so before deleting the user's
+        data pass wait_timeout to wait (up to that many seconds) for those to finish.
+        """
+        from open_ai_api import promote_calls
+
+        with self._lock:
+            cancelled = self._cancelled.pop(userId, None)
+            jobs = self._jobs.pop(userId, {})
+            contexts = [self._contexts.get(future) for future in jobs.values()]
+        if cancelled is not None:
+            cancelled.set()
+        running = [future for future in jobs.values() if not future.cancel()]
+        if running and wait_timeout is not None:
+            # The player is waiting on the restart now.
+            for context in contexts:
+                if context is not None:
+                    promote_calls(context)
+            wait(running, timeout=wait_timeout)
+        return len(jobs)
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            users = list(self._cancelled)
+        for userId in users:
+            self.cancel_user(userId)
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+
+
+room_prefetcher = RoomPrefetcher()
@@ -0,0 +1,134 @@
+# Prompt templates with a token budget per call site. Templates are compiled once at import;
+# render() fills them in, estimates the size (about four characters per token) and, when the
+# prompt is over its site's budget (the "prompt_budget" profile field, see llm_profiles.py),
+# shortens the sections marked as cuttable, lowest priority first: a history keeps its latest
+# lines, a description keeps its opening. The size of every rendered prompt is logged and
+# reported to /metrics.
+import string
+
+from llm_profiles import get_profile
+from metrics import TOKEN_BUCKETS, metrics_registry
+
+ELLIPSIS = "..."
+
+metrics_registry.describe("prompt_tokens", "Estimated size of rendered prompts in tokens, by call site")
+metrics_registry.describe("prompt_truncations_total", "Prompt fields shortened to fit the site's budget")
+
+
+def estimate_tokens(text):
+    """Rough token count: about four characters per token for English prose."""
+    return (len(text or "") + 3) // 4
+
+
+def truncate(text, max_chars, keep="head"):
+    """text cut to at most max_chars on a word boundary where one is close, marked with an ellipsis."""
+    if len(text) <= max_chars:
+        return text
+    room = max(0, max_chars - len(ELLIPSIS))
+    if keep == "tail":
+        cut = text[len(text) - room:] if room else ""
+        space = cut.find(" ")
+        if 0 <= space < 20:
+            cut = cut[space + 1:]
+        return ELLIPSIS + cut
+    cut = text[:room]
+    space = cut.rfind(" ")
+    if space > 0 and space >= room - 20:
+        cut = cut[:space]
+    return cut + ELLIPSIS
+
+
+def _compile(template):
+    parts = []
+    for literal, field, spec, conversion in string.Formatter().parse(template):
+        if spec or conversion:
+            raise ValueError(f"Format specs are not supported in prompt templates: {template!r}")
+        parts.append((literal, field))
+    return parts
+
+
+class Section:
+    """
+    One piece of a template, with {field} placeholders. `cut` names the field that may be
+    shortened (down to min_chars, keeping its "head" or "tail") when the prompt is over budget;
+    lower `priority` is cut first. An optional section renders as "" if any field is empty.
+    """
+
+    def __init__(self, template, cut=None, priority=0, keep="head", min_chars=0, optional=False):
+        self._parts = _compile(template)
+        self.fields = {field for _literal, field in self._parts if field}
+        if cut is not None and cut not in self.fields:
+            raise ValueError(f"Cut field '{cut}' is not in the section {template!r}")
+        self.cut = cut
+        self.priority = priority
+        self.keep = keep
+        self.min_chars = min_chars
+        self.optional = optional
+
+    def render(self, values):
+        if self.optional and not all(values.get(field) for field in self.fields):
+            return ""
+        return "".join(literal + (str(values[field]) if field else "") for literal, field in self._parts)
+
+
+def _section(piece):
+    # Plain strings are fixed text, so braces in them (JSON schemas) are taken literally.
+    if isinstance(piece, Section):
+        return piece
+    return Section(piece.replace("{", "{{").replace("}", "}}"))
+
+
+class Prompt:
+    """A rendered prompt: the system prefix (tuple of strings, or None) and the request text."""
+
+    def __init__(self, site, system, text, tokens, truncated):
+        self.site = site
+        self.system = system
+        self.text = text
+        self.tokens = tokens
+        self.truncated = truncated
+
+
+class PromptTemplate:
+    """A call site's prompt: optional system sections (one block each) and the request sections."""
+
+    def __init__(self, site, sections, system=()):
+        self.site = site
+        self.system = [_section(piece) for piece in system]
+        self.sections = [_section(piece) for piece in sections]
+        self._cuttable = sorted((s for s in self.system + self.sections if s.cut), key=lambda s: s.priority)
+
+    def render(self, **values):
+        """Fill in the template and fit it to the site's prompt budget."""
+        budget = get_profile(self.site).get("prompt_budget")
+        prompt = self.fit(values, budget)
+        metrics_registry.observe("prompt_tokens", prompt.tokens, {"site": self.site}, buckets=TOKEN_BUCKETS)
+        for field in prompt.truncated:
+            metrics_registry.inc("prompt_truncations_total", {"site": self.site, "field": field})
+        note = f", cut {', '.join(prompt.truncated)} to fit {budget}" if prompt.truncated else ""
+        print(f"Prompt {self.site}: ~{prompt.tokens} tokens{note}")
+        return prompt
+
+    def fit(self, values, budget=None):
+        """The rendered Prompt, with cuttable fields shortened until it fits `budget` tokens."""
+        values = dict(values)
+        truncated = []
+        system, text, tokens = self._render(values)
+        for section in self._cuttable if budget else ():
+            over = tokens - budget
+            if over <= 0:
+                break
+            value = str(values.get(section.cut) or "")
+            limit = max(section.min_chars, len(value) - over * 4 - len(ELLIPSIS))
+            if limit >= len(value):
+                continue
+            values[section.cut] = truncate(value, limit, section.keep)
+            truncated.append(section.cut)
+            system, text, tokens = self._render(values)
+        return Prompt(self.site, system, text, tokens, truncated)
+
+    def _render(self, values):
+        system = tuple(block for block in (s.render(values) for s in self.system) if block) or None
+        text = "".join(s.render(values) for s in self.sections)
+        tokens = estimate_tokens(text) + sum(estimate_tokens(block) for block in system or ())
+        return system, text, tokens
@@ -1,11 +1,23 @@
 import random
+import threading
 import user_db
 import os
-from item import get_ai_items
+from item import default_items, get_ai_items
 from bson import ObjectId
 from open_ai_api import call_ai
 from all_global_vars import all_global_vars
 from map_generator import generate_room_map, _classify_interior
+from task_graph import TaskGraph
+from content_library import content_library, library_enabled
+from room_bundle import bundle_mode_enabled, get_room_bundle
+from prefetch import prefetch_enabled, room_prefetcher
+from job_queue import job_queue
+from deadlines import call_by_deadline, current_deadline, narrate_by_deadline
+import notifications
+from combat_narration import theme_key
+from xp import save_character
+from narration_pool import effect_class, narration_pool, pool_enabled, pool_prompt
+from prompt_templates import PromptTemplate, Section
 from dotenv import load_dotenv
 from pymongo import MongoClient
 
@@ -188,10 +200,62 @@ def _generate_loot_item(theme):
     return {"name": name, "desc": desc, "rarity": rarity, "value": value}
 
 
+# Shown when the room description misses the command deadline, until the real one arrives.
+_STOCK_DESCRIPTIONS = {
+    "medieval": "Cold stone walls close in around you, lit by the uneven glow of a guttering torch.",
+    "steampunk": "Pipes hiss and rattle overhead, and the air is thick with the smell of oil and coal smoke.",
+    "cyberpunk": "Neon light bleeds through the haze, and the hum of unseen machinery fills the silence.",
+}
+
+
+ROOM_DESCRIPTION_INSTRUCTIONS = (
+    "Make up a location or MUD room description for a text adventure. Don't list any exits or items "
+    "or anything other than a description of a location. Make each location feel visually distinct "
+    "from other rooms."
+)
+
+# Instructions and the player's world form the cached prefix; the rest differs per room. Over
+# budget, the embedded NPC description is shortened.
+ROOM_DESCRIPTION_TEMPLATE = PromptTemplate(
+    "room_description",
+    system=[
+        ROOM_DESCRIPTION_INSTRUCTIONS,
+        Section("The theme is {theme}. The player character is named {player}."),
+    ],
+    sections=[
+        "Describe this location.",
+        Section(" The room archetype is {identity}.", optional=True),
+        Section(" Include a mention of an NPC named {npc_name}", optional=True),
+        Section(" and subtlely include the description {npc_description}", cut="npc_description",
+                min_chars=150, optional=True),
+    ],
+)
+
+# The room description is context only, so it is the first thing shortened.
+INTERACT_TEMPLATE = PromptTemplate("interact_narration", [
+    Section("Theme: {theme}. Room: {room}", cut="room", min_chars=120),
+    Section(" An NPC named {npc_name} is present.", optional=True),
+    Section("\nThe player performs '{action}' on the {obj_name} ({obj_desc}).\n", cut="obj_desc",
+            priority=1, min_chars=60),
+    Section("Result: {result}\n"),
+    "Write 2-3 sentences narrating this in an immersive, theme-appropriate way. "
+    "Weave the result naturally into the description. No lists, no headings.",
+])
+
+
+def _stock_description(theme, room_identity=None, npc_name=None):
+    intro = f"You enter the {room_identity}. " if room_identity else ""
+    outro = f" {npc_name} is here." if npc_name else ""
+    return intro + _STOCK_DESCRIPTIONS[theme_key(theme)] + outro
+
+
 class Room:
     def __init__(self, x_cord, y_cord, npc_factory=None):
         self._description = "Not Generated Yet"
+        # Set while the description is stock text waiting for a late LLM answer (see deadlines.py).
+        self._pending_update_id = None
         self._visited = False
+        self._generated = False
         self._map_html = None
         self._npc_factory = npc_factory
         self._npc = None
@@ -225,7 +289,14 @@ class Room:
         self._room_pos_x = pos_x
         self._room_pos_y = pos_y
 
-    def generate_description(self, userId, npc=None):
+    def generate_description(self, userId, npc=None, bundle=None, mark_visited=True):
+        """
+        Generate the room's NPC, description and items on first visit. `bundle` is a room
+        bundle (see room_bundle.get_room_bundle); with CONTENT_LIBRARY_ENABLED one is sampled
+        from the shared content library, and when ROOM_GENERATION_MODE=bundle one is
+        requested here. Fields the bundle doesn't provide fall back to the per-field prompts.
+        Prefetching passes mark_visited=False so the room stays unvisited until entered.
+        """
         print("GEN_DESC room id:", getattr(self, "_id", None),
               "pos:", self._room_pos_x, self._room_pos_y,
               "factory:", self._npc_factory)
@@ -241,51 +312,136 @@ class Room:
         # Set room coordinates for NPC
         self._npc.set_room(self._room_pos_x, self._room_pos_y)
 
-        # Store NPC
-        npc_id = self._npc.store_npc()
-        self._npc_id = npc_id
-        self.update_room(self._id, {"_npc_id": npc_id})  # Update room with npc_id
-
-        # Generate Room Description
-        client_response = ""
-        setup_string = ("Make up a location or MUD room description fitting the theme "
-                        + all_global_vars.get_player_character(userId).get_theme()
-                        + " for a character named "
-                        + all_global_vars.get_player_character(userId).get_name()
-                        + ". Don't list any exits or items or anything other than a description of a location.")
-        if getattr(self, "_room_identity", None):
-            setup_string += (" The room archetype is " + self._room_identity +
-                             ". Make this location feel visually distinct from other rooms.")
-        if self._npc is not None:
-            setup_string += ("Include a mention of an NPC named " + self._npc.get_name() +
-                             " and subtlely include the description " + self._npc.get_description())
-        client_response += call_ai(setup_string) + "\n"
-        self._description = client_response
-        self._visited = True
+        player_char = all_global_vars.get_player_character(userId)
+        theme = player_char.get_theme()
+        theme_lower = (theme or "").lower()
 
-        # Seed deterministic room loot based on position/description
+        # Seed deterministic room loot based on position/description. The generator is the
+        # room's own: reseeding the random module would race with other rooms being prefetched.
         seed_key = getattr(self, "_seed", None)
         if seed_key is None:
             seed_key = random.randint(1, 999999)
             self._seed = seed_key
-        random.seed(seed_key)
+        rng = random.Random(seed_key)
+
+        # Shared library content only fits a fresh NPC; one that already has a name keeps it.
+        if bundle is None and library_enabled() and not npc.get_name():
+            bundle = content_library.room_bundle(theme, player_char.get_name(), self._room_identity) or None
+        if bundle is None and bundle_mode_enabled():
+            bundle = get_room_bundle(theme, player_char.get_name(), self._room_identity,
+                                     npc.get_toughness(), npc.get_friendlyness())
+        bundle = bundle or {}
+        npc.apply_bundle(bundle)
+
+        initial = {}
+        # The bundle's room text names its own NPC, so only use it if that's who is here.
+        if bundle.get("room_description") and npc.get_name() == bundle.get("npc_name"):
+            initial["room_description"] = bundle["room_description"]
+        if bundle.get("items"):
+            initial["items"] = bundle["items"]
+
+        # The LLM calls form a small dependency graph: the NPC description and the room
+        # description only need the NPC's name, and the items only need the room description,
+        # so independent calls run concurrently instead of back to back.
+        # The graph runs on worker threads, so hand them the command deadline explicitly; every
+        # step has stock content to fall back on. Prefetches run outside any command and simply
+        # wait for the model.
+        deadline = current_deadline()
+        graph = TaskGraph()
+        if not npc.get_name():
+            graph.add("npc_name", lambda _r: npc.generate_name(userId, deadline))
+        name_deps = ["npc_name"] if "npc_name" in graph else []
+        if not npc.get_description():
+            graph.add("npc_description", lambda _r: npc.generate_description(userId, deadline), deps=name_deps)
+
+        # Only embed the NPC description when it already exists; waiting for it would put
+        # the NPC description back on the critical path.
+        embed_npc_description = "npc_description" not in graph
+        late = {}
+
+        def describe(_r):
+            text, late["description"] = call_by_deadline(
+                userId,
+                lambda: self._call_description(player_char, npc, embed_npc_description),
+                _stock_description(theme, self._room_identity, npc.get_name()),
+                site="room_description",
+                deadline=deadline,
+            )
+            return text
+
+        def find_items(r):
+            # The same items get_ai_items falls back to when the model's answer is unusable.
+            stock_items = default_items(theme_lower, random.Random(seed_key))
+            if late.get("description") is not None:
+                # The deadline has already gone by; don't start a call nobody will wait for.
+                return stock_items
+            items, _late = call_by_deadline(
+                userId,
+                lambda: get_ai_items(theme_lower, r["room_description"], self._room_identity, rng),
+                stock_items,
+                site="items",
+                deadline=deadline,
+            )
+            return items
+
+        if "room_description" not in initial:
+            graph.add("room_description", describe, deps=name_deps)
+        if "items" not in initial:
+            graph.add("items", find_items, deps=["room_description"])
+        results = graph.run(initial=initial)
 
-        theme_lower = (all_global_vars.get_player_character(userId).get_theme() or "").lower()
+        # Store NPC
+        npc_id = self._npc.store_npc()
+        self._npc_id = npc_id
+        self.update_room(self._id, {"_npc_id": npc_id})  # Update room with npc_id
 
-        # Get a list of items
-        items = get_ai_items(theme_lower, self._description, self._room_identity, random)
-        self._items = items
+        self._description = results["room_description"] + "\n"
+        self._generated = True
+        if mark_visited:
+            self._visited = True
+        self._items = results["items"]
 
         # Update room with new description and items generated.
         self.update_room(self._id, {
             "description": self._description,
-            "visited": True,
+            "generated": True,
+            "visited": self._visited,
             "items": self._items,
             "seed": self._seed,
             "props": self._props,
             "interior_type": self._interior_type,
         })
 
+        # A stock description stands in until the model's answer arrives.
+        late_description = late.get("description")
+        if late_description is not None:
+            self._pending_update_id = late_description.update_id
+            late_description.when_ready(lambda text: self._fill_description(userId, text))
+
+    def _fill_description(self, userId, text):
+        """Swap in a room description that arrived after the command deadline."""
+        self._description = text + "\n"
+        self._pending_update_id = None
+        job_queue.enqueue(userId, self.update_room, self._id, {"description": self._description})
+
+    def mark_visited(self):
+        """Mark an already generated (e.g. prefetched) room as visited."""
+        self._visited = True
+        self.update_room(self._id, {"visited": True})
+
+    def _description_prompt(self, player_char, npc, embed_npc_description=True):
+        return ROOM_DESCRIPTION_TEMPLATE.render(
+            theme=player_char.get_theme(),
+            player=player_char.get_name(),
+            identity=getattr(self, "_room_identity", None),
+            npc_name=npc.get_name() if npc is not None else None,
+            npc_description=npc.get_description() if npc is not None and embed_npc_description else None,
+        )
+
+    def _call_description(self, player_char, npc, embed_npc_description=True):
+        prompt = self._description_prompt(player_char, npc, embed_npc_description)
+        return call_ai(prompt.text, site="room_description", system=prompt.system)
+
     def store_room(self):
         """
         Stores a room object in the MongoDB and returns the player_character_id.
@@ -294,6 +450,7 @@ class Room:
         room_doc = {
             "description": self._description,
             "visited": self._visited,
+            "generated": self._generated,
             "map": self._map_html,
             "x": self._room_pos_x,
             "y": self._room_pos_y,
@@ -328,6 +485,8 @@ class room_holder:
         self._cur_pos_x = 0
         self._cur_pos_y = 0
         self._npc_factory = None
+        # Guards lazy room loading, which prefetch threads do alongside requests.
+        self._load_lock = threading.RLock()
 
     def configure_grid(self, rows, cols):
         self._rows = max(2, int(rows))
@@ -391,6 +550,13 @@ class room_holder:
                 cached_room._npc_factory = getattr(self, "_npc_factory", None)
             return cached_room
 
+        with self._load_lock:
+            # Another thread may have loaded it while we waited.
+            if self._array_of_rooms[y][x] is not None:
+                return self._array_of_rooms[y][x]
+            return self._load_room(userId, x, y)
+
+    def _load_room(self, userId, x, y):
         player = all_global_vars.get_player_character(userId)
         room_id = player.get_room_id_at(x,y)
 
@@ -406,6 +572,7 @@ class room_holder:
         r = Room(x, y, npc_factory=getattr(self, "_npc_factory", None))
         r._id = room_doc["_id"]
         r._visited = bool(room_doc.get("visited", False))
+        r._generated = bool(room_doc.get("generated", r._visited))
         r._description = room_doc.get("description")
         r._items = room_doc.get("items") or []
         r._props = room_doc.get("props") or []
@@ -454,7 +621,13 @@ class room_holder:
         if cur_room == None:
             return "Error: Tried to describe a None room."
         if cur_room._visited == False:
-            cur_room.generate_description(userId)
+            # A background prefetch may already be generating this room; wait for it
+            # rather than generating it a second time.
+            room_prefetcher.wait_for(userId, self._cur_pos_x, self._cur_pos_y)
+            if getattr(cur_room, "_generated", False):
+                cur_room.mark_visited()
+            else:
+                cur_room.generate_description(userId)
 
         ret_string = ""
         theme_era = all_global_vars.get_player_character(userId).get_theme()
@@ -472,7 +645,10 @@ class room_holder:
         except Exception:
             pass
 
-        ret_string += cur_room._description
+        if getattr(cur_room, "_pending_update_id", None):
+            ret_string += notifications.placeholder(cur_room._pending_update_id, cur_room._description)
+        else:
+            ret_string += cur_room._description
         ret_string += "<BR>"
         ret_string += self.get_exits()
         items_here = getattr(cur_room, "_items", []) or []
@@ -491,6 +667,9 @@ class room_holder:
             prop_strs = [f"{n} ×{c}" if c > 1 else n for n, c in counts.items()]
             ret_string += "<BR>You can interact with: " + ", ".join(prop_strs)
 
+        if prefetch_enabled():
+            room_prefetcher.prefetch_neighbours(userId, self)
+
         return ret_string
 
     def set_npc_factory(self, factory):
@@ -771,32 +950,41 @@ class room_holder:
 
         # Persist if state changed
         if modified:
-            self.persist_room(userId, player_char)
-            user_doc = user_db.get_user_by_id(userId)
-            char_id = user_doc.get("_player_character_id") if user_doc else None
-            if char_id:
-                player_char.update_player_character(char_id)
-                cur_room_doc_id = getattr(cur_room, "_id", None)
-                if cur_room_doc_id:
-                    cur_room.update_room(cur_room_doc_id, {
-                        "items": list(getattr(cur_room, "_items", [])),
-                        "props": list(getattr(cur_room, "_props", [])),
-                    })
+            job_queue.enqueue(userId, self.persist_room, userId, player_char, key="rooms")
+            job_queue.enqueue(userId, save_character, userId, player_char, key="character")
+            cur_room_doc_id = getattr(cur_room, "_id", None)
+            if cur_room_doc_id:
+                job_queue.enqueue(userId, cur_room.update_room, cur_room_doc_id, {
+                    "items": list(getattr(cur_room, "_items", [])),
+                    "props": list(getattr(cur_room, "_props", [])),
+                })
 
         # ── AI narration ─────────────────────────────────────────────────────
-        room_snippet = (cur_room._description or "")[:300]
-        npc = cur_room.get_npc()
-        npc_note = f" An NPC named {npc.get_name()} is present." if npc else ""
-        result_note = effect_text if effect_text else "No special result — describe the sensory experience."
-
-        prompt = (
-            f"Theme: {theme}. Room: {room_snippet}{npc_note}\n"
-            f"The player performs '{action}' on the {obj_name} ({obj_desc}).\n"
-            f"Result: {result_note}\n"
-            f"Write 2-3 sentences narrating this in an immersive, theme-appropriate way. "
-            f"Weave the result naturally into the description. No lists, no headings."
-        )
-        narrative = call_ai(prompt)
+        # Shown instead if the model misses the command deadline.
+        fallback = f"You {action} the {obj_name}."
+        if pool_enabled():
+            # Shared variants keyed on what the text actually depends on; the exact effect
+            # is shown next to it below.
+            interior = getattr(cur_room, "_interior_type", None) or "room"
+            effect = effect_class(effect_text)
+            pool_key = (theme.lower(), interior, obj_name.lower(), action, effect)
+            narrative = narration_pool.get(
+                pool_key, pool_prompt(theme, interior, obj_name, action, effect), stream=True,
+                userId=userId, fallback=fallback)
+        else:
+            npc = cur_room.get_npc()
+            prompt = INTERACT_TEMPLATE.render(
+                theme=theme,
+                room=cur_room._description or "",
+                npc_name=npc.get_name() if npc else None,
+                action=action,
+                obj_name=obj_name,
+                obj_desc=obj_desc,
+                result=effect_text if effect_text else "No special result — describe the sensory experience.",
+            )
+            narrative = narrate_by_deadline(
+                userId, lambda: call_ai(prompt.text, stream=True, site="interact_narration"), fallback,
+                site="interact_narration")
 
         if effect_text:
             return f"{narrative}<BR><em>({effect_text})</em>"
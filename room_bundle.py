@@ -0,0 +1,111 @@
+import json
+import os
+from open_ai_api import call_ai
+from item import ITEM_SCHEMA_EXAMPLE, _validate_ai_items
+from prompt_templates import PromptTemplate, Section
+
+
+# One structured request that returns everything a first room visit needs. Any field that is
+# missing or invalid is left out of the result so the caller can fall back to the per-field
+# prompts for just that field.
+ROOM_BUNDLE_SCHEMA_EXAMPLE = {
+    "npc_name": "Brother Aldric",
+    "npc_description": "A stooped monk in a moth-eaten habit who watches newcomers warily.",
+    "room_description": "Moss creeps over cracked flagstones beneath a vaulted ceiling...",
+    "items": ITEM_SCHEMA_EXAMPLE,
+}
+
+ROOM_BUNDLE_PROMPT = (
+    "You are a content generator for a text-adventure RPG.\n"
+    "Given a THEME, ROOM TYPE, PLAYER name and an NPC's TOUGHNESS and FRIENDLINESS, generate the "
+    "NPC who occupies the room, the room itself, and the items found in it.\n"
+    "Produce a compact JSON object following the exact SCHEMA.\n"
+    "Rules:\n"
+    "- Return ONLY minified JSON (no markdown, no comments)\n"
+    "- npc_name: just the name, no other words\n"
+    "- npc_description: about a paragraph of plain text describing the NPC, like in a novel\n"
+    "- room_description: a MUD room description for the PLAYER that mentions the NPC by name; "
+    "don't list exits or items\n"
+    "- items: between 1 and 3 items, each with name, type, rarity (Common|Uncommon|Rare|Epic|Legendary), "
+    "value and desc\n"
+    "- Include a 'damage' value (1-20) ONLY for items whose type is 'weapon'\n"
+    "- Include an 'armor' value (1-10) ONLY for items whose type is 'armor'\n"
+    "- Skew more towards creating Common and Uncommon rarities\n"
+    "- TOUGHNESS and FRIENDLINESS are out of 100; 0 friendliness is very hostile, 100 very friendly\n"
+)
+
+
+# The player's name is the only free-form input, so it is what gets shortened over budget.
+ROOM_BUNDLE_TEMPLATE = PromptTemplate("room_bundle", [
+    ROOM_BUNDLE_PROMPT,
+    "\nSCHEMA=" + json.dumps(ROOM_BUNDLE_SCHEMA_EXAMPLE),
+    Section("\nTHEME={theme}\nROOM TYPE={room_identity}"),
+    Section("\nPLAYER={player}", cut="player", min_chars=40),
+    Section("\nTOUGHNESS={toughness}\nFRIENDLINESS={friendlyness}"),
+    "\nJSON:",
+])
+
+
+def bundle_mode_enabled():
+    """Room generation uses the single bundle request when ROOM_GENERATION_MODE=bundle."""
+    return os.getenv("ROOM_GENERATION_MODE", "graph").strip().lower() == "bundle"
+
+
+def _build_bundle_prompt(theme, player_name, room_identity, toughness, friendlyness):
+    return ROOM_BUNDLE_TEMPLATE.render(
+        theme=theme or "Unknown",
+        room_identity=room_identity or "general",
+        player=player_name or "the player",
+        toughness=toughness,
+        friendlyness=friendlyness,
+    ).text
+
+
+def _parse_json_object(raw):
+    raw = (raw or "").strip()
+    # If wrapped in code fences, remove them
+    if raw.startswith("```") and raw.endswith("```"):
+        raw = raw.strip("`\n")
+    # Some models may prepend text; find first '{' and last '}'
+    start = raw.find('{')
+    end = raw.rfind('}')
+    if start != -1 and end != -1:
+        raw = raw[start:end + 1]
+    return json.loads(raw)
+
+
+def _validate_bundle(data):
+    """Keep only the fields that pass validation."""
+    if not isinstance(data, dict):
+        return {}
+
+    bundle = {}
+    for key in ("npc_name", "npc_description", "room_description"):
+        value = data.get(key)
+        if isinstance(value, str) and value.strip():
+            bundle[key] = value.strip()
+
+    items = data.get("items")
+    if isinstance(items, list):
+        validated_items = []
+        for item in items[:3]:
+            valid = _validate_ai_items(item)
+            if valid is not None:
+                validated_items.append(valid)
+        if validated_items:
+            bundle["items"] = validated_items
+
+    return bundle
+
+
+def get_room_bundle(theme, player_name, room_identity, toughness, friendlyness):
+    """
+    Ask for the NPC name, NPC description, room description and items in one request.
+    Returns a dict holding whichever of those fields were valid ({} if parsing failed).
+    """
+    prompt = _build_bundle_prompt(theme, player_name, room_identity, toughness, friendlyness)
+    try:
+        return _validate_bundle(_parse_json_object(call_ai(prompt, site="room_bundle")))
+    except Exception as e:
+        print("Error generating room bundle, falling back to per-field generation:", e)
+        return {}
@@ -0,0 +1,326 @@
+# Local stand-in for the Anthropic client, used when LLM_BACKEND=stub. It needs no API key and
+# answers every call site with a plausible, schema-correct response (names, paragraphs, yes/no,
+# item JSON, layout JSON, room bundles) chosen deterministically from the prompt, after an
+# injected delay and with an optional error rate. That makes load tests and benchmarks measure
+# the server rather than the provider.
+#
+# Configuration (environment):
+#   STUB_LATENCY     fixed:<ms> | normal:<mean_ms>,<stddev_ms> | longtail:<median_ms>,<sigma>
+#   STUB_ERROR_RATE  fraction of calls that raise StubBackendError (0.0 - 1.0)
+#   STUB_SEED        seed for the latency/error sequence
+#   STUB_CACHE_MIN_TOKENS  shortest prefix the stub treats as cacheable (provider minimum: 1024)
+#
+# Requests with a system prefix are checked the way the provider would check them (text blocks,
+# ephemeral cache_control, at most 4 breakpoints), and usage reports prompt-cache writes and
+# reads for the prefix up to the last breakpoint, plus cache_eligible_input_tokens: that
+# prefix's size whether or not it reaches the minimum.
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+_NAMES = {
+    "cyber": ["Vex Calder", "Nyx-7", "Juno Okafor", "Rook Tanaka", "Sable Ortiz", "Kestrel Wu"],
+    "steam": ["Cornelius Brassby", "Ada Wheelwright", "Silas Copperpot", "Mabel Gearhart",
+              "Thaddeus Vane", "Octavia Sprocket"],
+    "fantasy": ["Brother Aldric", "Mirelle Thorn", "Garrick Ash", "Old Wenna", "Torvin Blackmoor",
+                "Sister Elowen"],
+}
+
+_SENTENCES = [
+    "Dust hangs in the air, stirred by a draught from somewhere unseen.",
+    "The walls bear the scars of old struggles, patched and re-patched over the years.",
+    "A faint smell of smoke and oil lingers over everything.",
+    "Shadows gather in the corners where the light does not quite reach.",
+    "Somewhere nearby, something drips with a slow, patient rhythm.",
+    "Scattered belongings suggest whoever was here left in a hurry.",
+    "The figure watches you carefully, weighing every word before answering.",
+    "A low murmur of distant machinery or voices never quite fades.",
+]
+
+_ITEMS = [
+    {"name": "rusty dagger", "type": "weapon", "rarity": "Common", "value": 3,
+     "desc": "A pitted blade with a worn leather grip.", "damage": 3},
+    {"name": "patched leather vest", "type": "armor", "rarity": "Common", "value": 5,
+     "desc": "Stiff leather, stitched more times than anyone can count.", "armor": 2},
+    {"name": "tarnished locket", "type": "accessory", "rarity": "Uncommon", "value": 18,
+     "desc": "It opens on a faded portrait."},
+    {"name": "bitter tonic", "type": "consumable", "rarity": "Common", "value": 4,
+     "desc": "Smells awful; supposedly restorative."},
+    {"name": "coil of rope", "type": "tool", "rarity": "Common", "value": 2,
+     "desc": "Thirty feet of sturdy hemp."},
+    {"name": "etched signet ring", "type": "accessory", "rarity": "Rare", "value": 60,
+     "desc": "The crest is worn almost smooth."},
+]
+
+_LAYOUT_ROOM_TYPES = ["alley", "corridor", "chamber", "tavern", "library", "lab", "street", "temple"]
+_LAYOUT_PROPS = ["table", "crate", "barrel", "shelf", "console", "boiler", "pipe", "server"]
+
+
+class StubBackendError(Exception):
+    """An injected provider failure."""
+
+
+class StubRequestError(Exception):
+    """A malformed request, rejected like the provider's 400 invalid_request_error."""
+    status_code = 400
+
+
+class StubTimeoutError(StubBackendError):
+    """The sampled latency ran past the request's timeout."""
+
+
+def _env_float(name, default):
+    try:
+        return float(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def parse_latency(spec):
+    """
+    Turn a latency spec into a function rng -> seconds. Bad or empty specs mean no delay.
+    """
+    kind, _, args = (spec or "").strip().lower().partition(":")
+    try:
+        values = [float(v) for v in args.split(",") if v.strip()]
+    except ValueError:
+        values = []
+    if kind == "fixed" and values:
+        ms = values[0]
+        return lambda _rng: max(0.0, ms) / 1000.0
+    if kind == "normal" and values:
+        mean, stddev = values[0], (values[1] if len(values) > 1 else values[0] / 4)
+        return lambda rng: max(0.0, rng.gauss(mean, stddev)) / 1000.0
+    if kind == "longtail" and values:
+        # Log-normal: most calls near the median, a few far slower.
+        median, sigma = values[0], (values[1] if len(values) > 1 else 0.8)
+        return lambda rng: rng.lognormvariate(0.0, sigma) * median / 1000.0
+    return lambda _rng: 0.0
+
+
+def _estimate_tokens(text):
+    return max(1, len(text or "") // 4)
+
+
+def _theme_key(prompt):
+    lower = prompt.lower()
+    if "cyber" in lower or "sci" in lower:
+        return "cyber"
+    if "steam" in lower:
+        return "steam"
+    return "fantasy"
+
+
+def _paragraph(rng, sentences=3):
+    return " ".join(rng.sample(_SENTENCES, sentences))
+
+
+def _item_json(rng):
+    return json.dumps(rng.sample(_ITEMS, rng.randint(1, 3)))
+
+
+def _layout_json(prompt, rng):
+    exits = {}
+    marker = "\nEXITS="
+    if marker in prompt:
+        try:
+            exits = json.loads(prompt.split(marker, 1)[1].split("\n", 1)[0])
+        except ValueError:
+            exits = {}
+    return json.dumps({
+        "room_type": rng.choice(_LAYOUT_ROOM_TYPES),
+        "floor": {"material": "stone", "base": "#4a4a4a", "accent": "#2e2e2e", "pattern": "grid"},
+        "zones": [{"shape": "rect", "x": 0.1, "y": 0.1, "w": 0.8, "h": 0.8, "role": "room"}],
+        "walls": [{"edge": e, "open": bool(exits.get(e))} for e in ("north", "south", "east", "west")],
+        "props": [
+            {"type": rng.choice(_LAYOUT_PROPS), "x": round(rng.uniform(0.1, 0.9), 2),
+             "y": round(rng.choice([rng.uniform(0.1, 0.4), rng.uniform(0.6, 0.9)]), 2),
+             "w": 0.1, "h": 0.08, "rotation": 0}
+            for _ in range(rng.randint(5, 10))
+        ],
+    })
+
+
+def _bundle_json(prompt, rng):
+    name = rng.choice(_NAMES[_theme_key(prompt)])
+    return json.dumps({
+        "npc_name": name,
+        "npc_description": _paragraph(rng),
+        "room_description": _paragraph(rng) + f" {name} stands nearby.",
+        "items": json.loads(_item_json(rng)),
+    })
+
+
+def stub_response(prompt):
+    """The stub's answer for a prompt; the same prompt always gets the same answer."""
+    # Imported here: these modules import open_ai_api, which imports this module.
+    from ai_layout import SYSTEM_PROMPT as LAYOUT_PROMPT
+    from item import ITEM_PROMPT
+    from room_bundle import ROOM_BUNDLE_PROMPT
+
+    rng = random.Random(hashlib.sha256(prompt.encode("utf-8")).hexdigest())
+    if prompt.startswith(ROOM_BUNDLE_PROMPT):
+        return _bundle_json(prompt, rng)
+    if prompt.startswith(ITEM_PROMPT):
+        return _item_json(rng)
+    if prompt.startswith(LAYOUT_PROMPT):
+        return _layout_json(prompt, rng)
+    if "yes or no" in prompt.lower():
+        return rng.choice(["Yes", "Yes", "No"])
+    if prompt.startswith("Pick a name"):
+        return rng.choice(_NAMES[_theme_key(prompt)])
+    return _paragraph(rng, rng.randint(2, 4))
+
+
+def _apply_limits(text, max_tokens, stop_sequences):
+    """Cut the answer where the provider would: at a stop sequence or after max_tokens."""
+    stop_reason = "end_turn"
+    for stop in stop_sequences or ():
+        if stop and stop in text:
+            text = text[:text.index(stop)]
+            stop_reason = "stop_sequence"
+    if _estimate_tokens(text) > max_tokens:
+        text = text[:max_tokens * 4]
+        stop_reason = "max_tokens"
+    return text, stop_reason
+
+
+MAX_CACHE_BREAKPOINTS = 4
+
+
+def check_system(system):
+    """
+    Validate a system prompt like the provider does and return the cacheable prefix text
+    (everything up to the last block with cache_control), or "" if there is none.
+    """
+    if system is None or isinstance(system, str):
+        return ""
+    if not isinstance(system, list):
+        raise StubRequestError("system: must be a string or a list of text blocks")
+    prefix_end = 0
+    breakpoints = 0
+    for i, block in enumerate(system):
+        if not isinstance(block, dict) or block.get("type") != "text" or not block.get("text"):
+            raise StubRequestError(f"system.{i}: expected a non-empty text block")
+        cache_control = block.get("cache_control")
+        if cache_control is not None:
+            if cache_control != {"type": "ephemeral"}:
+                raise StubRequestError(f"system.{i}.cache_control: only {{'type': 'ephemeral'}} is supported")
+            breakpoints += 1
+            prefix_end = i + 1
+    if breakpoints > MAX_CACHE_BREAKPOINTS:
+        raise StubRequestError(f"A maximum of {MAX_CACHE_BREAKPOINTS} blocks with cache_control may be provided")
+    return "\n".join(block["text"] for block in system[:prefix_end])
+
+
+def _system_text(system):
+    if not system:
+        return ""
+    if isinstance(system, str):
+        return system
+    return "\n".join(block["text"] for block in system)
+
+
+def _message(model, prompt, text, stop_reason="end_turn", system_text="", cache=None):
+    eligible, written, read = cache or (0, 0, 0)
+    return SimpleNamespace(
+        model=model,
+        stop_reason=stop_reason,
+        content=[SimpleNamespace(type="text", text=text)],
+        usage=SimpleNamespace(input_tokens=max(0, _estimate_tokens(system_text + prompt) - written - read),
+                              output_tokens=_estimate_tokens(text),
+                              cache_creation_input_tokens=written,
+                              cache_read_input_tokens=read,
+                              cache_eligible_input_tokens=eligible),
+    )
+
+
+class _Messages:
+    def __init__(self, backend):
+        self._backend = backend
+
+    def create(self, model, max_tokens, messages, stop_sequences=None, timeout=None, system=None, **_kwargs):
+        prompt = messages[-1]["content"]
+        cache = self._backend.prompt_cache(model, check_system(system))
+        self._backend.wait_or_fail(timeout)
+        text, stop_reason = _apply_limits(stub_response(prompt), max_tokens, stop_sequences)
+        return _message(model, prompt, text, stop_reason, _system_text(system), cache)
+
+    @contextmanager
+    def stream(self, model, max_tokens, messages, stop_sequences=None, timeout=None, system=None, **_kwargs):
+        prompt = messages[-1]["content"]
+        cache = self._backend.prompt_cache(model, check_system(system))
+        text, stop_reason = _apply_limits(stub_response(prompt), max_tokens, stop_sequences)
+        words = [w + " " for w in text.split(" ")]
+        # Roughly a third of the sampled latency before the first token, the rest spread over
+        # the remaining chunks.
+        total = self._backend.sample_latency()
+        if timeout is not None and total / 3 > timeout:
+            time.sleep(timeout)
+            raise StubTimeoutError(f"No response within {timeout}s")
+        self._backend.maybe_fail()
+
+        def chunks():
+            time.sleep(total / 3)
+            per_chunk = (total * 2 / 3) / max(1, len(words))
+            for word in words:
+                yield word
+                time.sleep(per_chunk)
+
+        final = _message(model, prompt, text, stop_reason, _system_text(system), cache)
+        yield SimpleNamespace(text_stream=chunks(), get_final_message=lambda: final)
+
+
+class StubClient:
+    """Drop-in for anthropic.Anthropic covering the parts the game uses."""
+
+    def __init__(self, latency=None, error_rate=None, seed=None):
+        self._latency = parse_latency(latency if latency is not None else os.getenv("STUB_LATENCY", ""))
+        self._error_rate = error_rate if error_rate is not None else _env_float("STUB_ERROR_RATE", 0.0)
+        self._rng = random.Random(seed if seed is not None else os.getenv("STUB_SEED", "0"))
+        self._rng_lock = threading.Lock()
+        self._cache_min_tokens = int(_env_float("STUB_CACHE_MIN_TOKENS", 1024))
+        self._cached_prefixes = OrderedDict()  # sha256 of (model, prefix) -> None, oldest first
+        self.messages = _Messages(self)
+
+    def prompt_cache(self, model, prefix):
+        """(eligible, written, read) prompt-cache token counts for a request with this prefix."""
+        eligible = _estimate_tokens(prefix) if prefix else 0
+        if not prefix or eligible < self._cache_min_tokens:
+            return eligible, 0, 0
+        key = hashlib.sha256((model + "\0" + prefix).encode("utf-8")).hexdigest()
+        with self._rng_lock:
+            hit = key in self._cached_prefixes
+            self._cached_prefixes[key] = None
+            self._cached_prefixes.move_to_end(key)
+            while len(self._cached_prefixes) > 1024:
+                self._cached_prefixes.popitem(last=False)
+        return (eligible, 0, eligible) if hit else (eligible, eligible, 0)
+
+    def sample_latency(self):
+        with self._rng_lock:
+            return self._latency(self._rng)
+
+    def maybe_fail(self):
+        with self._rng_lock:
+            failed = self._rng.random() < self._error_rate
+        if failed:
+            raise StubBackendError("Injected stub backend failure")
+
+    def wait_or_fail(self, timeout=None):
+        latency = self.sample_latency()
+        if timeout is not None and latency > timeout:
+            time.sleep(timeout)
+            raise StubTimeoutError(f"No response within {timeout}s")
+        time.sleep(latency)
+        self.maybe_fail()
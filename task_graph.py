@@ -0,0 +1,71 @@
+# Small dependency-graph runner. Room generation is a handful of LLM round-trips where only
+# some depend on others (items need the room description, the NPC description needs the NPC
+# name), so each step is declared with its inputs and started as soon as they are ready.
+import contextvars
+import os
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+
+def default_workers():
+    try:
+        return max(1, int(os.getenv("ROOM_GENERATION_WORKERS", 4)))
+    except (TypeError, ValueError):
+        return 4
+
+
+class TaskGraph:
+    """Named tasks with dependencies, executed on a thread pool."""
+
+    def __init__(self):
+        self._tasks = {}  # name -> (fn, deps)
+
+    def __contains__(self, name):
+        return name in self._tasks
+
+    def __len__(self):
+        return len(self._tasks)
+
+    def add(self, name, fn, deps=()):
+        """
+        Register a task. fn is called with a dict of {dep_name: dep_result} once every
+        dependency has finished; its return value becomes this task's result.
+        """
+        if name in self._tasks:
+            raise ValueError(f"Task '{name}' already added")
+        self._tasks[name] = (fn, tuple(deps))
+
+    def run(self, max_workers=None, initial=None):
+        """
+        Run every task and return {name: result}. `initial` pre-seeds results so tasks may
+        depend on values that were already computed. The first task exception is re-raised.
+        """
+        results = dict(initial or {})
+        for name, (_fn, deps) in self._tasks.items():
+            for dep in deps:
+                if dep not in self._tasks and dep not in results:
+                    raise ValueError(f"Task '{name}' depends on unknown task '{dep}'")
+
+        pending = [name for name in self._tasks if name not in results]
+        if not pending:
+            return results
+
+        workers = max_workers or default_workers()
+        running = {}
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            while pending or running:
+                ready = [n for n in pending if all(d in results for d in self._tasks[n][1])]
+                for name in ready:
+                    pending.remove(name)
+                    fn, deps = self._tasks[name]
+                    # Each task runs in a copy of the caller's context, so call_context() tags carry over.
+                    running[pool.submit(contextvars.copy_context().run, fn,
+                                        {d: results[d] for d in deps})] = name
+
+                if not running:
+                    raise ValueError("Task graph has a dependency cycle: " + ", ".join(pending))
+
+                done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    results[name] = future.result()
+        return results
@@ -5,3 +5,11 @@ import pytest
 @pytest.fixture
 def userId():
     return "test-user-123"
+
+
+@pytest.fixture(autouse=True)
+def _memory_render_inputs(monkeypatch):
+    """Keep the map render-inputs index in memory instead of under .map_cache."""
+    import map_generator
+    from map_cache import MapCache
+    monkeypatch.setattr(map_generator, "render_inputs", MapCache(name="render_inputs"))
@@ -0,0 +1,120 @@
+"""
+Tests for the opt-in call_ai response cache: LRU/disk layers, TTL, eviction and counters.
+"""
+import os
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+
+def _fake_message(text):
+    return SimpleNamespace(content=[SimpleNamespace(text=text)])
+
+
+class TestResponseCache:
+    def test_key_depends_on_model_tokens_and_prompt(self):
+        from ai_cache import ResponseCache
+        base = ResponseCache.make_key("m", 1024, "hello")
+        assert base == ResponseCache.make_key("m", 1024, "hello")
+        assert base != ResponseCache.make_key("m2", 1024, "hello")
+        assert base != ResponseCache.make_key("m", 16, "hello")
+        assert base != ResponseCache.make_key("m", 1024, "hello!")
+        assert base != ResponseCache.make_key("m", 1024, "hello", temperature=0.0)
+        assert base != ResponseCache.make_key("m", 1024, "hello", stop=["\n"])
+
+    def test_disk_layer_survives_new_instance(self, tmp_path):
+        from ai_cache import ResponseCache
+        cache = ResponseCache(directory=str(tmp_path))
+        key = cache.make_key("m", 1024, "prompt")
+        cache.put(key, "answer")
+
+        fresh = ResponseCache(directory=str(tmp_path))
+        assert fresh.get(key) == "answer"
+        stats = fresh.stats()
+        assert stats["disk_hits"] == 1 and stats["hits"] == 1
+
+    def test_lru_evicts_oldest_memory_entry(self):
+        from ai_cache import ResponseCache
+        cache = ResponseCache(directory=None, max_memory_entries=2)
+        cache.put("a", "1")
+        cache.put("b", "2")
+        cache.get("a")
+        cache.put("c", "3")
+        assert cache.get("b") is None
+        assert cache.get("a") == "1"
+        assert cache.stats()["evictions"] == 1
+
+    def test_expired_entries_are_misses(self, tmp_path):
+        from ai_cache import ResponseCache
+        cache = ResponseCache(directory=str(tmp_path), ttl_seconds=10)
+        with patch("ai_cache.time.time", return_value=1000.0):
+            cache.put("k", "old")
+        with patch("ai_cache.time.time", return_value=1011.0):
+            assert cache.get("k") is None
+        stats = cache.stats()
+        assert stats["misses"] == 1 and stats["expired"] >= 1
+
+    def test_disk_size_cap_drops_oldest_files(self, tmp_path):
+        from ai_cache import ResponseCache
+        cache = ResponseCache(directory=str(tmp_path), max_disk_bytes=200)
+        for i in range(10):
+            cache.put(f"key{i:02d}", "x" * 50)
+        total = sum(p.stat().st_size for p in tmp_path.rglob("*.json"))
+        assert total <= 200
+
+    def test_writes_only_walk_the_store_to_evict(self, tmp_path):
+        from ai_cache import ResponseCache
+        cache = ResponseCache(directory=str(tmp_path), max_disk_bytes=1000, sweep_every=100)
+        with patch("ai_cache.os.walk", wraps=os.walk) as walk:
+            for i in range(10):
+                cache.put(f"key{i:02d}", "x" * 20)
+            # The first write learns the store's size; the rest fit under the cap.
+            assert walk.call_count == 1
+            for i in range(10, 30):
+                cache.put(f"key{i:02d}", "x" * 20)
+            assert walk.call_count > 1
+        total = sum(p.stat().st_size for p in tmp_path.rglob("*.json"))
+        assert total <= 1000
+
+
+class TestCallAiCaching:
+    def test_cacheable_prompt_hits_provider_once(self, tmp_path, monkeypatch):
+        import open_ai_api
+        from ai_cache import ResponseCache
+        monkeypatch.setattr(open_ai_api, "_response_cache", ResponseCache(directory=str(tmp_path)))
+        monkeypatch.setenv("AI_CACHE_ENABLED", "1")
+        client = MagicMock()
+        client.messages.create.return_value = _fake_message(" Welcome! ")
+        with patch("open_ai_api._get_client", return_value=client):
+            assert open_ai_api.call_ai("greet", cacheable=True) == "Welcome!"
+            assert open_ai_api.call_ai("greet", cacheable=True) == "Welcome!"
+        assert client.messages.create.call_count == 1
+
+    def test_uncacheable_prompt_always_calls_provider(self, tmp_path, monkeypatch):
+        import open_ai_api
+        from ai_cache import ResponseCache
+        monkeypatch.setattr(open_ai_api, "_response_cache", ResponseCache(directory=str(tmp_path)))
+        monkeypatch.setenv("AI_CACHE_ENABLED", "1")
+        client = MagicMock()
+        client.messages.create.return_value = _fake_message("hi")
+        with patch("open_ai_api._get_client", return_value=client):
+            open_ai_api.call_ai("talk")
+            open_ai_api.call_ai("talk")
+        assert client.messages.create.call_count == 2
+
+    def test_profile_change_misses_the_cache(self, tmp_path, monkeypatch):
+        import open_ai_api
+        from ai_cache import ResponseCache
+        monkeypatch.setattr(open_ai_api, "_response_cache", ResponseCache(directory=str(tmp_path)))
+        monkeypatch.setenv("AI_CACHE_ENABLED", "1")
+        client = MagicMock()
+        client.messages.create.return_value = _fake_message("Welcome!")
+        profile = dict(open_ai_api.DEFAULT_PROFILE)
+        with patch("open_ai_api._get_client", return_value=client), \
+                patch("open_ai_api.get_profile", side_effect=lambda site: dict(profile)):
+            open_ai_api.call_ai("greet", cacheable=True, site="greeting")
+            profile["temperature"] = 0.2
+            open_ai_api.call_ai("greet", cacheable=True, site="greeting")
+            profile["stop"] = ["\n"]
+            open_ai_api.call_ai("greet", cacheable=True, site="greeting")
+            open_ai_api.call_ai("greet", cacheable=True, site="greeting")
+        assert client.messages.create.call_count == 3
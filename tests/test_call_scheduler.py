@@ -0,0 +1,270 @@
+"""
+Tests for the provider call scheduler: concurrency cap, single-flight and retry/backoff.
+"""
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+
+class RateLimited(Exception):
+    status_code = 429
+
+    def __init__(self, retry_after=None):
+        super().__init__("rate limited")
+        self.response = SimpleNamespace(headers={"retry-after": retry_after} if retry_after else {})
+
+
+class BadRequest(Exception):
+    status_code = 400
+
+
+def _flaky(failures, error=RateLimited):
+    calls = []
+
+    def fn():
+        calls.append(1)
+        if len(calls) <= failures:
+            raise error()
+        return "ok"
+    return fn, calls
+
+
+class TestRetries:
+    def test_retries_retryable_errors_with_backoff(self):
+        from call_scheduler import CallScheduler
+        sleeps = []
+        scheduler = CallScheduler(base_delay=0.5, max_delay=8, deadline=60, sleep=sleeps.append)
+        fn, calls = _flaky(3)
+        assert scheduler.run(fn) == ("ok", False)
+        assert len(calls) == 4
+        assert len(sleeps) == 3
+        assert all(0 <= s <= 0.5 * 2 ** i for i, s in enumerate(sleeps))
+
+    def test_retry_after_header_is_honoured(self):
+        from call_scheduler import CallScheduler
+        sleeps = []
+        scheduler = CallScheduler(sleep=sleeps.append)
+        fn, _calls = _flaky(1, error=lambda: RateLimited(retry_after="2"))
+        scheduler.run(fn)
+        assert sleeps == [2.0]
+
+    def test_non_retryable_errors_raise_immediately(self):
+        from call_scheduler import CallScheduler
+        scheduler = CallScheduler(sleep=lambda _s: pytest.fail("should not sleep"))
+        fn, calls = _flaky(1, error=BadRequest)
+        with pytest.raises(BadRequest):
+            scheduler.run(fn)
+        assert len(calls) == 1
+
+    def test_deadline_stops_retrying(self):
+        from call_scheduler import CallScheduler
+        scheduler = CallScheduler(deadline=1.0, sleep=lambda _s: None)
+        fn, calls = _flaky(100, error=lambda: RateLimited(retry_after="5"))
+        with pytest.raises(RateLimited):
+            scheduler.run(fn)
+        assert len(calls) == 1
+
+    def test_can_retry_veto(self):
+        from call_scheduler import CallScheduler
+        scheduler = CallScheduler(sleep=lambda _s: None)
+        fn, calls = _flaky(1)
+        with pytest.raises(RateLimited):
+            scheduler.run(fn, can_retry=lambda: False)
+        assert len(calls) == 1
+
+
+class TestConcurrency:
+    def test_concurrency_cap(self):
+        from call_scheduler import CallScheduler
+        scheduler = CallScheduler(max_concurrency=2)
+        lock = threading.Lock()
+        state = {"now": 0, "peak": 0}
+
+        def fn():
+            with lock:
+                state["now"] += 1
+                state["peak"] = max(state["peak"], state["now"])
+            time.sleep(0.05)
+            with lock:
+                state["now"] -= 1
+            return "ok"
+
+        threads = [threading.Thread(target=scheduler.run, args=(fn,)) for _ in range(6)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert state["peak"] == 2
+        assert scheduler.stats()["waiting"] == 0
+
+    def test_identical_in_flight_calls_are_coalesced(self):
+        from call_scheduler import CallScheduler
+        scheduler = CallScheduler()
+        release = threading.Event()
+        calls = []
+        results = []
+
+        def fn():
+            calls.append(1)
+            release.wait(2)
+            return "shared"
+
+        def worker():
+            results.append(scheduler.run(fn, key="same prompt"))
+
+        threads = [threading.Thread(target=worker) for _ in range(4)]
+        for t in threads:
+            t.start()
+        time.sleep(0.1)
+        release.set()
+        for t in threads:
+            t.join()
+        assert len(calls) == 1
+        assert sorted(results) == [("shared", False)] + [("shared", True)] * 3
+
+    def test_coalesced_callers_share_the_error(self):
+        from call_scheduler import CallScheduler
+        scheduler = CallScheduler()
+        release = threading.Event()
+        errors = []
+
+        def fn():
+            release.wait(2)
+            raise BadRequest()
+
+        def worker():
+            try:
+                scheduler.run(fn, key="k")
+            except BadRequest as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=worker) for _ in range(3)]
+        for t in threads:
+            t.start()
+        time.sleep(0.1)
+        release.set()
+        for t in threads:
+            t.join()
+        assert len(errors) == 3
+
+
+class TestFairScheduling:
+    """One slot is held open while calls queue up; releasing it shows the admission order."""
+
+    def _queue_calls(self, scheduler, calls):
+        from call_scheduler import call_context
+        gate = threading.Event()
+        order = []
+        blocker = threading.Thread(target=scheduler.run, args=(lambda: gate.wait(2),))
+        blocker.start()
+        while scheduler.stats()["running"] < 1:
+            time.sleep(0.005)
+
+        threads = []
+        for priority, user in calls:
+            def call(priority=priority, user=user):
+                with call_context(priority, user):
+                    scheduler.run(lambda: order.append((priority, user)))
+            threads.append(threading.Thread(target=call))
+            threads[-1].start()
+            # Queue them one at a time so arrival order is fixed.
+            while scheduler.stats()["waiting"] < len(threads):
+                time.sleep(0.005)
+        return gate, order, threads + [blocker]
+
+    def _release(self, gate, threads):
+        gate.set()
+        for t in threads:
+            t.join()
+
+    def test_interactive_calls_go_before_queued_background_work(self):
+        from call_scheduler import CallScheduler
+        scheduler = CallScheduler(max_concurrency=1)
+        gate, order, threads = self._queue_calls(
+            scheduler, [("batch", None), ("prefetch", "a"), ("interactive", "b")])
+        assert scheduler.stats()["waiting_by_priority"]["interactive"] == 1
+        self._release(gate, threads)
+        assert order[0] == ("interactive", "b")
+
+    def test_users_take_turns_within_a_class(self):
+        from call_scheduler import CallScheduler
+        scheduler = CallScheduler(max_concurrency=1)
+        gate, order, threads = self._queue_calls(
+            scheduler, [("interactive", "heavy")] * 3 + [("interactive", "light")])
+        self._release(gate, threads)
+        assert [user for _p, user in order] == ["heavy", "light", "heavy", "heavy"]
+
+    def test_background_classes_share_by_weight(self):
+        from call_scheduler import CallScheduler
+        scheduler = CallScheduler(max_concurrency=1, reserved_interactive=0)
+        gate, order, threads = self._queue_calls(
+            scheduler, [("batch", None)] * 3 + [("prefetch", "a")] * 5)
+        self._release(gate, threads)
+        assert [p for p, _u in order[:5]].count("prefetch") == 4
+
+    def test_background_leaves_a_slot_for_interactive_calls(self):
+        from call_scheduler import CallScheduler, call_context
+        scheduler = CallScheduler(max_concurrency=2, reserved_interactive=1)
+        lock = threading.Lock()
+        state = {"now": 0, "peak": 0}
+
+        def fn():
+            with lock:
+                state["now"] += 1
+                state["peak"] = max(state["peak"], state["now"])
+            time.sleep(0.02)
+            with lock:
+                state["now"] -= 1
+
+        def call():
+            with call_context("prefetch", "a"):
+                scheduler.run(fn)
+
+        threads = [threading.Thread(target=call) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert state["peak"] == 1
+
+    def test_promoted_calls_move_ahead(self):
+        from call_scheduler import CallContext, CallScheduler, using_call_context
+        scheduler = CallScheduler(max_concurrency=1, reserved_interactive=0)
+        gate, order, threads = self._queue_calls(scheduler, [("prefetch", "a")] * 2)
+        waited_on = CallContext("prefetch", "b")
+
+        def call():
+            with using_call_context(waited_on):
+                scheduler.run(lambda: order.append(("promoted", "b")))
+        threads.append(threading.Thread(target=call))
+        threads[-1].start()
+        while scheduler.stats()["waiting"] < 3:
+            time.sleep(0.005)
+        scheduler.promote(waited_on)
+        self._release(gate, threads)
+        assert order[0] == ("promoted", "b")
+
+    def test_interactive_follower_lifts_a_queued_batch_leader(self):
+        from call_scheduler import CallScheduler, call_context
+        scheduler = CallScheduler(max_concurrency=1, reserved_interactive=0)
+        gate, order, threads = self._queue_calls(scheduler, [("prefetch", "a")] * 2)
+        results = []
+
+        def call(priority, user):
+            with call_context(priority, user):
+                results.append(scheduler.run(lambda: order.append(("shared", priority)) or "room", key="k"))
+        threads.append(threading.Thread(target=call, args=("batch", None)))
+        threads[-1].start()
+        while scheduler.stats()["waiting"] < 3:
+            time.sleep(0.005)
+        # The follower queues nothing of its own; the leader's waiter takes its class.
+        threads.append(threading.Thread(target=call, args=("interactive", "b")))
+        threads[-1].start()
+        while scheduler.stats()["waiting_by_priority"]["interactive"] < 1:
+            time.sleep(0.005)
+        assert scheduler.stats()["waiting"] == 3
+        self._release(gate, threads)
+        assert order[0] == ("shared", "batch")
+        assert sorted(results) == [("room", False), ("room", True)]
@@ -0,0 +1,103 @@
+"""
+Tests for the LLM circuit breaker and the fallback content served while it is open.
+"""
+import threading
+import time
+
+import pytest
+
+
+class Overloaded(Exception):
+    status_code = 529
+
+
+class BadRequest(Exception):
+    status_code = 400
+
+
+def _fail(error):
+    def fn():
+        raise error()
+    return fn
+
+
+@pytest.fixture
+def open_breaker(monkeypatch):
+    import open_ai_api
+    from circuit_breaker import CircuitBreaker
+    breaker = CircuitBreaker(failure_threshold=1)
+    breaker.record_failure()
+    monkeypatch.setattr(open_ai_api, "_breaker", breaker)
+    return breaker
+
+
+class TestCircuitBreaker:
+    def test_opens_after_consecutive_failures(self):
+        from circuit_breaker import CircuitBreaker, CircuitOpenError
+        breaker = CircuitBreaker(failure_threshold=3)
+        for _ in range(2):
+            with pytest.raises(Overloaded):
+                breaker.call(_fail(Overloaded))
+        assert breaker.call(lambda: "ok") == "ok"
+        for _ in range(3):
+            with pytest.raises(Overloaded):
+                breaker.call(_fail(Overloaded))
+        assert breaker.is_open
+        with pytest.raises(CircuitOpenError):
+            breaker.call(lambda: pytest.fail("should not reach the provider"))
+
+    def test_bad_requests_do_not_trip(self):
+        from circuit_breaker import CircuitBreaker
+        breaker = CircuitBreaker(failure_threshold=1)
+        with pytest.raises(BadRequest):
+            breaker.call(_fail(BadRequest))
+        assert not breaker.is_open
+
+    def test_probe_closes_the_circuit(self):
+        from circuit_breaker import CircuitBreaker
+        probed = threading.Event()
+        attempts = []
+
+        def probe():
+            attempts.append(1)
+            if len(attempts) < 2:
+                raise Overloaded()
+            probed.set()
+
+        breaker = CircuitBreaker(failure_threshold=1, probe_interval=0.01, probe=probe)
+        breaker.record_failure()
+        assert breaker.is_open
+        assert probed.wait(2)
+        give_up = time.monotonic() + 2
+        while breaker.is_open and time.monotonic() < give_up:
+            time.sleep(0.01)
+        assert not breaker.is_open
+        assert len(attempts) == 2
+
+
+class TestFallbacks:
+    def test_call_ai_fails_fast_while_open(self, open_breaker):
+        from circuit_breaker import CircuitOpenError
+        from open_ai_api import call_ai
+        with pytest.raises(CircuitOpenError):
+            call_ai("Describe the room", site="room_description")
+
+    def test_deadline_callers_get_their_fallback(self, open_breaker, userId):
+        from deadlines import call_by_deadline, command_deadline
+        from open_ai_api import call_ai
+        assert call_by_deadline(userId, lambda: call_ai("hi"), "stock") == ("stock", None)
+        with command_deadline(1.0):
+            assert call_by_deadline(userId, lambda: call_ai("hi"), "stock") == ("stock", None)
+
+    def test_npc_gets_a_stock_persona(self, open_breaker):
+        from fallback_content import STOCK_PERSONAS
+        from humanoid import Humanoid, Npc
+        npc = Npc.__new__(Npc)
+        Humanoid.__init__(npc)
+        npc._theme = "Steampunk"
+        npc._toughness = 50
+        npc._friendlyness = 70
+        npc.generate_name()
+        npc.generate_description()
+        assert (npc._name, npc._description) in STOCK_PERSONAS["steampunk"]
+        assert npc._ask_allow_pass() is True
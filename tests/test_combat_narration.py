@@ -0,0 +1,88 @@
+"""
+Tests for template combat narration and the optional background LLM enrichment.
+"""
+from unittest.mock import patch
+
+
+def _result(**overrides):
+    result = {
+        "action": "attack",
+        "player_hit": True,
+        "player_damage": 12,
+        "npc_damage": 5,
+        "fled": False,
+        "defended": False,
+        "player_defeated": False,
+        "npc_defeated": False,
+        "player_health": 95,
+        "player_max_health": 120,
+        "npc_health": 48,
+        "npc_max_health": 60,
+        "message": "",
+    }
+    result.update(overrides)
+    return result
+
+
+class TestNarrate:
+    def test_damage_bands(self):
+        from combat_narration import damage_band
+        assert damage_band(5, 60) == "light"
+        assert damage_band(10, 60) == "solid"
+        assert damage_band(30, 60) == "crushing"
+
+    def test_hit_mentions_both_sides_and_damage(self):
+        from combat_narration import narrate
+        text = narrate(_result(), "Ada", "Rusk", "Medieval")
+        assert "Ada" in text and "Rusk" in text
+        assert "12 damage" in text and "5 damage" in text
+
+    def test_same_turn_gives_same_text(self):
+        from combat_narration import narrate
+        assert narrate(_result(), "Ada", "Rusk", "Cyberpunk") == narrate(_result(), "Ada", "Rusk", "Cyberpunk")
+
+    def test_theme_picks_phrase_set(self):
+        import random
+        from combat_narration import PHRASES, narrate
+        text = narrate(_result(action="defend", player_hit=False, player_damage=0, npc_damage=0),
+                       "Ada", "Rusk", "Steampunk", rng=random.Random(1))
+        first = text.split(". ")[0] + "."
+        options = [p.format(player="Ada", npc="Rusk") for p in PHRASES["steampunk"]["defend"]]
+        assert first in options
+
+    def test_outcomes(self):
+        from combat_narration import PHRASES, narrate
+        fled = narrate(_result(action="flee", player_hit=False, fled=True, npc_damage=0), "Ada", "Rusk")
+        assert fled in [p.format(player="Ada", npc="Rusk") for p in PHRASES["medieval"]["flee_ok"]]
+
+        defeated = narrate(_result(npc_defeated=True, npc_health=0, npc_damage=0), "Ada", "Rusk")
+        assert any(p.format(npc="Rusk") in defeated for p in PHRASES["medieval"]["npc_defeated"])
+
+        lost = narrate(_result(player_defeated=True, player_health=0), "Ada", "Rusk")
+        assert any(p.format(player="Ada") in lost for p in PHRASES["medieval"]["player_defeated"])
+
+
+class TestEnrichment:
+    def test_disabled_by_default_and_never_calls_llm(self, monkeypatch, userId):
+        import combat_narration
+        monkeypatch.delenv("COMBAT_NARRATION_ENRICH", raising=False)
+        with patch("combat_narration.call_ai", side_effect=AssertionError("must not call the LLM")):
+            text = combat_narration.narrate_turn(userId, _result(), "Ada", "Rusk")
+        assert "data-pending-update" not in text
+
+    def test_enriched_text_is_pushed_to_the_outbox(self, monkeypatch, userId):
+        import combat_narration
+        import notifications
+        monkeypatch.setenv("COMBAT_NARRATION_ENRICH", "1")
+        notifications.clear(userId)
+        with patch("combat_narration.call_ai", return_value="A vivid paragraph.") as ai:
+            text = combat_narration.narrate_turn(userId, _result(), "Ada", "Rusk", npc_description="a guard")
+            combat_narration._get_executor().shutdown(wait=True)
+            combat_narration._executor = None
+        assert 'data-pending-update="1"' in text
+        assert ai.call_args.kwargs["site"] == "combat_narration"
+        updates = notifications.drain(userId)
+        assert len(updates) == 1
+        assert updates[0]["html"] == "A vivid paragraph."
+        assert f'id="{updates[0]["id"]}"' in text
+        assert notifications.drain(userId) == []
@@ -0,0 +1,132 @@
+"""
+Tests for the shared room content library.
+"""
+import json
+import random
+from unittest.mock import MagicMock, patch
+
+from pymongo.errors import ServerSelectionTimeoutError
+
+_CONTENT = {
+    "npc_name": "Brother Aldric",
+    "npc_description": "A stooped monk.",
+    "room_description": "Moss covers the flagstones.",
+    "items": [{"name": "rusty dagger", "type": "weapon", "rarity": "Common", "value": 3, "desc": "Pitted."}],
+}
+
+
+class FakeCollection:
+    """The few pymongo collection calls the library makes, over a list."""
+
+    def __init__(self):
+        self.docs = []
+
+    def create_index(self, keys, unique=False):
+        pass
+
+    def find(self, query):
+        return [d for d in self.docs if all(d.get(k) == v for k, v in query.items())]
+
+    def insert_one(self, doc):
+        doc["_id"] = len(self.docs)
+        self.docs.append(doc)
+
+    def update_one(self, query, update):
+        for doc in self.find(query):
+            for field, amount in update["$inc"].items():
+                doc[field] = doc.get(field, 0) + amount
+
+
+def _library(variants=2):
+    from content_library import ContentLibrary
+    return ContentLibrary(FakeCollection(), variants=variants, rng=random.Random(1))
+
+
+def _ai(prompt, site=None, **kwargs):
+    return json.dumps(_CONTENT) if site == "content_library" else "Brother Aldric looks up as Aria enters."
+
+
+class TestContentLibrary:
+    def test_fills_variants_then_samples(self):
+        library = _library(variants=2)
+        with patch("content_library.call_ai", side_effect=_ai) as ai:
+            bundles = [library.room_bundle("Medieval", "Aria", "Mossy Hall") for _ in range(4)]
+            # Annexes share their base room's entries.
+            library.room_bundle("Medieval", "Bo", "Mossy Hall Annex 3")
+        sites = [c.kwargs["site"] for c in ai.call_args_list]
+        assert sites.count("content_library") == 2
+        assert sites.count("room_touch_up") == 5
+        docs = library._collection.docs
+        assert [(d["theme"], d["identity"], d["variant"]) for d in docs] == \
+            [("medieval", "Mossy Hall", 0), ("medieval", "Mossy Hall", 1)]
+        assert sum(d["uses"] for d in docs) == 5
+        assert "Aria" not in docs[0]["room_description"]
+        assert bundles[0]["room_description"] == "Moss covers the flagstones. Brother Aldric looks up as Aria enters."
+        assert bundles[0]["npc_toughness"] == docs[0]["npc_toughness"]
+
+    def test_items_are_copied_per_room(self):
+        library = _library(variants=1)
+        with patch("content_library.call_ai", side_effect=_ai):
+            first = library.room_bundle("Medieval", "Aria", "Mossy Hall")
+            first["items"][0]["name"] = "taken"
+            second = library.room_bundle("Medieval", "Aria", "Mossy Hall")
+        assert second["items"][0]["name"] == "rusty dagger"
+
+    def test_failures_fall_back(self):
+        library = _library()
+        with patch("content_library.call_ai", return_value="not json"):
+            assert library.room_bundle("Medieval", "Aria", "Mossy Hall") == {}
+        library._collection.find = MagicMock(side_effect=ServerSelectionTimeoutError("no mongo"))
+        assert library.room_bundle("Medieval", "Aria", "Mossy Hall") == {}
+
+    def test_touch_up_failure_uses_a_plain_line(self):
+        library = _library()
+
+        def ai(prompt, site=None, **kwargs):
+            if site == "room_touch_up":
+                raise TimeoutError()
+            return json.dumps(_CONTENT)
+
+        with patch("content_library.call_ai", side_effect=ai):
+            bundle = library.room_bundle("Medieval", "Aria", "Mossy Hall")
+        assert bundle["room_description"].endswith("Brother Aldric is here.")
+
+
+class TestGenerateDescriptionFromLibrary:
+    def test_room_uses_library_persona_items_and_stats(self, userId, monkeypatch):
+        from humanoid import Humanoid, Npc
+        from room import Room
+        monkeypatch.setenv("CONTENT_LIBRARY_ENABLED", "1")
+        library = _library()
+        npc = Npc.__new__(Npc)
+        Humanoid.__init__(npc)
+        npc._theme = "Medieval"
+        npc._description = None
+        npc._toughness = 40
+        npc._friendlyness = 60
+        npc._past_conversation = []
+        npc._quest_to_offer = None
+        npc.store_npc = MagicMock(return_value="npc-id")
+        pc = MagicMock()
+        pc.get_theme.return_value = "Medieval"
+        pc.get_name.return_value = "Aria"
+        room = Room(0, 0)
+        room._id = "room-id"
+        room._room_identity = "Mossy Hall"
+        with patch("room.content_library", library), \
+                patch("content_library.call_ai", side_effect=_ai), \
+                patch("room.all_global_vars") as mock_g, \
+                patch("humanoid.call_ai") as npc_ai, \
+                patch("room.call_ai") as room_ai, \
+                patch("room.get_ai_items") as items_ai, \
+                patch.object(Room, "update_room"):
+            mock_g.get_player_character.return_value = pc
+            room.generate_description(userId, npc=npc)
+        entry = library._collection.docs[0]
+        assert npc.get_name() == "Brother Aldric"
+        assert npc.get_toughness() == entry["npc_toughness"]
+        assert "Aria enters" in room._description
+        assert room._items[0]["name"] == "rusty dagger"
+        npc_ai.assert_not_called()
+        room_ai.assert_not_called()
+        items_ai.assert_not_called()
@@ -0,0 +1,115 @@
+"""
+Tests for command deadlines: fallback text on a late LLM step and the late fill-in.
+"""
+import threading
+from unittest.mock import MagicMock, patch
+
+
+def _wait_for_update(userId, timeout=2):
+    import time
+    import notifications
+    give_up = time.monotonic() + timeout
+    while time.monotonic() < give_up:
+        updates = notifications.drain(userId)
+        if updates:
+            return updates
+        time.sleep(0.01)
+    return []
+
+
+class TestCallByDeadline:
+    def test_without_deadline_waits_for_the_call(self, userId):
+        from deadlines import call_by_deadline
+        assert call_by_deadline(userId, lambda: "real", "fallback") == ("real", None)
+
+    def test_fast_call_beats_the_deadline(self, userId):
+        from deadlines import call_by_deadline, command_deadline
+        with command_deadline(1.0):
+            assert call_by_deadline(userId, lambda: "real", "fallback") == ("real", None)
+
+    def test_slow_call_returns_fallback_then_fills_in(self, userId):
+        import notifications
+        from deadlines import call_by_deadline, command_deadline
+        notifications.clear(userId)
+        release = threading.Event()
+        applied = []
+
+        with command_deadline(0.05):
+            text, late = call_by_deadline(userId, lambda: (release.wait(2), "real")[1], "fallback",
+                                          site="npc_talk")
+        assert text == "fallback"
+        assert late.placeholder(text) == notifications.placeholder(late.update_id, "fallback")
+        late.when_ready(applied.append)
+        release.set()
+
+        assert _wait_for_update(userId) == [{"id": late.update_id, "html": "real"}]
+        assert applied == ["real"]
+
+    def test_late_calls_do_not_starve_new_commands(self, userId):
+        from deadlines import call_by_deadline, command_deadline
+        release = threading.Event()
+        try:
+            for _ in range(12):
+                with command_deadline(0.01):
+                    text, late = call_by_deadline(userId, lambda: (release.wait(5), "slow")[1], "fallback")
+                assert late is not None
+            # Twelve abandoned calls still waiting on the provider; a new command gets through.
+            reached = threading.Event()
+            with command_deadline(1.0):
+                text, late = call_by_deadline(userId, lambda: (reached.set(), "real")[1], "fallback")
+            assert reached.is_set()
+            assert (text, late) == ("real", None)
+        finally:
+            release.set()
+
+    def test_streamed_chunks_stop_after_the_deadline(self, userId):
+        from deadlines import call_by_deadline, command_deadline
+        from open_ai_api import current_stream_sink, stream_to
+        release = threading.Event()
+        chunks = []
+
+        def slow_stream():
+            sink = current_stream_sink()
+            sink("early ")
+            release.wait(2)
+            sink("late")
+            return "early late"
+
+        with stream_to(chunks.append), command_deadline(0.1):
+            text, late = call_by_deadline(userId, slow_stream, "fallback")
+        release.set()
+        late.when_ready()
+        _wait_for_update(userId)
+        assert text == "fallback"
+        assert chunks == ["early "]
+
+
+class TestLateFillIn:
+    def test_late_talk_reply_replaces_fallback_in_npc_memory(self, userId):
+        from humanoid import Humanoid, Npc
+        from deadlines import command_deadline
+        from job_queue import job_queue
+        npc = Npc.__new__(Npc)
+        Humanoid.__init__(npc)
+        npc._id = "npc-id"
+        npc._name = "Rusk"
+        npc._description = "a wary guard"
+        npc._past_conversation = []
+        npc._quest_to_offer = None
+        npc.update_npc = MagicMock()
+        release = threading.Event()
+
+        def slow_ai(*_a, **_k):
+            release.wait(2)
+            return "Fine, I'll talk."
+
+        with patch("humanoid.call_ai", side_effect=slow_ai), patch("xp.award_xp"), command_deadline(0.05):
+            out = npc.talk(userId, "Hello?")
+        assert "data-pending-update" in out
+        assert npc._past_conversation[-1] == "Hmm. Give me a moment to think on that."
+
+        release.set()
+        assert _wait_for_update(userId)[0]["html"] == "Fine, I'll talk."
+        assert npc._past_conversation == ["Hello?", "Fine, I'll talk."]
+        assert job_queue.flush(userId, timeout=2)
+        assert npc.update_npc.call_args.args[1]["conversations"][-1] == "Fine, I'll talk."
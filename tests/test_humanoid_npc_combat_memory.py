@@ -28,7 +28,9 @@ def test_talk_prompt_reflects_combat_history(userId):
                 out = npc.talk(userId, "Can we talk?")
 
     prompt = mock_ai.call_args.args[0]
+    system = " ".join(mock_ai.call_args.kwargs["system"])
     assert "Combat note" in prompt
     assert "quick attack" in prompt
-    assert "react with appropriate fear, anger, caution" in prompt
+    assert "react with appropriate fear, anger, caution" in system
+    assert "a wary guard" in system
     assert "Rusk says" in out
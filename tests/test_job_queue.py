@@ -0,0 +1,84 @@
+"""
+Tests for the background job queue: per-user ordering, key coalescing, retries and draining.
+"""
+import threading
+import time
+
+import pytest
+
+
+@pytest.fixture
+def queue(monkeypatch):
+    from job_queue import JobQueue
+    monkeypatch.setenv("JOB_QUEUE_ENABLED", "true")
+    q = JobQueue(max_workers=4, max_attempts=3, sleep=lambda _s: None)
+    yield q
+    q.shutdown(timeout=5)
+
+
+def test_jobs_for_one_user_run_in_order(queue):
+    done = []
+    for i in range(20):
+        queue.enqueue("u1", lambda i=i: (time.sleep(0.001), done.append(i)))
+    assert queue.flush("u1", timeout=5)
+    assert done == list(range(20))
+
+
+def test_users_run_in_parallel(queue):
+    release = threading.Event()
+    done = []
+    queue.enqueue("slow", release.wait, 2)
+    queue.enqueue("fast", done.append, "fast")
+    assert queue.flush("fast", timeout=1)
+    assert done == ["fast"]
+    release.set()
+    assert queue.flush(timeout=5)
+
+
+def test_queued_job_with_same_key_is_replaced(queue):
+    release = threading.Event()
+    saves = []
+    queue.enqueue("u1", release.wait, 2)
+    queue.enqueue("u1", saves.append, "first", key="character")
+    queue.enqueue("u1", saves.append, "second", key="character")
+    release.set()
+    assert queue.flush("u1", timeout=5)
+    assert saves == ["second"]
+
+
+def test_failed_jobs_are_retried_then_dropped(queue):
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) < 3:
+            raise ConnectionError("db down")
+
+    def broken():
+        raise ValueError("always")
+
+    after = []
+    queue.enqueue("u1", flaky)
+    queue.enqueue("u1", broken)
+    queue.enqueue("u1", after.append, "still runs")
+    assert queue.flush("u1", timeout=5)
+    assert len(calls) == 3
+    assert after == ["still runs"]
+
+
+def test_shutdown_drains_pending_jobs(queue):
+    done = []
+    for i in range(5):
+        queue.enqueue("u%d" % i, lambda i=i: (time.sleep(0.01), done.append(i)))
+    assert queue.shutdown(timeout=5)
+    assert sorted(done) == list(range(5))
+    assert queue.pending() == 0
+
+
+def test_disabled_queue_runs_inline(monkeypatch):
+    from job_queue import JobQueue
+    monkeypatch.setenv("JOB_QUEUE_ENABLED", "false")
+    q = JobQueue()
+    done = []
+    q.enqueue("u1", done.append, "now")
+    assert done == ["now"]
@@ -0,0 +1,86 @@
+"""
+Tests for per-call-site generation profiles.
+"""
+import json
+from unittest.mock import MagicMock
+
+import pytest
+
+
+@pytest.fixture
+def profiles(monkeypatch, tmp_path):
+    import llm_profiles
+
+    def load(overrides=None):
+        if overrides is None:
+            monkeypatch.delenv("LLM_PROFILES_FILE", raising=False)
+        else:
+            path = tmp_path / "profiles.json"
+            path.write_text(overrides if isinstance(overrides, str) else json.dumps(overrides))
+            monkeypatch.setenv("LLM_PROFILES_FILE", str(path))
+        llm_profiles.reload_profiles()
+        return llm_profiles
+
+    yield load
+    monkeypatch.delenv("LLM_PROFILES_FILE", raising=False)
+    llm_profiles.reload_profiles()
+
+
+class TestProfiles:
+    def test_short_answer_sites_get_small_profiles(self, profiles):
+        p = profiles()
+        assert p.get_profile("allow_pass")["max_tokens"] == 8
+        assert p.get_profile("allow_pass")["temperature"] == 0.0
+        assert p.get_profile("npc_name")["timeout"] == 10
+        assert p.get_profile("room_description") == p.DEFAULT_PROFILE
+        assert p.get_profile("no_such_site") == p.DEFAULT_PROFILE
+
+    def test_overrides_merge_over_builtins(self, profiles):
+        p = profiles({
+            "default": {"model": "cheap-model"},
+            "allow_pass": {"max_tokens": 4, "stop": ["."], "unknown": 1},
+            "greeting": {"timeout": 5},
+        })
+        allow = p.get_profile("allow_pass")
+        assert allow["model"] == "cheap-model"
+        assert allow["max_tokens"] == 4
+        assert allow["temperature"] == 0.0
+        assert allow["stop"] == ["."]
+        assert "unknown" not in allow
+        assert p.get_profile("greeting")["timeout"] == 5
+        assert p.get_profile("room_description")["model"] == "cheap-model"
+
+    def test_bad_file_falls_back_to_builtins(self, profiles):
+        p = profiles("{not json")
+        assert p.get_profile("allow_pass")["max_tokens"] == 8
+
+    def test_request_options(self, profiles):
+        p = profiles()
+        opts = p.request_options(dict(p.DEFAULT_PROFILE, temperature=0, stop=["END"], timeout=3))
+        assert opts == {"model": p.DEFAULT_PROFILE["model"], "max_tokens": 1024, "temperature": 0.0,
+                        "stop_sequences": ["END"], "timeout": 3.0}
+        assert set(p.request_options(p.DEFAULT_PROFILE)) == {"model", "max_tokens"}
+
+
+class TestCallAiUsesProfile:
+    def test_site_profile_reaches_the_client(self, profiles, monkeypatch):
+        import open_ai_api
+        profiles()
+        client = MagicMock()
+        client.messages.create.return_value = MagicMock(content=[MagicMock(text=" No ")], usage=None)
+        monkeypatch.setattr(open_ai_api, "_client", client)
+        assert open_ai_api.call_ai("yes or no?", site="allow_pass") == "No"
+        kwargs = client.messages.create.call_args.kwargs
+        assert kwargs["max_tokens"] == 8
+        assert kwargs["temperature"] == 0.0
+        assert kwargs["timeout"] == 10.0
+
+    def test_stub_honours_limits(self):
+        from stub_llm import StubClient, StubTimeoutError
+        client = StubClient(latency="fixed:50", error_rate=0.0)
+        msg = client.messages.create(model="m", max_tokens=2, messages=[{"role": "user", "content": "Describe"}])
+        assert len(msg.content[0].text) <= 8
+        assert msg.stop_reason == "max_tokens"
+        with pytest.raises(StubTimeoutError):
+            client.messages.create(model="m", max_tokens=100, timeout=0.01,
+                                   messages=[{"role": "user", "content": "Describe"}])
@@ -0,0 +1,182 @@
+"""
+Tests for the rendered room map cache.
+"""
+from types import SimpleNamespace
+from unittest.mock import patch
+
+
+def _holder(rarities=(), identity="Mossy Library"):
+    room = SimpleNamespace(_description="Dusty shelves.", _room_identity=identity,
+                           _items=[{"name": "coin", "rarity": r} for r in rarities])
+    east = SimpleNamespace()
+    return SimpleNamespace(_cur_pos_x=0, _cur_pos_y=0, _cols=2, _rows=1,
+                           _array_of_rooms=[[room, east]])
+
+
+class TestMapCache:
+    def test_key_covers_every_input(self):
+        from map_cache import render_key
+        base = dict(theme="medieval", interior="library", shape="standard", exits=4, items=[], seed="0_0")
+        key = render_key(**base)
+        assert key == render_key(**dict(base))
+        for field, value in [("theme", "cyberpunk"), ("exits", 5), ("items", ["Rare"]), ("seed", "1_0")]:
+            assert render_key(**dict(base, **{field: value})) != key
+
+    def test_lru_and_disk_store(self, tmp_path):
+        from map_cache import DiskStore, MapCache
+        cache = MapCache(DiskStore(str(tmp_path)), max_memory_entries=1)
+        cache.put("aa11", b"one")
+        cache.put("bb22", b"two")
+        assert "aa11" not in cache._memory
+        assert cache.get("aa11") == b"one"
+        # Another worker sharing the store.
+        assert MapCache(DiskStore(str(tmp_path))).get("bb22") == b"two"
+        assert cache.get("cc33") is None
+
+    def test_identical_rooms_render_once(self, tmp_path):
+        import map_generator
+        from map_cache import DiskStore, MapCache
+        cache = MapCache(DiskStore(str(tmp_path)))
+        with patch.object(map_generator, "map_cache", cache), \
+                patch.object(map_generator, "_draw_room_png", wraps=map_generator._draw_room_png) as draw:
+            first = map_generator.generate_room_map(_holder(["Rare"]), "Medieval")
+            again = map_generator.generate_room_map(_holder(["Rare"]), "Medieval")
+            assert draw.call_count == 1
+            assert again == first
+            map_generator.generate_room_map(_holder(["Rare", "Common"]), "Medieval")
+            map_generator.generate_room_map(_holder(["Rare"]), "Cyberpunk")
+            assert draw.call_count == 3
+        assert first.startswith('<img src="/map/')
+
+
+class TestMapRoute:
+    def test_serves_cached_render_with_strong_etag(self, monkeypatch):
+        import application
+        import map_generator
+        from map_cache import MapCache
+        cache = MapCache()
+        monkeypatch.setattr(map_generator, "map_cache", cache)
+        html = map_generator.generate_room_map(_holder(), "Medieval")
+        url = html.split('src="')[1].split('"')[0]
+        key = url[len("/map/"):-len(".png")]
+
+        client = application.application.test_client()
+        resp = client.get(url)
+        assert resp.status_code == 200
+        assert resp.mimetype == "image/png"
+        assert resp.data == cache.get(key)
+        assert resp.headers["ETag"] == f'"{key}"'
+        assert "immutable" in resp.headers["Cache-Control"]
+        assert client.get(url, headers={"If-None-Match": f'"{key}"'}).status_code == 304
+        assert client.get("/map/" + "0" * 64 + ".png").status_code == 404
+        assert client.get("/map/not-a-key.png").status_code == 404
+
+    def test_evicted_render_is_drawn_again(self, tmp_path, monkeypatch):
+        import application
+        import map_generator
+        from map_cache import DiskStore, MapCache
+        monkeypatch.setattr(map_generator, "map_cache", MapCache(DiskStore(str(tmp_path / "png")),
+                                                                 max_memory_entries=1))
+        monkeypatch.setattr(map_generator, "render_inputs", MapCache(DiskStore(str(tmp_path / "inputs"),
+                                                                               suffix=".json")))
+        html = map_generator.generate_room_map(_holder(["Rare"], identity="Dusty Alcove"), "Medieval")
+        url = html.split('src="')[1].split('"')[0]
+        key = url[len("/map/"):-len(".png")]
+        first = map_generator.map_cache.get(key)
+        # Evicted from memory and from disk; a restarted worker starts with empty memory too.
+        map_generator.generate_room_map(_holder(), "Cyberpunk")
+        DiskStore(str(tmp_path / "png"), max_bytes=0)._trim()
+        monkeypatch.setattr(map_generator, "render_inputs", MapCache(DiskStore(str(tmp_path / "inputs"),
+                                                                               suffix=".json")))
+        assert map_generator.map_cache.get(key) is None
+
+        resp = application.application.test_client().get(url)
+        assert resp.status_code == 200
+        assert resp.data == first
+
+    def test_inline_output_keeps_data_uri(self, monkeypatch):
+        import map_generator
+        from map_cache import MapCache
+        monkeypatch.setattr(map_generator, "map_cache", MapCache())
+        monkeypatch.setenv("MAP_OUTPUT", "inline")
+        html = map_generator.generate_room_map(_holder(), "Medieval")
+        assert html.startswith('<img src="data:image/png;base64,')
+
+
+class TestLayeredRender:
+    def test_item_changes_reuse_the_base_layer(self, monkeypatch):
+        import map_generator
+        from map_cache import MapCache
+        monkeypatch.setattr(map_generator, "map_cache", MapCache())
+        monkeypatch.setattr(map_generator, "base_layers", MapCache(name="base_layer"))
+        with patch.object(map_generator, "_draw_base_layer", wraps=map_generator._draw_base_layer) as base:
+            empty = map_generator.generate_room_map(_holder(), "Medieval")
+            dropped = map_generator.generate_room_map(_holder(["Legendary"]), "Medieval")
+        assert base.call_count == 1
+        assert empty != dropped
+
+    def test_concurrent_renders_match_and_leave_random_alone(self, monkeypatch):
+        import random
+        import threading
+        import map_generator
+        from map_cache import MapCache
+        monkeypatch.setattr(map_generator, "base_layers", MapCache(max_memory_entries=1, name="base_layer"))
+        exits = {'north': True, 'south': False, 'east': True, 'west': False}
+        rooms = [("cyberpunk", "server", f"{i}_0") for i in range(4)] + \
+                [("medieval", "treasury", f"{i}_1") for i in range(4)]
+        state = random.getstate()
+        expected = [map_generator._draw_room_png(t, i, "standard", exits, [], seed, "") for t, i, seed in rooms]
+        assert random.getstate() == state
+
+        results = [None] * len(rooms)
+
+        def render(n, theme, interior, seed):
+            for _ in range(3):
+                results[n] = map_generator._draw_room_png(theme, interior, "standard", exits, [], seed, "")
+        threads = [threading.Thread(target=render, args=(n, *room)) for n, room in enumerate(rooms)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert results == expected
+
+    def test_markers_are_drawn_over_the_base(self):
+        from map_generator import _draw_overlay
+        overlay = _draw_overlay((800, 600), ["Legendary"], "0_0")
+        alpha = overlay.getchannel("A")
+        assert alpha.getpixel((400, 300)) == 255  # player marker
+        assert alpha.getpixel((0, 0)) == 0
+        player_only = _draw_overlay((800, 600), [], "0_0").getchannel("A")
+        assert alpha.getbbox() != player_only.getbbox()
+
+
+class TestSceneOutput:
+    def test_scene_mode_emits_json_for_the_canvas(self, monkeypatch):
+        import json
+        import map_generator
+        from map_cache import MapCache
+        monkeypatch.setattr(map_generator, "scenes", MapCache(name="scene"))
+        monkeypatch.setenv("MAP_OUTPUT", "scene")
+        html = map_generator.generate_room_map(_holder(["Epic"]), "Medieval")
+        assert html.startswith('<script type="application/json" data-role="map-scene" data-key="')
+        scene = json.loads(html.split('">', 1)[1].rsplit("</script>", 1)[0])
+        assert (scene["w"], scene["h"]) == (800, 600)
+        assert len(scene["floor"]["shades"]) == 34 * 24
+        # Markers come last: the player, then the item with its rarity colour.
+        player, item = scene["shapes"][-3], scene["shapes"][-2]
+        assert player[:2] == ["e", [388, 288, 412, 312]]
+        assert item[0] == "e" and item[2] == "#c678dd"
+        assert len(html) < 10000
+
+    def test_floor_shades_match_the_raster(self):
+        import json
+        import numpy as np
+        from map_generator import _floor_array, _floor_rng, _room_scene
+        exits = {'north': True, 'south': False, 'east': True, 'west': False}
+        floor = json.loads(_room_scene("medieval", "library", "standard", exits, [], "2_5", ""))["floor"]
+        raster = _floor_array(floor["base"], floor["accent"], 34, 24, 20, _floor_rng("2_5"))
+        base = np.array([int(floor["base"][i:i + 2], 16) for i in (1, 3, 5)])
+        for i, char in enumerate(floor["shades"][:40]):
+            row, col = divmod(i, floor["cols"])
+            expected = np.clip(base + ord(char) - ord("m"), 0, 255)
+            assert (raster[row * 20 + 5, col * 20 + 5] == expected).all()
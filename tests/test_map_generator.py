@@ -1,6 +1,8 @@
 """
 Tests for Map Generator: generate_room_map output and drawing helpers.
 """
+import random
+
 import pytest
 from PIL import Image, ImageDraw
 
@@ -12,7 +14,7 @@ _TEST_USER_ID = "test-user"
 class TestGenerateRoomMap:
     """generate_room_map return value and theme handling."""
 
-    def test_returns_img_tag_with_base64(self):
+    def test_returns_img_tag_with_map_url(self):
         from map_generator import generate_room_map
         from room import room_holder
         rh = room_holder()
@@ -22,8 +24,8 @@ class TestGenerateRoomMap:
         r._items = []
         out = generate_room_map(rh, "Medieval")
         assert out.strip().startswith("<img ")
-        assert "data:image/png;base64," in out
-        assert "src=" in out
+        assert 'src="/map/' in out
+        assert "data:image/png;base64," not in out
 
     def test_theme_medieval_produces_image(self):
         from map_generator import generate_room_map
@@ -33,7 +35,7 @@ class TestGenerateRoomMap:
         rh.get_current_room(_TEST_USER_ID)._description = "Dungeon"
         rh.get_current_room(_TEST_USER_ID)._items = []
         out = generate_room_map(rh, "Medieval")
-        assert "data:image/png;base64," in out
+        assert 'src="/map/' in out
 
     def test_theme_cyberpunk_produces_image(self):
         from map_generator import generate_room_map
@@ -43,7 +45,7 @@ class TestGenerateRoomMap:
         rh.get_current_room(_TEST_USER_ID)._description = "Server room"
         rh.get_current_room(_TEST_USER_ID)._items = []
         out = generate_room_map(rh, "cyberpunk")
-        assert "data:image/png;base64," in out
+        assert 'src="/map/' in out
 
     def test_theme_steampunk_produces_image(self):
         from map_generator import generate_room_map
@@ -53,7 +55,7 @@ class TestGenerateRoomMap:
         rh.get_current_room(_TEST_USER_ID)._description = "Engine room"
         rh.get_current_room(_TEST_USER_ID)._items = []
         out = generate_room_map(rh, "steampunk")
-        assert "data:image/png;base64," in out
+        assert 'src="/map/' in out
 
 
 class TestMapGeneratorDrawHelpers:
@@ -63,7 +65,7 @@ class TestMapGeneratorDrawHelpers:
         from map_generator import draw_stone_wall
         img = Image.new("RGB", (200, 200), color="#000")
         draw = ImageDraw.Draw(img)
-        draw_stone_wall(draw, 10, 10, 100, 100, "#2a2520", "#3a3530")
+        draw_stone_wall(draw, 10, 10, 100, 100, "#2a2520", "#3a3530", random.Random(0))
         assert True
 
     def test_draw_door_north_south(self):
@@ -95,3 +97,42 @@ class TestMapGeneratorDrawHelpers:
         draw = ImageDraw.Draw(img)
         _draw_prop(draw, {}, 60, 800, 600, "#6a5545", "medieval")
         assert True
+
+
+class TestVectorisedFloor:
+    """The NumPy floor matches the per-tile rectangles it replaced."""
+
+    @staticmethod
+    def _reference_floor(shades, floor_base, floor_accent, margin, tile_size, width, height):
+        img = Image.new("RGB", (width, height), color="#2a2520")
+        draw = ImageDraw.Draw(img)
+        for row, y in enumerate(range(margin, height - margin, tile_size)):
+            for col, x in enumerate(range(margin, width - margin, tile_size)):
+                shade = int(shades[row, col, 0])
+                r = min(255, max(0, int(floor_base[1:3], 16) + shade))
+                g = min(255, max(0, int(floor_base[3:5], 16) + shade))
+                b = min(255, max(0, int(floor_base[5:7], 16) + shade))
+                draw.rectangle([x, y, x + tile_size - 1, y + tile_size - 1],
+                               fill=f'#{r:02x}{g:02x}{b:02x}', outline=floor_accent, width=1)
+        return img
+
+    @pytest.mark.parametrize("base,accent", [("#484846", "#3a3a38"), ("#080e18", "#0d1828")])
+    def test_matches_per_tile_drawing(self, base, accent):
+        import numpy as np
+        from map_generator import _draw_floor, _floor_rng
+        img = Image.new("RGB", (800, 600), color="#2a2520")
+        _draw_floor(img, base, accent, 60, 20, _floor_rng("3_4"))
+        shades = _floor_rng("3_4").integers(-12, 13, size=(24, 34, 1))
+        reference = self._reference_floor(shades, base, accent, 60, 20, 800, 600)
+        diff = np.abs(np.asarray(img, dtype=int) - np.asarray(reference, dtype=int))
+        assert diff.max() <= 1
+
+    def test_same_seed_same_floor(self):
+        import numpy as np
+        from map_generator import _floor_array, _floor_rng
+        a = _floor_array("#484846", "#3a3a38", 34, 24, 20, _floor_rng("0_0"))
+        b = _floor_array("#484846", "#3a3a38", 34, 24, 20, _floor_rng("0_0"))
+        c = _floor_array("#484846", "#3a3a38", 34, 24, 20, _floor_rng("0_1"))
+        assert a.shape == (480, 680, 3)
+        assert np.array_equal(a, b)
+        assert not np.array_equal(a, c)
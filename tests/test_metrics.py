@@ -0,0 +1,86 @@
+"""
+Tests for the metrics registry and per-call-site LLM instrumentation.
+"""
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    import open_ai_api
+    from metrics import MetricsRegistry
+    fresh = MetricsRegistry()
+    monkeypatch.setattr(open_ai_api, "metrics_registry", fresh)
+    monkeypatch.setattr(open_ai_api, "_response_cache", None)
+    monkeypatch.delenv("AI_CACHE_ENABLED", raising=False)
+    return fresh
+
+
+def _client(text="Rusk", input_tokens=120, output_tokens=3):
+    client = MagicMock()
+    client.messages.create.return_value = SimpleNamespace(
+        content=[SimpleNamespace(text=text)],
+        usage=SimpleNamespace(input_tokens=input_tokens, output_tokens=output_tokens),
+    )
+    return client
+
+
+class TestHistogram:
+    def test_buckets_and_quantiles(self):
+        from metrics import Histogram
+        h = Histogram((1, 2, 4))
+        for v in (0.5, 1.5, 1.5, 3, 10):
+            h.observe(v)
+        assert h.counts == [1, 3, 4]
+        assert h.count == 5 and h.sum == 16.5
+        assert h.quantile(0.5) == 2
+        assert h.quantile(0.95) == float("inf")
+
+
+class TestCallAiInstrumentation:
+    def test_success_records_latency_and_tokens_per_site(self, registry):
+        from open_ai_api import call_ai
+        with patch("open_ai_api._get_client", return_value=_client()):
+            call_ai("Pick a name", site="npc_name")
+            call_ai("Pick a name", site="npc_name")
+        labels = {"site": "npc_name"}
+        assert registry.get_counter("llm_calls_total", {"site": "npc_name", "outcome": "ok"}) == 2
+        assert registry.get_histogram("llm_latency_seconds", labels).count == 2
+        assert registry.get_counter("llm_input_tokens_total", labels) == 240
+        assert registry.get_counter("llm_output_tokens_total", labels) == 6
+
+    def test_errors_are_counted_and_reraised(self, registry):
+        from open_ai_api import call_ai
+        client = MagicMock()
+        client.messages.create.side_effect = TimeoutError("slow")
+        with patch("open_ai_api._get_client", return_value=client):
+            with pytest.raises(TimeoutError):
+                call_ai("Do you allow the player to pass?", site="allow_pass")
+        assert registry.get_counter("llm_errors_total", {"site": "allow_pass", "error": "TimeoutError"}) == 1
+        assert registry.get_counter("llm_calls_total", {"site": "allow_pass", "outcome": "error"}) == 1
+
+    def test_unlabelled_calls_still_recorded(self, registry):
+        from open_ai_api import call_ai
+        with patch("open_ai_api._get_client", return_value=_client()):
+            call_ai("hello")
+        assert registry.get_counter("llm_calls_total", {"site": "unlabelled", "outcome": "ok"}) == 1
+
+
+class TestMetricsEndpoint:
+    def test_prometheus_and_json_output(self, registry):
+        import application
+        from open_ai_api import call_ai
+        with patch("open_ai_api._get_client", return_value=_client()):
+            call_ai("Narrate", site="combat_narration")
+        with patch("application.metrics_registry", registry):
+            client = application.application.test_client()
+            text = client.get("/metrics").get_data(as_text=True)
+            data = client.get("/metrics?format=json").get_json()
+
+        assert '# TYPE llm_latency_seconds histogram' in text
+        assert 'llm_latency_seconds_count{site="combat_narration"} 1' in text
+        assert 'llm_calls_total{outcome="ok",site="combat_narration"} 1' in text
+        sites = [row["labels"]["site"] for row in data["histograms"]["llm_output_tokens"]]
+        assert sites == ["combat_narration"]
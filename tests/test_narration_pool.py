@@ -0,0 +1,101 @@
+"""
+Tests for the interaction narration variant pool.
+"""
+import itertools
+import threading
+import time
+from unittest.mock import patch
+
+KEY = ("medieval", "library", "bookshelf", "search", "empty")
+
+
+def _counting_ai():
+    counter = itertools.count(1)
+    return lambda prompt, **kwargs: f"variant {next(counter)}"
+
+
+class TestEffectClass:
+    def test_classes(self):
+        from narration_pool import effect_class
+        assert effect_class("") == "none"
+        assert effect_class("+12 HP") == "heal"
+        assert effect_class("-7 HP (tasted awful)") == "harm"
+        assert effect_class("You find a Rusty Key (Common)!") == "loot"
+        assert effect_class("Nothing of value here.") == "empty"
+        assert effect_class("torch added to inventory.") == "taken"
+
+
+class TestNarrationPool:
+    def test_first_request_waits_then_pool_fills_in_background(self):
+        from narration_pool import NarrationPool
+        pool = NarrationPool(target_size=3)
+        with patch("narration_pool.call_ai", side_effect=_counting_ai()) as ai:
+            assert pool.get(KEY, "prompt") == "variant 1"
+            pool.shutdown()
+        assert pool.size(KEY) == 3
+        assert ai.call_args_list[0].kwargs["site"] == "interact_narration"
+        assert ai.call_args_list[-1].kwargs["site"] == "interact_narration_pool"
+
+    def test_full_pool_serves_round_robin_without_llm(self):
+        from narration_pool import NarrationPool
+        pool = NarrationPool(target_size=3)
+        with patch("narration_pool.call_ai", side_effect=_counting_ai()):
+            pool.get(KEY, "prompt")
+            pool.shutdown()
+        with patch("narration_pool.call_ai", side_effect=AssertionError("pool is warm")):
+            served = [pool.get(KEY, "prompt") for _ in range(4)]
+        assert served == ["variant 2", "variant 3", "variant 1", "variant 2"]
+
+    def test_duplicate_variants_are_not_stored(self):
+        from narration_pool import NarrationPool
+        pool = NarrationPool(target_size=3)
+        with patch("narration_pool.call_ai", return_value="same text") as ai:
+            pool.get(KEY, "prompt")
+            pool.shutdown()
+        assert pool.size(KEY) == 1
+        assert ai.call_count == 1 + 3 * 2
+
+    def test_least_recently_used_keys_are_evicted(self):
+        from narration_pool import NarrationPool
+        pool = NarrationPool(target_size=1, max_keys=2)
+        with patch("narration_pool.call_ai", side_effect=_counting_ai()):
+            for name in ("a", "b", "a", "c"):
+                pool.get((name,), "prompt")
+        assert pool.size(("a",)) == 1
+        assert pool.size(("b",)) == 0
+        assert pool.size(("c",)) == 1
+
+    def test_late_first_generation_still_fills_the_pool(self, userId):
+        from deadlines import command_deadline
+        from narration_pool import NarrationPool
+        pool = NarrationPool(target_size=3)
+        release = threading.Event()
+        counting = _counting_ai()
+
+        def ai(prompt, site=None, **kwargs):
+            if site == "interact_narration":
+                release.wait(2)
+            return counting(prompt)
+
+        with patch("narration_pool.call_ai", side_effect=ai):
+            with command_deadline(0.05):
+                shown = pool.get(KEY, "prompt", userId=userId, fallback="You search the shelves.")
+            assert "You search the shelves." in shown
+            release.set()
+            give_up = time.monotonic() + 2
+            while pool.size(KEY) < 3 and time.monotonic() < give_up:
+                time.sleep(0.01)
+            pool.shutdown()
+        assert pool.size(KEY) == 3
+
+    def test_top_ups_ask_for_different_variants(self):
+        from llm_profiles import get_profile
+        from narration_pool import NarrationPool
+        pool = NarrationPool(target_size=3)
+        with patch("narration_pool.call_ai", side_effect=_counting_ai()) as ai:
+            pool.get(KEY, "prompt")
+            pool.shutdown()
+        top_ups = [c.args[0] for c in ai.call_args_list if c.kwargs["site"] == "interact_narration_pool"]
+        assert len(set(top_ups)) == len(top_ups) == 2
+        assert all(p.startswith("prompt\n") for p in top_ups)
+        assert get_profile("interact_narration_pool")["temperature"] == 1.0
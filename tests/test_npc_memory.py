@@ -0,0 +1,122 @@
+"""
+Tests for bounded, summarised NPC conversation memory.
+"""
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+
+@pytest.fixture
+def small_memory(monkeypatch):
+    monkeypatch.setenv("NPC_MEMORY_RECENT_TURNS", "4")
+    monkeypatch.setenv("NPC_MEMORY_TOKEN_BUDGET", "100")
+
+
+def _npc():
+    from humanoid import Humanoid, Npc
+    npc = Npc.__new__(Npc)
+    Humanoid.__init__(npc)
+    npc._id = "npc-id"
+    npc._name = "Rusk"
+    npc._description = "a wary guard"
+    npc._friendlyness = 50
+    npc._toughness = 40
+    npc._past_conversation = []
+    npc._quest_to_offer = None
+    npc.update_npc = MagicMock()
+    return npc
+
+
+class TestRemember:
+    def test_old_turns_fold_into_pending_and_trigger_summary(self, small_memory):
+        import npc_memory
+        npc = _npc()
+        with patch("npc_memory.schedule_summary") as schedule:
+            npc_memory.remember(npc, "a", "b", "c")
+            schedule.assert_not_called()
+            npc_memory.remember(npc, "d", "e", "f")
+        assert npc._past_conversation == ["c", "d", "e", "f"]
+        assert npc._summary_pending == ["a", "b"]
+        schedule.assert_called_once_with(npc)
+
+    def test_folded_pass_grant_is_not_forgotten(self, small_memory):
+        import npc_memory
+        npc = _npc()
+        with patch("npc_memory.schedule_summary"):
+            npc_memory.remember(npc, "Note: The player bribed the NPC with 10 gold and the NPC accepted, "
+                                     "agreeing to let them pass.")
+            npc_memory.remember(npc, "1", "2", "3", "4")
+        with patch("humanoid.call_ai", side_effect=AssertionError("should short-circuit")):
+            assert npc.allow_pass("user") is True
+
+    def test_folded_fight_still_counts(self, small_memory):
+        import npc_memory
+        npc = _npc()
+        npc._friendlyness = 80
+        with patch("npc_memory.schedule_summary"):
+            npc_memory.remember(npc, "Combat note: The player used a heavy attack against Rusk.")
+            npc_memory.remember(npc, *["The player chats about the weather."] * 8)
+        npc._summary_pending = []  # folded into the summary
+        assert npc_memory.pass_record(npc)["fights"] == 1
+
+        restored = _npc()
+        npc_memory.load_memory(restored, npc_memory.memory_fields(npc))
+        assert npc_memory.pass_record(restored)["fights"] == 1
+        # Without the fight a friendliness of 80 would be waved through without asking.
+        restored._interaction_modifiers = lambda userId: {"persuasion": 0, "intimidation": 0}
+        with patch("humanoid.call_ai", return_value="No.") as ai, patch("npc_memory.schedule_summary"):
+            assert restored.allow_pass("user") is False
+        ai.assert_called_once()
+
+    def test_refresh_summary_consumes_pending_and_persists(self, small_memory):
+        import npc_memory
+        npc = _npc()
+        npc._conversation_summary = "Met the player once."
+        npc._summary_pending = ["The player insulted Rusk."]
+        with patch("npc_memory.call_ai", return_value="Met the player; was insulted.") as ai:
+            npc_memory.refresh_summary(npc)
+        assert "Met the player once." in ai.call_args.args[0]
+        assert npc._conversation_summary == "Met the player; was insulted."
+        assert npc._summary_pending == []
+        fields = npc.update_npc.call_args.args[1]
+        assert fields["conversation_summary"] == "Met the player; was insulted."
+
+    def test_failed_refresh_keeps_pending(self, small_memory):
+        import npc_memory
+        npc = _npc()
+        npc._summary_pending = ["x"]
+        with patch("npc_memory.call_ai", side_effect=RuntimeError("down")):
+            npc_memory.refresh_summary(npc)
+        assert npc._summary_pending == ["x"]
+
+
+class TestHistoryForPrompt:
+    def test_respects_budget_newest_first(self, small_memory):
+        import npc_memory
+        npc = _npc()
+        npc._conversation_summary = "S" * 1000
+        npc._past_conversation = ["old " * 60, "newest line"]
+        text = npc_memory.history_for_prompt(npc)
+        assert npc_memory.estimate_tokens(text) <= 110
+        assert text.endswith("newest line")
+
+    def test_load_memory_folds_long_legacy_history(self, small_memory):
+        import npc_memory
+        npc = _npc()
+        with patch("npc_memory.schedule_summary"):
+            npc_memory.load_memory(npc, {"conversations": [str(i) for i in range(10)]})
+        assert npc._past_conversation == ["6", "7", "8", "9"]
+        assert npc._summary_pending == [str(i) for i in range(6)]
+
+
+class TestTalkPromptStaysBounded:
+    def test_prompt_size_flat_over_long_conversation(self, small_memory, userId):
+        npc = _npc()
+        sizes = []
+        with patch("humanoid.call_ai", return_value="Hmph. " * 20) as ai, \
+                patch("npc_memory.schedule_summary"), \
+                patch("xp.award_xp"):
+            for turn in range(30):
+                npc.talk(userId, f"Tell me about the road, part {turn}. " * 5)
+                sizes.append(len(ai.call_args.args[0]))
+        assert max(sizes[10:]) <= max(sizes[:10]) + 50
@@ -0,0 +1,114 @@
+"""
+Tests for the rule-based allow_pass fast path.
+"""
+from unittest.mock import MagicMock, patch
+
+NO_MODS = {"persuasion": 0, "intimidation": 0, "awareness": 0, "agility": 0}
+
+
+def _npc(friendlyness):
+    from humanoid import Humanoid, Npc
+    npc = Npc.__new__(Npc)
+    Humanoid.__init__(npc)
+    npc._id = "npc-id"
+    npc._name = "Rusk"
+    npc._friendlyness = friendlyness
+    npc._toughness = 50
+    npc._past_conversation = []
+    npc._summary_pending = []
+    return npc
+
+
+class TestPassScore:
+    def test_friendliness_and_persuasion_raise_score(self):
+        from npc_rules import empty_record, pass_score
+        assert pass_score(40, 50, NO_MODS, empty_record()) == 40
+        assert pass_score(40, 50, dict(NO_MODS, persuasion=10), empty_record()) == 60
+
+    def test_tough_npc_shrugs_off_intimidation(self):
+        from npc_rules import empty_record, pass_score
+        assert pass_score(40, 10, dict(NO_MODS, intimidation=12), empty_record()) == 51
+        assert pass_score(40, 100, dict(NO_MODS, intimidation=8), empty_record()) == 40
+
+    def test_history_penalties(self):
+        from npc_rules import bribe_bonus, pass_score, record_lines
+        history = [
+            "Combat note: The player used a quick attack against Rusk.",
+            "Note: The player attempted to bribe the NPC with 5 gold but the NPC refused.",
+            "Note: The player tried to go past the npc to exit the room here and was blocked",
+        ]
+        assert pass_score(60, 50, NO_MODS, record_lines(history)) == 60 - 12 - 8 - 3 + bribe_bonus(5, 60, 50)
+        assert pass_score(60, 50, NO_MODS, record_lines(["Combat note"] * 10)) == 24
+
+    def test_record_accumulates(self):
+        from npc_rules import record_lines
+        record = record_lines(["Combat note: The player struck Rusk."])
+        record = record_lines(["Note: The player attempted to bribe the NPC with 5 gold but the NPC refused.",
+                               "Combat note: Rusk struck back."], record)
+        assert record == {"fights": 2, "refused_bribes": 1, "blocked": 0, "largest_bribe": 5}
+
+    def test_generous_bribe_outweighs_a_token_one(self):
+        from npc_rules import decide_pass, empty_record, pass_score, record_lines
+        generous = ["Note: The player attempted to bribe the NPC with 60 gold but the NPC refused."]
+        token = ["Note: The player attempted to bribe the NPC with 5 gold but the NPC refused."]
+        assert record_lines(generous + token)["largest_bribe"] == 60
+        generous_score = pass_score(65, 50, NO_MODS, record_lines(generous))
+        token_score = pass_score(65, 50, NO_MODS, record_lines(token))
+        assert decide_pass(generous_score, band=(35, 75)) is True
+        assert decide_pass(token_score, band=(35, 75)) is None
+        # The same offer means less to a tougher, more hostile NPC.
+        offer = dict(empty_record(), largest_bribe=60)
+        assert pass_score(30, 100, NO_MODS, offer) < pass_score(30, 50, NO_MODS, offer)
+
+    def test_item_bribe_value_counts(self):
+        from npc_rules import record_lines
+        assert record_lines(["Note: The player tried to bribe the NPC with a ruby (worth 40 gold) "
+                             "but the NPC refused and kept it."])["largest_bribe"] == 40
+        assert record_lines(["The guard mentions 500 gold in the vault."])["largest_bribe"] == 0
+
+    def test_band(self, monkeypatch):
+        from npc_rules import decide_pass
+        monkeypatch.setenv("NPC_PASS_DENY_BELOW", "30")
+        monkeypatch.setenv("NPC_PASS_ALLOW_ABOVE", "70")
+        assert decide_pass(10) is False
+        assert decide_pass(50) is None
+        assert decide_pass(90) is True
+
+
+class TestAllowPassFastPath:
+    def _allow(self, npc, mods=NO_MODS, ai_answer=None):
+        ai = MagicMock(return_value=ai_answer) if ai_answer else MagicMock(
+            side_effect=AssertionError("clear-cut case must not call the LLM"))
+        with patch.object(type(npc), "_interaction_modifiers", return_value=mods), \
+                patch("humanoid.call_ai", ai):
+            return npc.allow_pass("user"), ai
+
+    def test_clear_cases_skip_llm(self):
+        assert self._allow(_npc(95))[0] is True
+        assert self._allow(_npc(5))[0] is False
+
+    def test_generous_refused_bribe_skips_llm(self):
+        npc = _npc(65)
+        npc._past_conversation = ["Note: The player attempted to bribe the NPC with 60 gold but the NPC refused."]
+        assert self._allow(npc)[0] is True
+
+    def test_ambiguous_band_asks_llm(self):
+        allowed, ai = self._allow(_npc(55), ai_answer="No")
+        assert allowed is False
+        ai.assert_called_once()
+        assert ai.call_args.kwargs["site"] == "allow_pass"
+
+    def test_repeated_attempt_is_memoised_until_conversation_changes(self):
+        import npc_memory
+        npc = _npc(55)
+        assert self._allow(npc, ai_answer="No")[0] is False
+        allowed, ai = self._allow(npc)  # would raise if the LLM were called again
+        assert allowed is False
+        assert npc._past_conversation.count(
+            "Note: The player tried to go past the npc to exit the room here and was blocked") == 1
+
+        with patch("npc_memory.schedule_summary"):
+            npc_memory.remember(npc, "Please, I mean no harm.", "Very well.")
+        allowed, ai = self._allow(npc, ai_answer="Yes")
+        assert allowed is True
+        ai.assert_called_once()
@@ -0,0 +1,147 @@
+"""
+Tests for background prefetching of the rooms next to the player.
+"""
+import threading
+import time
+from unittest.mock import patch
+
+
+class FakeRoom:
+    def __init__(self, gate=None):
+        self._visited = False
+        self._generated = False
+        self._map_html = None
+        self.gate = gate
+        self.calls = []
+
+    def generate_description(self, userId, mark_visited=True):
+        self.calls.append(mark_visited)
+        if self.gate is not None:
+            self.gate.wait(2)
+        self._generated = True
+
+
+class FakeHolder:
+    def __init__(self, rooms, pos=(1, 1)):
+        self.rooms = rooms
+        self.pos = pos
+
+    def get_current_pos(self):
+        return self.pos
+
+    def get_room(self, userId, x, y):
+        return self.rooms.get((x, y))
+
+
+def _patches():
+    return patch("map_generator.generate_room_map", return_value="<img/>"), \
+        patch("all_global_vars.all_global_vars")
+
+
+class TestRoomPrefetcher:
+    def test_generates_unvisited_neighbours_without_marking_visited(self, userId):
+        from prefetch import RoomPrefetcher
+        north, east, seen = FakeRoom(), FakeRoom(), FakeRoom()
+        seen._visited = True
+        holder = FakeHolder({(1, 2): north, (2, 1): east, (0, 1): seen})
+        prefetcher = RoomPrefetcher(max_workers=2, per_user_limit=4)
+        render, globals_ = _patches()
+        with render, globals_:
+            queued = prefetcher.prefetch_neighbours(userId, holder)
+            prefetcher.shutdown()
+
+        assert sorted(queued) == [(1, 2), (2, 1)]
+        assert north.calls == [False] and east.calls == [False]
+        assert north._map_html == "<img/>"
+        assert not north._visited
+        assert seen.calls == []
+
+    def test_per_user_cap_limits_in_flight_jobs(self, userId):
+        from prefetch import RoomPrefetcher
+        gate = threading.Event()
+        rooms = {(1, 2): FakeRoom(gate), (1, 0): FakeRoom(gate), (2, 1): FakeRoom(gate)}
+        prefetcher = RoomPrefetcher(max_workers=4, per_user_limit=2)
+        render, globals_ = _patches()
+        with render, globals_:
+            queued = prefetcher.prefetch_neighbours(userId, FakeHolder(rooms))
+            assert len(queued) == 2
+            assert prefetcher.in_flight(userId) == 2
+            # Another user has their own allowance.
+            assert len(prefetcher.prefetch_neighbours("other-user", FakeHolder(dict(rooms)))) == 2
+            gate.set()
+        prefetcher.shutdown()
+
+    def test_cancel_user_discards_queued_work(self, userId):
+        from prefetch import RoomPrefetcher
+        gate = threading.Event()
+        first, second = FakeRoom(gate), FakeRoom()
+        # One worker: the second job stays queued behind the first.
+        prefetcher = RoomPrefetcher(max_workers=1, per_user_limit=2)
+        render, globals_ = _patches()
+        with render as mock_render, globals_:
+            prefetcher.prefetch_neighbours(userId, FakeHolder({(1, 2): first, (1, 0): second}))
+            assert prefetcher.cancel_user(userId) == 2
+            gate.set()
+            prefetcher.shutdown()
+        assert second.calls == []
+        # The running job finished its LLM step but skipped the map render.
+        mock_render.assert_not_called()
+        assert prefetcher.in_flight(userId) == 0
+
+
+    def test_cancel_user_can_wait_for_running_work(self, userId):
+        from prefetch import RoomPrefetcher
+        gate = threading.Event()
+        room = FakeRoom(gate)
+        prefetcher = RoomPrefetcher(max_workers=1, per_user_limit=1)
+        render, globals_ = _patches()
+        with render, globals_, patch("open_ai_api.promote_calls") as promote:
+            prefetcher.prefetch_neighbours(userId, FakeHolder({(1, 2): room}))
+            while not room.calls:
+                time.sleep(0.005)
+            threading.Timer(0.1, gate.set).start()
+            assert prefetcher.cancel_user(userId, wait_timeout=2) == 1
+            # The job's store step is done by the time the caller goes on to delete things.
+            assert room._generated
+            promote.assert_called_once()
+            prefetcher.shutdown()
+
+
+class TestRestartGame:
+    def test_prefetches_stop_before_the_character_is_deleted(self, userId):
+        import hello
+        order = []
+        with patch.object(hello.room_prefetcher, "cancel_user",
+                          side_effect=lambda *a, **kw: order.append(("cancel", kw.get("wait_timeout")))), \
+                patch.object(hello.job_queue, "flush", side_effect=lambda *a, **kw: order.append(("flush",))), \
+                patch.object(hello.PlayerCharacter, "delete_character", side_effect=lambda *a: order.append(("delete",))), \
+                patch.object(hello.user_db, "get_user_by_id", return_value={"_player_character_id": "pc"}), \
+                patch.object(hello.user_db, "update_user"), \
+                patch.object(hello, "InitializeStartUp"), \
+                patch.object(hello, "doSectionStarting", return_value="Welcome"):
+            assert hello.restart_game(userId) == "Welcome"
+        assert order[0][0] == "cancel" and order[0][1]
+        assert order[1:] == [("flush",), ("delete",)]
+
+
+class TestEnteringPrefetchedRoom:
+    def test_prefetched_room_is_marked_visited_not_regenerated(self, userId):
+        from room import Room, room_holder
+        holder = room_holder()
+        room = Room(0, 0)
+        room._id = "room-id"
+        room._generated = True
+        room._description = "A prefetched hall."
+        room._map_html = "<img/>"
+        holder._array_of_rooms[0][0] = room
+
+        with patch("room.all_global_vars"), \
+                patch("room.prefetch_enabled", return_value=False), \
+                patch.object(Room, "generate_description") as gen, \
+                patch.object(Room, "update_room") as update:
+            text = holder.get_full_description(userId)
+
+        gen.assert_not_called()
+        update.assert_called_once_with("room-id", {"visited": True})
+        assert room._visited
+        assert "A prefetched hall." in text
@@ -0,0 +1,60 @@
+"""
+Tests for prompt templates and per-site prompt budgets.
+"""
+from prompt_templates import PromptTemplate, Section, estimate_tokens, truncate
+
+
+class TestTruncate:
+    def test_keeps_head_or_tail_on_word_boundaries(self):
+        text = "one two three four five six seven eight nine ten"
+        assert truncate(text, 100) == text
+        head = truncate(text, 20)
+        assert head.startswith("one two") and head.endswith("...") and len(head) <= 20
+        tail = truncate(text, 20, keep="tail")
+        assert tail.startswith("...") and tail.endswith("nine ten") and len(tail) <= 20
+
+
+class TestPromptTemplate:
+    def _template(self):
+        return PromptTemplate(
+            "test_site",
+            system=["Rules with {braces} kept as is.",
+                    Section("Persona: {persona}", cut="persona", priority=1, min_chars=40)],
+            sections=[
+                Section("History: {history} ", cut="history", keep="tail", min_chars=40),
+                Section("Note: {note} ", optional=True),
+                Section("Line: {line}", cut="line", priority=2, min_chars=40),
+            ],
+        )
+
+    def test_renders_system_blocks_and_text(self):
+        prompt = self._template().fit({"persona": "a guard", "history": "hi", "line": "hello"})
+        assert prompt.system == ("Rules with {braces} kept as is.", "Persona: a guard")
+        assert prompt.text == "History: hi Line: hello"
+        assert prompt.truncated == []
+
+    def test_cuts_lowest_priority_first(self):
+        values = {"persona": "stern " * 50, "history": "old event. " * 200 + "latest event.",
+                  "line": "please let me through", "note": "wounded"}
+        prompt = self._template().fit(values, budget=150)
+        assert prompt.tokens <= 150
+        assert prompt.truncated == ["history"]
+        assert "latest event." in prompt.text
+        assert "Note: wounded" in prompt.text
+        assert prompt.text.endswith("Line: please let me through")
+
+        tight = self._template().fit(values, budget=60)
+        assert tight.truncated == ["history", "persona"]
+        assert len(tight.system[1]) < len("Persona: ") + len(values["persona"])
+
+    def test_budget_comes_from_the_site_profile(self):
+        from metrics import metrics_registry
+        template = PromptTemplate("interact_narration", [Section("Room: {room}", cut="room", min_chars=10)])
+        prompt = template.render(room="A very long room description. " * 200)
+        assert prompt.tokens <= 200
+        assert metrics_registry.get_counter("prompt_truncations_total",
+                                            {"site": "interact_narration", "field": "room"}) >= 1
+
+    def test_estimate(self):
+        assert estimate_tokens("x" * 400) == 100
+        assert estimate_tokens("") == 0
@@ -0,0 +1,102 @@
+"""
+Tests for the single-request room bundle and its per-field fallback.
+"""
+import json
+from unittest.mock import MagicMock, patch
+
+
+_GOOD_BUNDLE = {
+    "npc_name": "Brother Aldric",
+    "npc_description": "A stooped monk.",
+    "room_description": "Moss covers the flagstones. Brother Aldric watches you.",
+    "items": [
+        {"name": "rusty dagger", "type": "weapons", "rarity": "Common", "value": 3, "desc": "Pitted."},
+        {"type": "junk"},
+    ],
+}
+
+
+def _bare_npc():
+    from humanoid import Humanoid, Npc
+    npc = Npc.__new__(Npc)
+    Humanoid.__init__(npc)
+    npc._theme = "Medieval"
+    npc._description = None
+    npc._toughness = 40
+    npc._friendlyness = 60
+    npc._past_conversation = []
+    npc._quest_to_offer = None
+    npc.store_npc = MagicMock(return_value="npc-id")
+    return npc
+
+
+class TestGetRoomBundle:
+    def test_valid_bundle_is_parsed_and_items_validated(self):
+        from room_bundle import get_room_bundle
+        raw = "Here you go:\n```" + json.dumps(_GOOD_BUNDLE) + "```"
+        with patch("room_bundle.call_ai", return_value=raw):
+            bundle = get_room_bundle("Medieval", "Aria", "Mossy Hall", 40, 60)
+        assert bundle["npc_name"] == "Brother Aldric"
+        assert len(bundle["items"]) == 1
+        assert bundle["items"][0]["type"] == "weapon"
+
+    def test_prompt_is_budgeted(self):
+        from prompt_templates import estimate_tokens
+        from room_bundle import ROOM_BUNDLE_PROMPT, get_room_bundle
+        with patch("room_bundle.call_ai", return_value="{}") as ai:
+            get_room_bundle("Medieval", "Aria " * 400, "Mossy Hall", 40, 60)
+        prompt = ai.call_args.args[0]
+        assert prompt.startswith(ROOM_BUNDLE_PROMPT)
+        assert "ROOM TYPE=Mossy Hall" in prompt and "FRIENDLINESS=60" in prompt
+        assert estimate_tokens(prompt) <= 500
+
+    def test_unparseable_response_returns_empty_bundle(self):
+        from room_bundle import get_room_bundle
+        with patch("room_bundle.call_ai", return_value="I can't do that"):
+            assert get_room_bundle("Medieval", "Aria", "Mossy Hall", 40, 60) == {}
+
+    def test_invalid_fields_are_dropped(self):
+        from room_bundle import _validate_bundle
+        bundle = _validate_bundle({"npc_name": "  ", "room_description": 7, "items": []})
+        assert bundle == {}
+
+
+class TestGenerateDescriptionWithBundle:
+    def _generate(self, userId, npc, bundle):
+        from room import Room
+        pc = MagicMock()
+        pc.get_theme.return_value = "Medieval"
+        pc.get_name.return_value = "Aria"
+        room = Room(0, 0)
+        room._id = "room-id"
+        room._room_identity = "Mossy Hall"
+        with patch("room.all_global_vars") as mock_g, \
+                patch("humanoid.call_ai", return_value="Generated") as npc_ai, \
+                patch("room.call_ai", return_value="Generated room") as room_ai, \
+                patch("room.get_ai_items", return_value=[{"name": "rope"}]) as items_ai, \
+                patch.object(Room, "update_room"):
+            mock_g.get_player_character.return_value = pc
+            room.generate_description(userId, npc=npc, bundle=bundle)
+        return room, npc_ai, room_ai, items_ai
+
+    def test_full_bundle_needs_no_further_calls(self, userId):
+        from room_bundle import _validate_bundle
+        npc = _bare_npc()
+        room, npc_ai, room_ai, items_ai = self._generate(userId, npc, _validate_bundle(_GOOD_BUNDLE))
+        assert npc.get_name() == "Brother Aldric"
+        assert npc.get_description() == "A stooped monk."
+        assert "Brother Aldric" in room._description
+        assert room._items[0]["name"] == "rusty dagger"
+        npc_ai.assert_not_called()
+        room_ai.assert_not_called()
+        items_ai.assert_not_called()
+
+    def test_partial_bundle_falls_back_per_field(self, userId):
+        npc = _bare_npc()
+        room, npc_ai, room_ai, items_ai = self._generate(userId, npc, {"npc_name": "Brother Aldric"})
+        assert npc.get_name() == "Brother Aldric"
+        assert npc.get_description() == "Generated"
+        assert room._description.strip() == "Generated room"
+        assert npc_ai.call_count == 1
+        room_ai.assert_called_once()
+        items_ai.assert_called_once()
@@ -0,0 +1,91 @@
+"""
+Tests for streaming narration: call_ai relaying text to a sink and the /stream SSE endpoint.
+"""
+import json
+from contextlib import contextmanager
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+
+def _streaming_client(chunks):
+    @contextmanager
+    def stream(**_kwargs):
+        yield SimpleNamespace(text_stream=iter(chunks))
+
+    client = MagicMock()
+    client.messages.stream.side_effect = stream
+    return client
+
+
+class TestCallAiStreaming:
+    def test_stream_call_relays_chunks_to_sink(self):
+        import open_ai_api
+        received = []
+        client = _streaming_client(["The guard ", "grunts", ". "])
+        with patch("open_ai_api._get_client", return_value=client):
+            with open_ai_api.stream_to(received.append):
+                text = open_ai_api.call_ai("narrate", stream=True)
+        assert received == ["The guard ", "grunts", ". "]
+        assert text == "The guard grunts."
+        client.messages.create.assert_not_called()
+
+    def test_without_sink_stream_flag_uses_plain_request(self):
+        import open_ai_api
+        client = MagicMock()
+        client.messages.create.return_value = SimpleNamespace(content=[SimpleNamespace(text=" hi ")])
+        with patch("open_ai_api._get_client", return_value=client):
+            assert open_ai_api.call_ai("narrate", stream=True) == "hi"
+        client.messages.stream.assert_not_called()
+
+    def test_unmarked_calls_do_not_stream_inside_sink(self):
+        import open_ai_api
+        received = []
+        client = MagicMock()
+        client.messages.create.return_value = SimpleNamespace(content=[SimpleNamespace(text="yes")])
+        with patch("open_ai_api._get_client", return_value=client):
+            with open_ai_api.stream_to(received.append):
+                assert open_ai_api.call_ai("allow pass?") == "yes"
+        assert received == []
+
+
+def _parse_sse(body):
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+class TestStreamEndpoint:
+    def test_tokens_then_structured_result(self, userId):
+        import application
+        from open_ai_api import call_ai
+
+        def fake_get_output(userId, userInput):
+            return "Rusk says " + call_ai("talk", stream=True)
+
+        client = _streaming_client(["Halt", "!"])
+        application.application.config["TESTING"] = True
+        with patch("open_ai_api._get_client", return_value=client), \
+                patch("application.getOutput", side_effect=fake_get_output), \
+                patch("application.all_global_vars") as mock_g, \
+                patch("application._build_command_result",
+                      side_effect=lambda uid, text: {"response": text, "stats": {"hp": 90}}):
+            mock_g.has_userId.return_value = True
+            test_client = application.application.test_client()
+            with test_client.session_transaction() as sess:
+                sess["userId"] = userId
+            resp = test_client.post("/stream", json={"command": "say hello"})
+            body = resp.get_data(as_text=True)
+
+        assert resp.mimetype == "text/event-stream"
+        assert _parse_sse(body) == [
+            ("token", {"text": "Halt"}),
+            ("token", {"text": "!"}),
+            ("result", {"response": "Rusk says Halt!", "stats": {"hp": 90}}),
+        ]
+
+    def test_requires_login(self):
+        import application
+        resp = application.application.test_client().post("/stream", json={"command": "look"})
+        assert resp.status_code == 401
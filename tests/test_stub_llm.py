@@ -0,0 +1,140 @@
+"""
+Tests for the local stand-in LLM backend.
+"""
+import random
+import time
+
+import pytest
+
+
+@pytest.fixture
+def stub_client(monkeypatch):
+    import open_ai_api
+    from stub_llm import StubClient
+    client = StubClient(latency="", error_rate=0.0, seed=1)
+    monkeypatch.setattr(open_ai_api, "_client", client)
+    monkeypatch.setattr(open_ai_api, "_response_cache", None)
+    monkeypatch.delenv("AI_CACHE_ENABLED", raising=False)
+    return client
+
+
+class TestStubResponses:
+    def test_item_prompt_yields_valid_items(self, stub_client):
+        from item import get_ai_items
+        items = get_ai_items("medieval", "A damp cellar.", "Root Cellar", 1)
+        assert 1 <= len(items) <= 3
+        assert all(it["name"] and it["rarity"] for it in items)
+
+    def test_layout_prompt_respects_exits(self, stub_client):
+        from ai_layout import get_map_layout
+        layout = get_map_layout("A hall", "Medieval", {"north": True, "east": False})
+        walls = {w["edge"]: w["open"] for w in layout["walls"]}
+        assert walls == {"north": True, "south": False, "east": False, "west": False}
+        assert 5 <= len(layout["props"]) <= 10
+
+    def test_bundle_prompt_yields_complete_bundle(self, stub_client):
+        from room_bundle import get_room_bundle
+        bundle = get_room_bundle("Cyberpunk", "Aria", "Data Vault", 40, 60)
+        assert set(bundle) == {"npc_name", "npc_description", "room_description", "items"}
+        assert bundle["npc_name"] in bundle["room_description"]
+
+    def test_yes_no_and_name_prompts(self, stub_client):
+        from open_ai_api import call_ai
+        assert call_ai("Do you allow the player to pass? Answer with one word, yes or no") in ("Yes", "No")
+        name = call_ai("Pick a name for A NPC with the theme Steampunk")
+        assert name and "\n" not in name
+
+    def test_same_prompt_same_answer(self, stub_client):
+        from open_ai_api import call_ai
+        assert call_ai("Describe the NPC with the name Rusk") == call_ai("Describe the NPC with the name Rusk")
+
+    def test_usage_is_reported(self, stub_client):
+        msg = stub_client.messages.create(model="m", max_tokens=10,
+                                          messages=[{"role": "user", "content": "x" * 400}])
+        assert msg.usage.input_tokens == 100
+        assert msg.usage.output_tokens > 0
+
+    def test_streaming_reassembles_to_full_text(self, stub_client):
+        from open_ai_api import call_ai, stream_to
+        chunks = []
+        with stream_to(chunks.append):
+            text = call_ai("Narrate the fight", stream=True)
+        assert "".join(chunks).strip() == text
+
+
+class TestLatencyAndErrors:
+    def test_latency_distributions(self):
+        from stub_llm import parse_latency
+        rng = random.Random(0)
+        assert parse_latency("fixed:250")(rng) == 0.25
+        normal = [parse_latency("normal:100,10")(rng) for _ in range(200)]
+        assert 0.09 < sum(normal) / len(normal) < 0.11
+        tail = sorted(parse_latency("longtail:100,1.0")(rng) for _ in range(500))
+        assert tail[250] < 0.2 and tail[-1] > 0.4
+        assert parse_latency("")(rng) == 0.0
+        assert parse_latency("normal:abc")(rng) == 0.0
+
+    def test_latency_is_applied(self):
+        from stub_llm import StubClient
+        client = StubClient(latency="fixed:50", error_rate=0.0)
+        start = time.monotonic()
+        client.messages.create(model="m", max_tokens=10, messages=[{"role": "user", "content": "hi"}])
+        assert time.monotonic() - start >= 0.05
+
+    def test_error_injection(self):
+        from stub_llm import StubBackendError, StubClient
+        client = StubClient(latency="", error_rate=1.0)
+        with pytest.raises(StubBackendError):
+            client.messages.create(model="m", max_tokens=10, messages=[{"role": "user", "content": "hi"}])
+
+    def test_backend_selected_by_env(self, monkeypatch):
+        import open_ai_api
+        from stub_llm import StubClient
+        monkeypatch.setattr(open_ai_api, "_client", None)
+        monkeypatch.setenv("LLM_BACKEND", "stub")
+        monkeypatch.delenv("ANTHROPIC_API_KEY", raising=False)
+        assert isinstance(open_ai_api._get_client(), StubClient)
+
+
+class TestPromptCaching:
+    def test_system_prefix_gets_one_breakpoint(self, monkeypatch):
+        from open_ai_api import system_blocks
+        monkeypatch.delenv("PROMPT_CACHE_ENABLED", raising=False)
+        blocks = system_blocks(("instructions", "persona"))
+        assert [b["text"] for b in blocks] == ["instructions", "persona"]
+        assert "cache_control" not in blocks[0]
+        assert blocks[1]["cache_control"] == {"type": "ephemeral"}
+        monkeypatch.setenv("PROMPT_CACHE_ENABLED", "0")
+        assert "cache_control" not in system_blocks("instructions")[0]
+        assert system_blocks(None) is None
+
+    def test_repeated_prefix_is_read_from_cache(self, stub_client, monkeypatch):
+        from metrics import metrics_registry
+        from open_ai_api import call_ai
+        monkeypatch.delenv("PROMPT_CACHE_ENABLED", raising=False)
+        monkeypatch.setattr(stub_client, "_cache_min_tokens", 10)
+        system = ("Stay in character. " * 10, "The NPC is Rusk.")
+        before = metrics_registry.get_counter("llm_cache_read_tokens_total", {"site": "npc_talk"})
+        call_ai("Hello?", site="npc_talk", system=system)
+        call_ai("And again?", site="npc_talk", system=system)
+        after = metrics_registry.get_counter("llm_cache_read_tokens_total", {"site": "npc_talk"})
+        assert after - before == len("\n".join(system)) // 4
+
+    def test_short_prefix_is_eligible_but_not_cached(self, stub_client):
+        from open_ai_api import system_blocks
+        msg = stub_client.messages.create(model="m", max_tokens=10, system=system_blocks("x" * 400),
+                                          messages=[{"role": "user", "content": "hi"}])
+        assert msg.usage.cache_eligible_input_tokens == 100
+        assert msg.usage.cache_creation_input_tokens == 0
+
+    def test_malformed_system_is_rejected(self, stub_client):
+        from stub_llm import StubRequestError
+        bad = [
+            [{"type": "text", "text": "a", "cache_control": {"type": "persistent"}}],
+            [{"type": "text", "text": str(i), "cache_control": {"type": "ephemeral"}} for i in range(5)],
+            [{"type": "image", "text": "a"}],
+        ]
+        for system in bad:
+            with pytest.raises(StubRequestError):
+                stub_client.messages.create(model="m", max_tokens=10, system=system,
+                                            messages=[{"role": "user", "content": "hi"}])
@@ -0,0 +1,173 @@
+"""
+Tests for the task graph used to overlap room-generation LLM calls.
+"""
+import threading
+import time
+
+import pytest
+from unittest.mock import MagicMock, patch
+
+
+class TestTaskGraph:
+    def test_dependencies_receive_results(self):
+        from task_graph import TaskGraph
+        g = TaskGraph()
+        g.add("name", lambda _r: "Rusk")
+        g.add("desc", lambda r: r["name"] + " the guard", deps=["name"])
+        results = g.run()
+        assert results == {"name": "Rusk", "desc": "Rusk the guard"}
+
+    def test_independent_tasks_overlap(self):
+        from task_graph import TaskGraph
+        barrier = threading.Barrier(2, timeout=2)
+        g = TaskGraph()
+        # Both tasks must be running at the same time for the barrier to release.
+        g.add("a", lambda _r: barrier.wait() is not None)
+        g.add("b", lambda _r: barrier.wait() is not None)
+        assert g.run(max_workers=2) == {"a": True, "b": True}
+
+    def test_unknown_dependency_raises(self):
+        from task_graph import TaskGraph
+        g = TaskGraph()
+        g.add("items", lambda r: r["room"], deps=["room"])
+        with pytest.raises(ValueError):
+            g.run()
+
+    def test_task_error_propagates(self):
+        from task_graph import TaskGraph
+
+        def boom(_r):
+            raise RuntimeError("provider down")
+
+        g = TaskGraph()
+        g.add("room", boom)
+        with pytest.raises(RuntimeError, match="provider down"):
+            g.run()
+
+
+class TestRoomGenerationGraph:
+    def test_first_visit_overlaps_npc_and_room_calls(self, userId):
+        from humanoid import Humanoid, Npc
+        from room import Room
+
+        npc = Npc.__new__(Npc)
+        Humanoid.__init__(npc)
+        npc._theme = "Medieval"
+        npc._description = None
+        npc._toughness = 40
+        npc._friendlyness = 60
+        npc._past_conversation = []
+        npc._quest_to_offer = None
+        npc.store_npc = MagicMock(return_value="npc-id")
+
+        pc = MagicMock()
+        pc.get_theme.return_value = "Medieval"
+        pc.get_name.return_value = "Aria"
+
+        def fake_ai(prompt, **_kw):
+            time.sleep(0.2)
+            if prompt.startswith("Pick a name"):
+                return "Rusk"
+            if prompt.startswith("Describe the NPC"):
+                return "A wary guard."
+            return "A mossy hall."
+
+        room = Room(0, 0)
+        room._id = "room-id"
+        room._room_identity = "Mossy Hall"
+        with patch("room.all_global_vars") as mock_g, \
+                patch("humanoid.call_ai", side_effect=fake_ai), \
+                patch("room.call_ai", side_effect=fake_ai), \
+                patch("room.get_ai_items", side_effect=lambda *a: (time.sleep(0.2), [])[1]), \
+                patch.object(Room, "update_room"):
+            mock_g.get_player_character.return_value = pc
+            start = time.monotonic()
+            room.generate_description(userId, npc=npc)
+            elapsed = time.monotonic() - start
+
+        assert npc.get_name() == "Rusk"
+        assert npc.get_description() == "A wary guard."
+        assert room._description.strip() == "A mossy hall."
+        # name -> (npc description | room description) -> items: three round-trips, not four.
+        assert elapsed < 0.75
+
+    def test_fallback_items_use_the_rooms_own_generator(self, userId):
+        import random
+        from humanoid import Humanoid, Npc
+        from item import default_items
+        from room import Room
+
+        def generate(seed):
+            npc = Npc.__new__(Npc)
+            Humanoid.__init__(npc)
+            npc._name = "Rusk"
+            npc._description = "A wary guard."
+            npc.store_npc = MagicMock(return_value="npc-id")
+            room = Room(0, 0)
+            room._id = "room-id"
+            room._seed = seed
+            with patch("room.all_global_vars") as mock_g, \
+                    patch("room.call_ai", return_value="A mossy hall."), \
+                    patch("item.call_ai", side_effect=RuntimeError("provider down")), \
+                    patch.object(Room, "update_room"):
+                mock_g.get_player_character.return_value.get_theme.return_value = "Medieval"
+                room.generate_description(userId, npc=npc)
+            return room._items
+
+        state = random.getstate()
+        items = generate(1234)
+        # Generating a room leaves the shared random module where it was.
+        assert random.getstate() == state
+        assert items == generate(1234) == default_items("medieval", 1234)
+
+    def test_slow_provider_falls_back_on_every_step(self, userId):
+        import fallback_content
+        from deadlines import command_deadline
+        from humanoid import Humanoid, Npc
+        from item import default_items
+        from room import Room
+
+        npc = Npc.__new__(Npc)
+        Humanoid.__init__(npc)
+        npc._theme = "Medieval"
+        npc._description = None
+        npc._toughness = 40
+        npc._friendlyness = 60
+        npc._past_conversation = []
+        npc._quest_to_offer = None
+        npc.store_npc = MagicMock(return_value="npc-id")
+        release = threading.Event()
+
+        def slow_ai(prompt, **_kw):
+            release.wait(2)
+            return "[]"
+
+        room = Room(0, 0)
+        room._id = "room-id"
+        room._seed = 99
+        with patch("room.all_global_vars") as mock_g, \
+                patch("humanoid.call_ai", side_effect=slow_ai), \
+                patch("room.call_ai", side_effect=slow_ai), \
+                patch("item.call_ai", side_effect=slow_ai) as items_ai, \
+                patch.object(Room, "_fill_description") as fill, \
+                patch.object(Room, "update_room"):
+            mock_g.get_player_character.return_value.get_theme.return_value = "Medieval"
+            start = time.monotonic()
+            with command_deadline(0.1):
+                room.generate_description(userId, npc=npc)
+            elapsed = time.monotonic() - start
+            release.set()
+            # The room description is still filled in when it arrives.
+            give_up = time.monotonic() + 2
+            while not fill.called and time.monotonic() < give_up:
+                time.sleep(0.01)
+            fill.assert_called_once()
+
+        # Name, then NPC description and room description: two budgets, never the provider's pace.
+        assert elapsed < 0.5
+        stock_names = [name for name, _desc in fallback_content.STOCK_PERSONAS["medieval"]]
+        assert npc.get_name() in stock_names
+        assert npc.get_description() == fallback_content.persona_description("Medieval", npc.get_name())
+        assert room._items == default_items("medieval", 99)
+        # The items call would only start after the deadline, so it is never made.
+        items_ai.assert_not_called()
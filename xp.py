@@ -1,12 +1,20 @@
 from all_global_vars import all_global_vars
+from job_queue import job_queue
 from user_db import get_user_by_id
 
 
+def save_character(userId, player_char):
+    """Write the player character's current state to its document."""
+    user_doc = get_user_by_id(userId)
+    character_id = user_doc.get("_player_character_id") if user_doc else None
+    if character_id:
+        player_char.update_player_character(character_id)
+
+
 def award_xp(userId, xp_amount):
     xp_amount = int(xp_amount)
     
     player_char = all_global_vars.get_player_character(userId)
-    user_doc = get_user_by_id(userId)
-    character_id = user_doc.get("_player_character_id")
     player_char.earned_exp(xp_amount)
-    player_char.update_player_character(character_id)
\ No newline at end of file
+    # Saves share a key, so only the latest queued one runs.
+    job_queue.enqueue(userId, save_character, userId, player_char, key="character")
\ No newline at end of file